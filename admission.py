@@ -0,0 +1,333 @@
+"""
+Admission control for agent turns.
+
+With ADMISSION_MAX_CONCURRENT set, at most that many turns run the agent at
+once in this process; the rest wait in a queue, first come first served
+within three priorities:
+
+1. conversations under way (they have history, so the visitor may be
+   halfway through booking);
+2. new conversations;
+3. turns of a client (IP) that already has a turn running or queued, so
+   one client opening many conversations at once waits behind everyone else.
+
+The cap keeps a burst of chats from turning into a burst of Gemini calls
+that exhausts the quota and fails everyone.
+
+The queue holds at most ADMISSION_MAX_QUEUE turns. When it is full, a new
+turn displaces the newest waiter of lower priority, if there is one, and is
+turned away otherwise; a turn also gives up after
+ADMISSION_QUEUE_TIMEOUT_SECONDS. Turns turned away raise Overloaded with a
+Retry-After estimate (queue length times the average turn time, divided by
+the slots), which the chat endpoints answer with 503.
+
+Only the agent part of a turn is admitted: fast-path bookings and cached
+replies never queue. The time each turn waited is exported as
+chat_admission_wait_seconds, by priority and outcome; if its high
+percentiles grow, add workers or raise the cap (within the Gemini quota).
+
+One queue serves both worker threads (Flask) and the event loop (asgi.py):
+async waiters are woken with call_soon_threadsafe.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+import metrics
+from config import ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_SECONDS
+
+# Priorities (lower goes first)
+PRIORITY_ONGOING = 0
+PRIORITY_NEW = 1
+PRIORITY_CONCURRENT = 2
+_PRIORITY_NAMES = {
+    PRIORITY_ONGOING: "ongoing",
+    PRIORITY_NEW: "new",
+    PRIORITY_CONCURRENT: "concurrent",
+}
+
+# Average turn time assumed before any turn finished, and the weight of each
+# finished turn in the running average (used for Retry-After)
+_INITIAL_TURN_SECONDS = 5.0
+_TURN_SECONDS_WEIGHT = 0.1
+_MAX_RETRY_AFTER = 120
+
+
+def _name(priority: int) -> str:
+    return _PRIORITY_NAMES.get(priority, str(priority))
+
+
+class Overloaded(Exception):
+    """
+    The turn was not admitted. `reason` is "queue_full", "shed" (displaced
+    by a higher priority turn) or "timeout"; `retry_after` is in whole seconds.
+    """
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Chat is overloaded ({reason}); retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "client", "granted", "shed", "event", "loop", "future")
+
+    def __init__(
+        self,
+        priority: int,
+        seq: int,
+        client: Optional[str],
+        loop: Optional[asyncio.AbstractEventLoop],
+    ):
+        self.priority = priority
+        self.seq = seq
+        self.client = client
+        self.granted = False
+        self.shed = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self) -> bool:
+        """Wake the waiting thread or task; False if its event loop is gone."""
+        if self.loop is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(self._resolve)
+            return True
+        except RuntimeError:
+            return False
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionQueue:
+    """
+    At most `max_concurrent` holders at once; up to `max_queue` more wait
+    (by priority, then arrival) for at most `timeout` seconds.
+
+    Counters: admitted, queued (admitted after waiting), rejected (queue
+    full), shed, timeouts.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting: List[_Waiter] = []
+        # Client -> its turns running or queued
+        self._clients: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._turn_seconds = _INITIAL_TURN_SECONDS
+        self._counters = {"admitted": 0, "queued": 0, "rejected": 0, "shed": 0, "timeouts": 0}
+
+    # ------------- Entering and leaving -------------
+
+    @contextlib.contextmanager
+    def admit(self, priority: int = PRIORITY_NEW, client: Optional[str] = None) -> Iterator[float]:
+        """
+        Hold a slot for the block (blocking this thread while queued); yields
+        the seconds queued. `client` identifies the visitor (e.g. their IP).
+        """
+        started = time.perf_counter()
+        waiter = self._enter(priority, client, None)
+        if waiter is not None:
+            waiter.event.wait(self.timeout)
+            self._settle(waiter, started)
+            priority = waiter.priority
+        entered = self._admitted(priority, started)
+        try:
+            yield entered - started
+        finally:
+            self._leave(time.perf_counter() - entered, client)
+
+    @contextlib.asynccontextmanager
+    async def aadmit(
+        self, priority: int = PRIORITY_NEW, client: Optional[str] = None
+    ) -> AsyncIterator[float]:
+        """Async variant of admit: waits on the event loop."""
+        started = time.perf_counter()
+        waiter = self._enter(priority, client, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(waiter.future, self.timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # The request was abandoned; pass on the slot if it just came through
+                self._withdraw(waiter)
+                raise
+            self._settle(waiter, started)
+            priority = waiter.priority
+        entered = self._admitted(priority, started)
+        try:
+            yield entered - started
+        finally:
+            self._leave(time.perf_counter() - entered, client)
+
+    def _enter(
+        self, priority: int, client: Optional[str], loop: Optional[asyncio.AbstractEventLoop]
+    ) -> Optional[_Waiter]:
+        """None if a slot was free; else the queued waiter. Raises Overloaded if full."""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiting:
+                self._active += 1
+                self._counters["admitted"] += 1
+                self._track(client, 1)
+                return None
+            if client and self._clients.get(client):
+                priority = PRIORITY_CONCURRENT
+            waiter = _Waiter(priority, next(self._seq), client, loop)
+            if len(self._waiting) >= self.max_queue:
+                # The newest of the lowest priority; displaced only by a higher priority
+                victim = max(self._waiting, default=None)
+                if victim is None or victim.priority <= priority:
+                    self._counters["rejected"] += 1
+                    retry_after = self._retry_after()
+                    waiter = None
+                else:
+                    self._remove(victim)
+                    victim.shed = True
+                    victim.wake()
+            if waiter is not None:
+                heapq.heappush(self._waiting, waiter)
+                self._track(client, 1)
+                return waiter
+        metrics.record_admission(0.0, _name(priority), "queue_full")
+        raise Overloaded("queue_full", retry_after)
+
+    @staticmethod
+    def _admitted(priority: int, started: float) -> float:
+        entered = time.perf_counter()
+        metrics.record_admission(entered - started, _name(priority), "admitted")
+        return entered
+
+    def _settle(self, waiter: _Waiter, started: float) -> None:
+        """After waking or timing out: return if the slot was granted, else raise Overloaded."""
+        with self._lock:
+            if waiter.granted:
+                self._counters["admitted"] += 1
+                self._counters["queued"] += 1
+                return
+            if waiter.shed:
+                reason = "shed"
+                self._counters["shed"] += 1
+            else:
+                reason = "timeout"
+                self._counters["timeouts"] += 1
+                self._remove(waiter)
+            self._track(waiter.client, -1)
+            retry_after = self._retry_after()
+        metrics.record_admission(time.perf_counter() - started, _name(waiter.priority), reason)
+        raise Overloaded(reason, retry_after)
+
+    def _withdraw(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if not waiter.granted:
+                self._remove(waiter)
+                self._track(waiter.client, -1)
+                return
+        self._leave(None, waiter.client)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        # Lock held
+        if waiter in self._waiting:
+            self._waiting.remove(waiter)
+            heapq.heapify(self._waiting)
+
+    def _track(self, client: Optional[str], delta: int) -> None:
+        # Lock held
+        if not client:
+            return
+        count = self._clients.get(client, 0) + delta
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+    def _leave(self, held_seconds: Optional[float], client: Optional[str]) -> None:
+        """Free a slot: hand it to the first waiter, if any."""
+        with self._lock:
+            self._track(client, -1)
+            if held_seconds is not None:
+                self._turn_seconds += _TURN_SECONDS_WEIGHT * (held_seconds - self._turn_seconds)
+            while self._waiting:
+                waiter = heapq.heappop(self._waiting)
+                waiter.granted = True
+                if waiter.wake():
+                    # The slot passes on; the holder count stays the same
+                    return
+            self._active -= 1
+
+    def _retry_after(self) -> int:
+        # Lock held. Time for the queue ahead to drain through the slots.
+        seconds = self._turn_seconds * (len(self._waiting) + 1) / self.max_concurrent
+        return max(1, min(_MAX_RETRY_AFTER, math.ceil(seconds)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self._counters,
+                active=self._active,
+                waiting=len(self._waiting),
+                turn_seconds=round(self._turn_seconds, 3),
+            )
+
+
+_queue: Optional[AdmissionQueue] = None
+_queue_lock = threading.Lock()
+_NOOP = contextlib.nullcontext(0.0)
+
+
+def get_queue() -> Optional[AdmissionQueue]:
+    """Process-wide queue; None when ADMISSION_MAX_CONCURRENT is 0 (no limit)."""
+    global _queue
+    if _queue is None and ADMISSION_MAX_CONCURRENT > 0:
+        with _queue_lock:
+            if _queue is None:
+                _queue = AdmissionQueue()
+    return _queue
+
+
+def admit(priority: int = PRIORITY_NEW, client: Optional[str] = None) -> ContextManager[float]:
+    """Hold an agent slot for the block (no-op without a limit); yields the seconds queued."""
+    queue = get_queue()
+    return _NOOP if queue is None else queue.admit(priority, client)
+
+
+def aadmit(
+    priority: int = PRIORITY_NEW, client: Optional[str] = None
+) -> AsyncContextManager[float]:
+    """Async variant of admit."""
+    queue = get_queue()
+    return _NOOP if queue is None else queue.aadmit(priority, client)
@@ -0,0 +1,136 @@
+"""
+Agent middleware: Gemini retries behind a circuit breaker, and metrics
+spans for model and tool calls.
+
+Kept apart from resilience.py and metrics.py so that importing those (as
+the web app does at startup) doesn't import LangChain; this module is only
+loaded with the agent (chatbot.build_agent).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from langchain.agents.middleware import AgentMiddleware
+
+from config import UPSTREAM_MAX_RETRIES
+from metrics import TOOL_CALLS, span
+from resilience import (
+    CircuitBreaker,
+    DeadlineExceeded,
+    UpstreamUnavailable,
+    backoff_delay,
+    count,
+    get_breaker,
+    is_transient,
+)
+
+
+# ------------- Gemini resilience -------------
+
+
+class ResilienceMiddleware(AgentMiddleware):
+    """
+    Retry transient Gemini failures with backoff behind the "gemini" circuit
+    breaker. The per-attempt deadline is the model client's own request
+    timeout (LLM_CALL_DEADLINE_SECONDS); async calls are also bounded here.
+    """
+
+    def __init__(self, deadline: float, retries: int = UPSTREAM_MAX_RETRIES):
+        super().__init__()
+        self.deadline = deadline
+        self.retries = retries
+
+    def wrap_model_call(self, request, handler):
+        breaker = get_breaker("gemini")
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                response = handler(request)
+            except Exception as e:
+                if not self._should_retry(breaker, e, attempt):
+                    raise self._final_error(e)
+                attempt += 1
+                time.sleep(backoff_delay(attempt - 1))
+                continue
+            breaker.record_success()
+            return response
+
+    async def awrap_model_call(self, request, handler: Callable[[Any], Awaitable[Any]]):
+        breaker = get_breaker("gemini")
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                response = await asyncio.wait_for(handler(request), self.deadline)
+            except asyncio.TimeoutError as e:
+                error: Exception = DeadlineExceeded("gemini", f"no response within {self.deadline:.0f}s")
+                error.__cause__ = e
+            except Exception as e:
+                error = e
+            else:
+                breaker.record_success()
+                return response
+            if not self._should_retry(breaker, error, attempt):
+                raise self._final_error(error)
+            attempt += 1
+            await asyncio.sleep(backoff_delay(attempt - 1))
+
+    @staticmethod
+    def _final_error(error: Exception) -> Exception:
+        if isinstance(error, UpstreamUnavailable) or not is_transient(error):
+            return error
+        wrapped = UpstreamUnavailable("gemini", f"model call failed: {error}")
+        wrapped.__cause__ = error
+        return wrapped
+
+    def _should_retry(self, breaker: CircuitBreaker, error: Exception, attempt: int) -> bool:
+        if not is_transient(error):
+            breaker.record_success()
+            return False
+        breaker.record_failure()
+        if attempt >= self.retries:
+            count("gemini.failures")
+            return False
+        count("gemini.retries")
+        return True
+
+
+# ------------- Metrics -------------
+
+
+class MetricsMiddleware(AgentMiddleware):
+    """Spans for every model call ("llm_call") and tool call ("tool.<name>")."""
+
+    def wrap_model_call(self, request, handler):
+        with span("llm_call"):
+            return handler(request)
+
+    async def awrap_model_call(self, request, handler):
+        with span("llm_call"):
+            return await handler(request)
+
+    def wrap_tool_call(self, request, handler):
+        name = request.tool_call["name"]
+        with span(f"tool.{name}"):
+            try:
+                result = handler(request)
+            except Exception:
+                TOOL_CALLS.inc(name, "error")
+                raise
+        TOOL_CALLS.inc(name, "ok")
+        return result
+
+    async def awrap_tool_call(self, request, handler):
+        name = request.tool_call["name"]
+        with span(f"tool.{name}"):
+            try:
+                result = await handler(request)
+            except Exception:
+                TOOL_CALLS.inc(name, "error")
+                raise
+        TOOL_CALLS.inc(name, "ok")
+        return result
@@ -1,19 +1,139 @@
+"""
+Flask app: test page, OAuth, chat API, batch bookings, webhooks, metrics
+and health checks.
+
+Importing this module is kept cheap so workers boot and answer /healthz
+within a fraction of a second: the chat stack (LangChain, Gemini, the
+Calendar client) is imported by a background warm-up thread started at
+import, or by the first request that needs it, whichever comes first.
+GET /readyz turns 200 once the warm-up is done.
+"""
+
 from __future__ import annotations
 
-from flask import Flask, jsonify, render_template, request, session, redirect, url_for
+import hmac
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    url_for,
+)
+from flask.sessions import SecureCookieSessionInterface
 from flask_cors import CORS
-from langchain_core.messages import HumanMessage, AIMessage
 
-from config import SECRET_KEY
-from chatbot import build_agent
-from google_oauth import create_flow, save_credentials
+import metrics
+from admission import Overloaded
+from config import (
+    BOOKING_API_TOKEN,
+    BOOKING_BATCH_MAX_SIZE,
+    BOOKING_JOBS_ENABLED,
+    CALENDAR_WEBHOOK_URL,
+    METRICS_ENABLED,
+    RATE_LIMIT_ENABLED,
+    RESPONSE_CACHE_ENABLED,
+    SECRET_KEY,
+    missing_settings,
+)
+from rate_limit import client_ip, get_limiter
+from tenants import DEFAULT_TENANT, Tenant, UnknownTenant, current_tenant, get_tenant, get_tenants
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 app.secret_key = SECRET_KEY
-CORS(app)
+# Retry-After is readable by the widget on other origins (429 / 503 answers)
+CORS(app, expose_headers=["Retry-After"])
+
+
+class _TimedSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions with the decode timed as the "session_decode" span."""
+
+    def open_session(self, app, request):
+        with metrics.span("session_decode"):
+            return super().open_session(app, request)
+
+
+if METRICS_ENABLED:
+    app.session_interface = _TimedSessionInterface()
+
+
+# ------------- Warm-up and health checks -------------
+
+_ready = threading.Event()
+_warm_up_error: Optional[str] = None
+_warm_up_seconds: Optional[float] = None
+
+
+def _warm_up() -> None:
+    """Import the chat stack and build the first tenant's agent, off the request path."""
+    global _warm_up_error, _warm_up_seconds
+    started = time.perf_counter()
+    try:
+        import chat_service
+        from calendar_service import _get_discovery_doc, get_manager
 
-# Build a single global agent instance
-agent = build_agent()
+        _get_discovery_doc()
+
+        tenants = get_tenants()
+        tenant = tenants.get(DEFAULT_TENANT) or next(iter(tenants.values()), None)
+        if tenant is not None:
+            chat_service.get_agent(tenant)
+            get_manager(tenant)
+        if CALENDAR_WEBHOOK_URL:
+            from calendar_push import warm_up
+
+            # Seed the busy indexes and open their push channels
+            warm_up()
+        if BOOKING_JOBS_ENABLED:
+            import followups
+
+            # Resume booking follow-ups left in the journal by the last run
+            followups.start()
+    except Exception as e:
+        _warm_up_error = f"{type(e).__name__}: {e}"
+        print("Warm-up failed:", _warm_up_error)
+    _warm_up_seconds = time.perf_counter() - started
+    _ready.set()
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+
+def readiness() -> Tuple[int, Dict[str, Any]]:
+    """
+    (HTTP status, body) of the readiness check: 200 once the warm-up finished
+    and the required settings are present, else 503 with what is missing.
+    Calendar credentials are not required, so /auth/google stays reachable
+    on a fresh deployment.
+    """
+    problems = [f"missing setting {name}" for name in missing_settings()]
+    if not _ready.is_set():
+        problems.append("warming up")
+    elif _warm_up_error:
+        problems.append(f"warm-up failed: {_warm_up_error}")
+    if problems:
+        return 503, {"status": "unavailable", "problems": problems}
+    return 200, {"status": "ok", "warm_up_seconds": round(_warm_up_seconds or 0.0, 3)}
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness (see readiness())."""
+    status, body = readiness()
+    return jsonify(body), status
 
 
 @app.route("/")
@@ -26,8 +146,16 @@ def index():
 @app.route("/auth/google")
 def auth_google():
     """
-    Start Google OAuth flow for Calendar + Meet.
+    Start Google OAuth flow for Calendar + Meet (?tenant=<key> to authorize
+    that tenant's calendar).
     """
+    try:
+        tenant = get_tenant(request.args.get("tenant"))
+    except UnknownTenant:
+        return "Unknown tenant.\n", 404
+    session["oauth_tenant"] = tenant.key
+    from google_oauth import create_flow
+
     flow = create_flow()
     authorization_url, state = flow.authorization_url(
         access_type="offline",
@@ -43,107 +171,302 @@ def auth_google_callback():
     """
     OAuth callback: exchange code for tokens and save them.
     """
+    from calendar_service import get_manager
+    from google_oauth import create_flow, save_credentials
+
     state = session.get("oauth_state")
     flow = create_flow(state=state)
     flow.fetch_token(authorization_response=request.url)
 
     creds = flow.credentials
-    save_credentials(creds)
+    tenant = get_tenant(session.get("oauth_tenant"))
+    save_credentials(creds, tenant.token_file)
+    get_manager(tenant).set_credentials(creds)
 
     # Simple redirect back to chat page with a message
     return redirect(url_for("index"))
 
+# ------------- Chat API -------------
+
+# Conversation history lives in the server-side conversation store, keyed by
+# an opaque id kept in the session cookie; the cookie never grows with the
+# conversation.
+
+
+def _conversation_id() -> str:
+    if "sid" not in session:
+        session["sid"] = uuid.uuid4().hex
+    return session["sid"]
+
+
+def _tenant(data: dict) -> Tenant:
+    """Tenant named by the widget ("tenant" in the body, X-Tenant-Key or ?tenant=)."""
+    return get_tenant(
+        data.get("tenant") or request.headers.get("X-Tenant-Key") or request.args.get("tenant")
+    )
+
+
+_UNKNOWN_TENANT_REPLY = {"reply": "This booking assistant is not configured."}
+RATE_LIMITED_REPLY = "You're sending messages too quickly. Please wait a moment and try again."
+
+
+def _client_ip() -> Optional[str]:
+    return client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+
+
+def with_pending_updates(body: Dict[str, Any], conversation_id: str) -> Dict[str, Any]:
+    """
+    Add "pending_updates" (Meet links still being fetched for this
+    conversation) to a reply, so the widget knows to poll /api/chat/updates.
+    """
+    if BOOKING_JOBS_ENABLED:
+        from followups import updates
+
+        _, pending = updates(conversation_id)
+        if pending:
+            body["pending_updates"] = pending
+    return body
+
+
+def _rate_limited() -> Optional[Tuple[Response, int, Dict[str, str]]]:
+    """429 response if this visitor (session or IP) is over its limit, else None."""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    wait = get_limiter().check(_conversation_id(), _client_ip())
+    if not wait:
+        return None
+    retry_after = max(1, math.ceil(wait))
+    return (
+        jsonify({"reply": RATE_LIMITED_REPLY, "retry_after": retry_after}),
+        429,
+        {"Retry-After": str(retry_after)},
+    )
+
+
 @app.route("/api/chat", methods=["POST"])
 def chat_api():
     data = request.get_json(force=True)
     user_message = data.get("message", "").strip()
     if not user_message:
         return jsonify({"reply": "Please type a message."}), 400
+    try:
+        tenant = _tenant(data)
+    except UnknownTenant:
+        return jsonify(_UNKNOWN_TENANT_REPLY), 404
+    limited = _rate_limited()
+    if limited:
+        return limited
 
+    # Imported by the warm-up thread unless this is the very first request
+    from chat_service import error_reply, run_turn
+
+    conversation_id = tenant.conversation_id(_conversation_id())
     try:
-        # Get chat history from session (simple in-memory storage)
-        # Store as list of dicts for serialization
-        if "messages" not in session:
-            session["messages"] = []
-        
-        # Convert stored dicts back to message objects
-        messages_dicts = session["messages"]
-        messages = []
-        for msg_dict in messages_dicts:
-            if msg_dict["type"] == "human":
-                messages.append(HumanMessage(content=msg_dict["content"]))
-            elif msg_dict["type"] == "ai":
-                messages.append(AIMessage(content=msg_dict["content"]))
-        
-        # Add the new user message
-        messages.append(HumanMessage(content=user_message))
-        
-        # Invoke agent with messages (new API format)
-        result = agent.invoke({"messages": messages})
-        
-        # Extract the last AI message from the result
-        output_messages = result.get("messages", [])
-        
-        # Find the last AI message (skip tool messages)
-        ai_messages = []
-        for msg in output_messages:
-            if isinstance(msg, AIMessage):
-                ai_messages.append(msg)
-        
-        if ai_messages:
-            # Get the last AI message content
-            last_ai_msg = ai_messages[-1]
-            # Handle content that might be a string, list, or object
-            if isinstance(last_ai_msg.content, str):
-                reply = last_ai_msg.content
-            elif isinstance(last_ai_msg.content, list):
-                # Extract text from content blocks (handle dict items in list)
-                text_parts = []
-                for item in last_ai_msg.content:
-                    if isinstance(item, str):
-                        text_parts.append(item)
-                    elif isinstance(item, dict):
-                        # Extract text from dict if it has a 'text' key
-                        text_parts.append(item.get('text', str(item)))
-                    else:
-                        text_parts.append(str(item))
-                reply = " ".join(text_parts) if text_parts else "I received a response but couldn't parse it."
-            elif isinstance(last_ai_msg.content, dict):
-                # Extract text from dict if it has a 'text' key
-                reply = last_ai_msg.content.get('text', str(last_ai_msg.content))
-            else:
-                reply = str(last_ai_msg.content) if last_ai_msg.content else "I received an empty response."
-        else:
-            # Fallback: try to extract any useful information
-            reply = "I'm sorry, I couldn't generate a response. Please try again."
-            print(f"Warning: No AI messages found in result. Result keys: {result.keys() if isinstance(result, dict) else 'Not a dict'}")
-        
-        # Update session with all messages (including the new ones)
-        messages_dicts = []
-        for msg in output_messages:
-            if isinstance(msg, HumanMessage):
-                content = msg.content if isinstance(msg.content, str) else str(msg.content)
-                messages_dicts.append({"type": "human", "content": content})
-            elif isinstance(msg, AIMessage):
-                content = msg.content if isinstance(msg.content, str) else str(msg.content)
-                messages_dicts.append({"type": "ai", "content": content})
-        session["messages"] = messages_dicts
-        
+        reply = run_turn(conversation_id, user_message, tenant, _client_ip())
+    except Overloaded as e:
+        print("Chat turn not admitted:", e)
+        return (
+            jsonify({"reply": error_reply(e), "retry_after": e.retry_after}),
+            503,
+            {"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         print("Agent error:", e)
         import traceback
         traceback.print_exc()
-        reply = (
-            "Sorry, something went wrong while processing your request. "
-            "Please try again in a moment."
+        reply = error_reply(e)
+
+    body = with_pending_updates({"reply": reply}, conversation_id)
+    with metrics.span("serialize"):
+        return jsonify(body)
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream_api():
+    """
+    Streaming variant of /api/chat (Server-Sent Events).
+
+    Events:
+    - status: {"tool", "label"} when the agent starts a tool call
+    - token:  {"text"} incremental reply text
+    - done:   {"reply", "timings"} final reply; replaces the streamed text
+              (plus "pending_updates" while a Meet link is being fetched)
+    - error:  {"reply"} generic error message (plus "retry_after" seconds
+              when the server is too busy to take the turn)
+
+    Rate-limited requests get a 429 JSON response instead of a stream.
+    """
+    data = request.get_json(force=True)
+    user_message = data.get("message", "").strip()
+    if not user_message:
+        return jsonify({"reply": "Please type a message."}), 400
+    try:
+        tenant = _tenant(data)
+    except UnknownTenant:
+        return jsonify(_UNKNOWN_TENANT_REPLY), 404
+    limited = _rate_limited()
+    if limited:
+        return limited
+
+    received_at = time.perf_counter()
+    conversation_id = tenant.conversation_id(_conversation_id())
+    client = _client_ip()
+    from chat_service import error_reply, sse, stream_turn
+
+    def generate():
+        try:
+            for event, payload in stream_turn(
+                conversation_id, user_message, received_at, tenant, client
+            ):
+                if event == "done":
+                    payload = with_pending_updates(dict(payload), conversation_id)
+                yield sse(event, payload)
+        except Overloaded as e:
+            print("Chat turn not admitted:", e)
+            yield sse("error", {"reply": error_reply(e), "retry_after": e.retry_after})
+        except Exception as e:
+            print("Agent error:", e)
+            import traceback
+            traceback.print_exc()
+            yield sse("error", {"reply": error_reply(e)})
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    # Disable proxy buffering (nginx) so events reach the browser immediately
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/api/chat/updates")
+def chat_updates_api():
+    """
+    Booking follow-ups for the widget, as a long poll; 404 unless
+    BOOKING_JOBS_ENABLED.
+
+    Query: ?seen=<updates already shown>&wait=<seconds>&tenant=<key>.
+    Answers once there are more than `seen` updates, nothing is pending any
+    more, or after `wait` seconds (at most BOOKING_UPDATES_WAIT_SECONDS):
+    {"updates": [{"id", "event_id", "meet_link", "message"}], "pending": n}.
+    """
+    if not BOOKING_JOBS_ENABLED:
+        return jsonify({"error": "Booking updates are disabled."}), 404
+    try:
+        tenant = get_tenant(request.args.get("tenant") or request.headers.get("X-Tenant-Key"))
+    except UnknownTenant:
+        return jsonify(_UNKNOWN_TENANT_REPLY), 404
+    from followups import wait_for_updates
+
+    finished, pending = wait_for_updates(
+        tenant.conversation_id(_conversation_id()),
+        request.args.get("seen", 0, type=int),
+        request.args.get("wait", 0, type=float),
+    )
+    return jsonify({"updates": finished, "pending": pending})
+
+
+# ------------- Batch bookings -------------
+
+
+def _booking_result(result: dict) -> dict:
+    event = result.pop("event", None)
+    if event is not None:
+        result.update(
+            event_id=event.get("id"),
+            start=(event.get("start") or {}).get("dateTime"),
+            end=(event.get("end") or {}).get("dateTime"),
+            html_link=event.get("htmlLink"),
+            meet_link=event.get("hangoutLink"),
         )
+    return result
+
+
+@app.route("/api/bookings/batch", methods=["POST"])
+def bookings_batch_api():
+    """
+    Book many meetings at once (sales ops); 404 unless BOOKING_API_TOKEN is set.
+
+    Body: {"tenant"?: key, "bookings": [{"start_iso", "end_iso", "title"?,
+    "attendees"?: [emails], "description"?, "location"?, "idempotency_key"?}]}.
+    Returns one result per booking, in order, with "status" created, invalid,
+    conflict (busy, held for a chat visitor, or overlapping an earlier booking
+    of the batch) or failed.
+    """
+    if not BOOKING_API_TOKEN:
+        return jsonify({"error": "The booking API is disabled."}), 404
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode("utf-8"), BOOKING_API_TOKEN.encode("utf-8")):
+        return jsonify({"error": "Invalid or missing API token."}), 401
+    data = request.get_json(force=True, silent=True) or {}
+    batch = data.get("bookings")
+    if not isinstance(batch, list) or not all(isinstance(b, dict) for b in batch):
+        return jsonify({"error": "Send a JSON object with a \"bookings\" list."}), 400
+    if len(batch) > BOOKING_BATCH_MAX_SIZE:
+        return jsonify({"error": f"At most {BOOKING_BATCH_MAX_SIZE} bookings per request."}), 400
+    try:
+        tenant = _tenant(data)
+    except UnknownTenant:
+        return jsonify({"error": "Unknown tenant."}), 404
+
+    from availability import get_index
+    from calendar_tools import create_events_batch
+    from chat_service import error_reply
+    from response_cache import get_cache
+
+    token = current_tenant.set(tenant)
+    try:
+        results = create_events_batch(batch)
+        created = [r["event"] for r in results if r.get("status") == "created"]
+        index = get_index()
+        for event in created:
+            # Make the new bookings visible to availability checks right away
+            index.record_event(event)
+        if created and RESPONSE_CACHE_ENABLED:
+            get_cache().invalidate()
+    except Exception as e:
+        print("Batch booking error:", e)
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": error_reply(e)}), 502
+    finally:
+        current_tenant.reset(token)
+
+    counts = Counter(r["status"] for r in results)
+    with metrics.span("serialize"):
+        return jsonify({"results": [_booking_result(r) for r in results], "counts": counts})
+
+
+# ------------- Calendar webhooks -------------
+
+
+@app.route("/webhooks/calendar", methods=["POST"])
+def calendar_webhook():
+    """
+    Calendar push notifications (events.watch channels, see calendar_push.py);
+    404 unless CALENDAR_WEBHOOK_URL is set. Answers at once, the sync runs
+    in the background.
+    """
+    if not CALENDAR_WEBHOOK_URL:
+        return "Push notifications are disabled.\n", 404
+    from calendar_push import get_push
+
+    return "", get_push().handle(request.headers)
+
+
+# ------------- Metrics -------------
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """
+    Prometheus metrics (text exposition format); 404 unless METRICS_ENABLED.
+    """
+    if not METRICS_ENABLED:
+        return "Metrics are disabled.\n", 404
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
-    # Ensure reply is always a string
-    if not isinstance(reply, str):
-        reply = str(reply)
-    
-    return jsonify({"reply": reply})
 
+# Started last, so it doesn't compete with the rest of this import
+threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
 
 if __name__ == "__main__":
     # Local development
@@ -0,0 +1,322 @@
+"""
+Async serving mode.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The chat endpoints run on the event loop (agent.ainvoke / agent.astream), so
+many conversations can wait on Gemini and Calendar concurrently in one
+process without a thread per request. Upstream calls are capped by
+UPSTREAM_CONCURRENCY and each turn by CHAT_REQUEST_TIMEOUT_SECONDS. Rate
+limits and the admission queue (rate_limit.py, admission.py) apply as in
+the Flask app, with the same 429 / 503 answers. The booking-updates long
+poll (GET /api/chat/updates) also waits here, on the event loop.
+
+Every other route (test page, OAuth, static files) is served by the Flask
+app mounted underneath. Both share the Flask session cookie, which is read
+and written here with Flask's own signing serializer.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib
+import math
+import time
+import traceback
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+from admission import Overloaded
+from app import RATE_LIMITED_REPLY, readiness, with_pending_updates
+from app import app as flask_app
+from config import BOOKING_JOBS_ENABLED, CHAT_REQUEST_TIMEOUT_SECONDS, RATE_LIMIT_ENABLED
+from metrics import span
+from rate_limit import client_ip, get_limiter
+from tenants import Tenant, UnknownTenant, get_tenant
+
+_TIMEOUT_REPLY = (
+    "Sorry, that took too long to process. Please try again in a moment."
+)
+_UNKNOWN_TENANT_REPLY = {"reply": "This booking assistant is not configured."}
+
+# chat_service, imported on first use (see _chat)
+_chat_service = None
+
+_session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+_SESSION_COOKIE = flask_app.config["SESSION_COOKIE_NAME"]
+# Cookies older than this are rejected, as Flask's open_session does
+_SESSION_MAX_AGE = int(flask_app.permanent_session_lifetime.total_seconds())
+
+
+def _conversation_id(request: Request) -> Tuple[str, Dict[str, Any], bool]:
+    """Return (conversation id, session dict, whether the session changed)."""
+    session: Dict[str, Any] = {}
+    cookie = request.cookies.get(_SESSION_COOKIE)
+    if cookie:
+        try:
+            with span("session_decode"):
+                session = dict(_session_serializer.loads(cookie, max_age=_SESSION_MAX_AGE))
+        except Exception:
+            session = {}
+    if "sid" in session:
+        return session["sid"], session, False
+    session["sid"] = uuid.uuid4().hex
+    return session["sid"], session, True
+
+
+def _finish(response: Response, session: Dict[str, Any], changed: bool) -> Response:
+    # Same CORS policy as flask_cors.CORS(app): any origin
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Expose-Headers"] = "Retry-After"
+    if changed:
+        response.set_cookie(
+            _SESSION_COOKIE,
+            _session_serializer.dumps(session),
+            httponly=True,
+            samesite=(flask_app.config.get("SESSION_COOKIE_SAMESITE") or "").lower() or None,
+            secure=bool(flask_app.config.get("SESSION_COOKIE_SECURE")),
+        )
+    return response
+
+
+def _preflight(request: Request) -> Response:
+    return Response(
+        status_code=200,
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "POST, OPTIONS",
+            "Access-Control-Allow-Headers": request.headers.get(
+                "Access-Control-Request-Headers", "Content-Type"
+            ),
+        },
+    )
+
+
+async def _chat():
+    """
+    The chat stack. app.py's warm-up thread imports it at startup; a request
+    arriving before that is done waits on a worker thread, not the event loop.
+    """
+    global _chat_service
+    if _chat_service is None:
+        _chat_service = await asyncio.to_thread(importlib.import_module, "chat_service")
+    return _chat_service
+
+
+def _client_ip(request: Request) -> Optional[str]:
+    return client_ip(
+        request.client.host if request.client else None, request.headers.get("X-Forwarded-For")
+    )
+
+
+async def _rate_limited(request: Request, session_id: str) -> Optional[Response]:
+    """429 response if this visitor is over its limit (see app._rate_limited), else None."""
+    if not RATE_LIMIT_ENABLED:
+        return None
+    limiter = get_limiter()
+    ip = _client_ip(request)
+    if limiter.buckets.shared:
+        # A round-trip to the shared store; keep it off the event loop
+        wait = await asyncio.to_thread(limiter.check, session_id, ip)
+    else:
+        wait = limiter.check(session_id, ip)
+    if not wait:
+        return None
+    retry_after = max(1, math.ceil(wait))
+    return JSONResponse(
+        {"reply": RATE_LIMITED_REPLY, "retry_after": retry_after},
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def _overloaded(error: Overloaded, reply: str) -> Response:
+    print("Chat turn not admitted:", error)
+    return JSONResponse(
+        {"reply": reply, "retry_after": error.retry_after},
+        status_code=503,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+async def healthz(request: Request) -> Response:
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request: Request) -> Response:
+    status, body = readiness()
+    return JSONResponse(body, status_code=status)
+
+
+async def _read_chat(request: Request) -> Tuple[str, Tenant]:
+    """
+    (user message, tenant) of a chat request; the tenant is named by
+    "tenant" in the body, X-Tenant-Key or ?tenant= (see app._tenant).
+    Raises UnknownTenant.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    tenant = get_tenant(
+        data.get("tenant")
+        or request.headers.get("X-Tenant-Key")
+        or request.query_params.get("tenant")
+    )
+    return (data.get("message") or "").strip(), tenant
+
+
+async def chat_api(request: Request) -> Response:
+    if request.method == "OPTIONS":
+        return _preflight(request)
+    try:
+        user_message, tenant = await _read_chat(request)
+    except UnknownTenant:
+        return _finish(JSONResponse(_UNKNOWN_TENANT_REPLY, status_code=404), {}, False)
+    if not user_message:
+        return _finish(JSONResponse({"reply": "Please type a message."}, status_code=400), {}, False)
+
+    session_id, session, changed = _conversation_id(request)
+    limited = await _rate_limited(request, session_id)
+    if limited:
+        return _finish(limited, session, changed)
+    conversation_id = tenant.conversation_id(session_id)
+    chat = await _chat()
+    status = 200
+    try:
+        reply = await asyncio.wait_for(
+            chat.arun_turn(conversation_id, user_message, tenant, _client_ip(request)),
+            CHAT_REQUEST_TIMEOUT_SECONDS,
+        )
+    except Overloaded as e:
+        return _finish(_overloaded(e, chat.error_reply(e)), session, changed)
+    except asyncio.TimeoutError:
+        print(f"Chat turn timed out after {CHAT_REQUEST_TIMEOUT_SECONDS}s")
+        reply, status = _TIMEOUT_REPLY, 504
+    except Exception as e:
+        print("Agent error:", e)
+        traceback.print_exc()
+        reply = chat.error_reply(e)
+    body = {"reply": reply}
+    if BOOKING_JOBS_ENABLED:
+        body = await asyncio.to_thread(with_pending_updates, body, conversation_id)
+    with span("serialize"):
+        response = JSONResponse(body, status_code=status)
+    return _finish(response, session, changed)
+
+
+async def chat_stream_api(request: Request) -> Response:
+    """Streaming variant of /api/chat; same events as the Flask endpoint."""
+    if request.method == "OPTIONS":
+        return _preflight(request)
+    try:
+        user_message, tenant = await _read_chat(request)
+    except UnknownTenant:
+        return _finish(JSONResponse(_UNKNOWN_TENANT_REPLY, status_code=404), {}, False)
+    if not user_message:
+        return _finish(JSONResponse({"reply": "Please type a message."}, status_code=400), {}, False)
+
+    received_at = time.perf_counter()
+    session_id, session, changed = _conversation_id(request)
+    limited = await _rate_limited(request, session_id)
+    if limited:
+        return _finish(limited, session, changed)
+    conversation_id = tenant.conversation_id(session_id)
+    chat = await _chat()
+
+    async def generate() -> AsyncIterator[str]:
+        deadline = time.monotonic() + CHAT_REQUEST_TIMEOUT_SECONDS
+        # The whole turn runs in one task: stepping the generator with
+        # wait_for would run each step in a fresh copy of this context,
+        # losing the tenant and conversation set by its first step
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def run_turn() -> None:
+            try:
+                async for item in chat.astream_turn(
+                    conversation_id, user_message, received_at, tenant, _client_ip(request)
+                ):
+                    await events.put(item)
+            except Exception as e:
+                await events.put(e)
+            else:
+                await events.put(None)
+
+        turn = asyncio.create_task(run_turn())
+        try:
+            while True:
+                item = await asyncio.wait_for(events.get(), max(deadline - time.monotonic(), 0))
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                event, payload = item
+                if event == "done" and BOOKING_JOBS_ENABLED:
+                    payload = await asyncio.to_thread(
+                        with_pending_updates, dict(payload), conversation_id
+                    )
+                yield chat.sse(event, payload)
+        except asyncio.TimeoutError:
+            print(f"Chat stream timed out after {CHAT_REQUEST_TIMEOUT_SECONDS}s")
+            yield chat.sse("error", {"reply": _TIMEOUT_REPLY})
+        except Overloaded as e:
+            print("Chat turn not admitted:", e)
+            yield chat.sse("error", {"reply": chat.error_reply(e), "retry_after": e.retry_after})
+        except Exception as e:
+            print("Agent error:", e)
+            traceback.print_exc()
+            yield chat.sse("error", {"reply": chat.error_reply(e)})
+        finally:
+            turn.cancel()
+
+    response = StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    return _finish(response, session, changed)
+
+
+async def chat_updates_api(request: Request) -> Response:
+    """
+    Long poll for booking follow-ups (see app.chat_updates_api); waits on
+    the event loop instead of holding a worker thread.
+    """
+    if not BOOKING_JOBS_ENABLED:
+        disabled = JSONResponse({"error": "Booking updates are disabled."}, status_code=404)
+        return _finish(disabled, {}, False)
+    try:
+        tenant = get_tenant(
+            request.query_params.get("tenant") or request.headers.get("X-Tenant-Key")
+        )
+    except UnknownTenant:
+        return _finish(JSONResponse(_UNKNOWN_TENANT_REPLY, status_code=404), {}, False)
+    try:
+        seen = int(request.query_params.get("seen") or 0)
+        wait = float(request.query_params.get("wait") or 0)
+    except ValueError:
+        seen, wait = 0, 0.0
+    session_id, session, changed = _conversation_id(request)
+    from followups import await_updates
+
+    finished, pending = await await_updates(tenant.conversation_id(session_id), seen, wait)
+    return _finish(JSONResponse({"updates": finished, "pending": pending}), session, changed)
+
+
+app = Starlette(
+    routes=[
+        Route("/api/chat", chat_api, methods=["POST", "OPTIONS"]),
+        Route("/api/chat/stream", chat_stream_api, methods=["POST", "OPTIONS"]),
+        Route("/api/chat/updates", chat_updates_api),
+        # Answered on the event loop, so health checks don't queue behind WSGI threads
+        Route("/healthz", healthz),
+        Route("/readyz", readyz),
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ]
+)
@@ -0,0 +1,381 @@
+"""
+In-memory busy-time index for the shared calendar.
+
+The index is seeded with one full `events.list` sync and then kept current
+with incremental syncs (`syncToken` / `nextSyncToken`). When Google expires
+the sync token (HTTP 410) it falls back to a full resync. Availability
+queries are answered from sorted in-memory arrays; an incremental sync only
+runs when the data is older than AVAILABILITY_MAX_STALENESS_SECONDS, or
+CALENDAR_PUSH_MAX_STALENESS_SECONDS while a push channel delivers changes
+(see calendar_push.py).
+
+Syncs request only the fields busy-time math needs (id, status,
+transparency, start, end) and convert each page as it arrives, so a
+calendar with thousands of recurring instances is never held as full
+event resources. Each event is parsed to epoch seconds once; queries
+bisect two array('d') columns of starts and ends.
+
+Callers go through `busy_intervals` / `team_busy_intervals`, which dispatch
+to the backend chosen by AVAILABILITY_BACKEND (the index, or live
+freeBusy.query for busy ranges only). Each tenant has its own index (see
+tenants.TenantLRU); naive times are read in the current tenant's timezone.
+"""
+
+from __future__ import annotations
+
+import bisect
+import datetime
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from dateutil import parser as date_parser
+from dateutil import tz as dateutil_tz
+from googleapiclient.errors import HttpError
+
+from calendar_service import get_manager, get_service
+from calendar_tools import BUSY_EVENT_FIELDS, iter_event_pages, query_free_busy
+from config import (
+    AVAILABILITY_BACKEND,
+    AVAILABILITY_MAX_STALENESS_SECONDS,
+    AVAILABILITY_SYNC_HORIZON_DAYS,
+    CALENDAR_PUSH_MAX_STALENESS_SECONDS,
+    CALENDAR_WEBHOOK_URL,
+)
+from tenants import Tenant, TenantLRU, current
+
+Interval = Tuple[float, float]
+
+
+def _parse_iso(value: str) -> datetime.datetime:
+    try:
+        # Fast path: covers what Calendar returns ("2030-01-07T09:00:00+05:30", "...Z")
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return date_parser.isoparse(value)
+
+
+def iso_to_epoch(value: str, timezone: Optional[str] = None) -> float:
+    """
+    Parse an ISO 8601 timestamp; naive values are in `timezone` (default:
+    the current tenant's business timezone).
+    """
+    dt = _parse_iso(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=dateutil_tz.gettz(timezone or current().timezone))
+    return dt.timestamp()
+
+
+def _to_epoch(when: Dict[str, Any], timezone: Optional[str]) -> Optional[float]:
+    if when.get("dateTime"):
+        return iso_to_epoch(when["dateTime"], timezone)
+    if when.get("date"):
+        # All-day events start at local midnight
+        zone = dateutil_tz.gettz(when.get("timeZone") or timezone or current().timezone)
+        return _parse_iso(when["date"]).replace(tzinfo=zone).timestamp()
+    return None
+
+
+def event_interval(event: Dict[str, Any], timezone: Optional[str] = None) -> Optional[Interval]:
+    """Busy interval (epoch seconds) of a Google event, or None if it is not busy."""
+    if event.get("status") == "cancelled" or event.get("transparency") == "transparent":
+        return None
+    start = _to_epoch(event.get("start", {}), timezone)
+    end = _to_epoch(event.get("end", {}), timezone)
+    if start is None or end is None or end <= start:
+        return None
+    return (start, end)
+
+
+def epoch_to_iso(ts: float, timezone: Optional[str] = None) -> str:
+    zone = dateutil_tz.gettz(timezone or current().timezone) or datetime.timezone.utc
+    return datetime.datetime.fromtimestamp(ts, zone).isoformat()
+
+
+class BusyIndex:
+    """
+    Busy blocks of one calendar, kept as arrays sorted by start time.
+
+    `service_factory` returns a Calendar service; pass one bound to a local
+    stub (see benchmarks/calendar_stub.py) to exercise the sync logic offline.
+    The calendar and timezone default to the current tenant's.
+    """
+
+    def __init__(
+        self,
+        calendar_id: Optional[str] = None,
+        service_factory: Callable[[], Any] = get_service,
+        max_staleness_seconds: float = AVAILABILITY_MAX_STALENESS_SECONDS,
+        horizon_days: int = AVAILABILITY_SYNC_HORIZON_DAYS,
+        timezone: Optional[str] = None,
+        push_staleness_seconds: float = CALENDAR_PUSH_MAX_STALENESS_SECONDS,
+    ):
+        self.calendar_id = calendar_id or current().calendar_id
+        self.timezone = timezone or current().timezone
+        self._service_factory = service_factory
+        self._max_staleness = max_staleness_seconds
+        self._push_staleness = push_staleness_seconds
+        # Until then a push channel reports changes (set by calendar_push)
+        self.push_until = 0.0
+        self._horizon = horizon_days * 86400
+        self._lock = threading.Lock()
+
+        self._events: Dict[str, Interval] = {}
+        self._sync_token: Optional[str] = None
+        self._synced_at = 0.0
+        # Mirrored time window [window_start, window_end)
+        self._window: Interval = (0.0, 0.0)
+        # Query snapshot: (starts, ends, longest duration); replaced atomically
+        self._snapshot: Tuple[array, array, float] = (array("d"), array("d"), 0.0)
+        # Bumped on every change to the busy data
+        self.version = 0
+        self._counters = {"full_syncs": 0, "incremental_syncs": 0, "resets": 0, "queries": 0}
+
+    # ------------- Sync -------------
+
+    def sync(self, force_full: bool = False, max_age: Optional[float] = None) -> None:
+        """
+        Bring the index up to date (incremental when possible). With
+        `max_age`, skip the sync if another thread refreshed the index
+        within that many seconds while we waited for the lock.
+        """
+        with self._lock:
+            now = time.time()
+            if max_age is not None and not force_full and now - self._synced_at <= max_age:
+                return
+            # Re-seed once the mirrored window no longer covers half the horizon
+            window_short = self._window[1] - now < self._horizon / 2
+            if force_full or self._sync_token is None or window_short:
+                self._full_sync_locked(now)
+                return
+            try:
+                self._incremental_sync_locked(now)
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                # Sync token expired: start over
+                self._counters["resets"] += 1
+                self._full_sync_locked(now)
+
+    def _pages(self, **params) -> Iterable[Dict[str, Any]]:
+        return iter_event_pages(
+            self.calendar_id, BUSY_EVENT_FIELDS, service_factory=self._service_factory, **params
+        )
+
+    def _full_sync_locked(self, now: float) -> None:
+        # Include events that started up to a day ago so in-progress
+        # meetings still count as busy.
+        window = (now - 86400, now + self._horizon)
+        events: Dict[str, Interval] = {}
+        sync_token = None
+        for page in self._pages(
+            timeMin=epoch_to_iso(window[0], self.timezone),
+            timeMax=epoch_to_iso(window[1], self.timezone),
+        ):
+            for event in page.get("items", []):
+                interval = event_interval(event, self.timezone)
+                if interval:
+                    events[event["id"]] = interval
+            sync_token = page.get("nextSyncToken")
+        self._events = events
+        self._sync_token = sync_token
+        self._window = window
+        self._synced_at = now
+        self._counters["full_syncs"] += 1
+        self._rebuild_locked()
+
+    def _incremental_sync_locked(self, now: float) -> None:
+        changed = False
+        sync_token = None
+        for page in self._pages(syncToken=self._sync_token):
+            for event in page.get("items", []):
+                self._apply_locked(event)
+                changed = True
+            sync_token = page.get("nextSyncToken")
+        if changed:
+            self._rebuild_locked()
+        self._sync_token = sync_token or self._sync_token
+        self._synced_at = now
+        self._counters["incremental_syncs"] += 1
+
+    def _apply_locked(self, event: Dict[str, Any]) -> None:
+        interval = event_interval(event, self.timezone)
+        if interval:
+            self._events[event["id"]] = interval
+        else:
+            self._events.pop(event.get("id"), None)
+
+    def _rebuild_locked(self) -> None:
+        intervals = sorted(self._events.values())
+        # Unboxed doubles: 16 bytes per interval instead of two float objects
+        starts = array("d", [s for s, _ in intervals])
+        ends = array("d", [e for _, e in intervals])
+        longest = max((e - s for s, e in intervals), default=0.0)
+        self._snapshot = (starts, ends, longest)
+        self.version += 1
+
+    def record_event(self, event: Dict[str, Any]) -> None:
+        """Apply an event we just wrote so it is visible before the next sync."""
+        with self._lock:
+            self._apply_locked(event)
+            self._rebuild_locked()
+
+    def ensure_fresh(self) -> None:
+        now = time.time()
+        # Pushed changes are synced as they arrive; polling is only a safety net
+        max_staleness = self._push_staleness if now < self.push_until else self._max_staleness
+        if now - self._synced_at > max_staleness:
+            self.sync(max_age=max_staleness)
+
+    # ------------- Queries -------------
+
+    def covers(self, start: float, end: float) -> bool:
+        return self._window[0] <= start and end <= self._window[1]
+
+    def busy_between(self, start: float, end: float) -> List[Interval]:
+        """Busy intervals overlapping [start, end), as epoch seconds."""
+        self.ensure_fresh()
+        self._counters["queries"] += 1
+        starts, ends, longest = self._snapshot
+        # Nothing starting before start - longest can still overlap the range
+        i = bisect.bisect_left(starts, start - longest)
+        stop = bisect.bisect_left(starts, end)
+        return [(starts[j], ends[j]) for j in range(i, stop) if ends[j] > start]
+
+    def is_free(self, start: float, end: float) -> bool:
+        return not self.busy_between(start, end)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._counters)
+        stats.update(
+            events=len(self._events),
+            version=self.version,
+            age_seconds=round(time.time() - self._synced_at, 3),
+        )
+        return stats
+
+
+def _build_index(tenant: Tenant) -> BusyIndex:
+    index = BusyIndex(
+        tenant.calendar_id,
+        # Looked up per call, so a re-created manager is picked up
+        service_factory=lambda: get_manager(tenant).get_service(),
+        timezone=tenant.timezone,
+    )
+    if CALENDAR_WEBHOOK_URL:
+        from calendar_push import get_push
+
+        get_push().watch(tenant)
+    return index
+
+
+def _drop_index(tenant_key: str, index: BusyIndex) -> None:
+    if CALENDAR_WEBHOOK_URL:
+        from calendar_push import get_push
+
+        get_push().unwatch(tenant_key)
+
+
+_indexes: TenantLRU[BusyIndex] = TenantLRU(_build_index, close=_drop_index)
+
+
+def get_index(tenant: Optional[Tenant] = None) -> BusyIndex:
+    """Busy index of `tenant`'s calendar (default: the current tenant), created on first use."""
+    return _indexes.get(tenant)
+
+
+def loaded_index(tenant_key: str) -> Optional[BusyIndex]:
+    """The tenant's busy index if it is in memory (never builds or syncs one)."""
+    return _indexes.peek(tenant_key)
+
+
+# ------------- Backends -------------
+
+
+class FreeBusyBackend:
+    """Live busy ranges from freeBusy.query; all calendars in one request."""
+
+    name = "freebusy"
+
+    def busy(
+        self, start_iso: str, end_iso: str, calendar_ids: List[str]
+    ) -> Dict[str, List[Interval]]:
+        start, end = iso_to_epoch(start_iso), iso_to_epoch(end_iso)
+        result = query_free_busy(start_iso, end_iso, calendar_ids)
+        busy: Dict[str, List[Interval]] = {}
+        for cal_id in calendar_ids:
+            entry = result.get(cal_id, {})
+            if entry.get("errors") or cal_id not in result:
+                # Calendar not readable: treat it as busy for the whole range
+                print(f"freeBusy error for {cal_id}: {entry.get('errors')}")
+                busy[cal_id] = [(start, end)]
+                continue
+            busy[cal_id] = [
+                (iso_to_epoch(b["start"]), iso_to_epoch(b["end"]))
+                for b in entry.get("busy", [])
+            ]
+        return busy
+
+
+class IndexBackend:
+    """
+    Shared calendar from the in-memory busy index; any other team calendars
+    (and ranges beyond the mirrored horizon) go through freeBusy.
+    """
+
+    name = "index"
+
+    def __init__(self):
+        self._freebusy = FreeBusyBackend()
+
+    def busy(
+        self, start_iso: str, end_iso: str, calendar_ids: List[str]
+    ) -> Dict[str, List[Interval]]:
+        start, end = iso_to_epoch(start_iso), iso_to_epoch(end_iso)
+        index = get_index()
+        index.ensure_fresh()
+
+        busy: Dict[str, List[Interval]] = {}
+        remote = list(calendar_ids)
+        if index.calendar_id in remote and index.covers(start, end):
+            busy[index.calendar_id] = index.busy_between(start, end)
+            remote.remove(index.calendar_id)
+        if remote:
+            busy.update(self._freebusy.busy(start_iso, end_iso, remote))
+        return busy
+
+
+_BACKENDS = {"index": IndexBackend, "freebusy": FreeBusyBackend}
+_backend = None
+
+
+def get_backend():
+    """Availability backend selected by AVAILABILITY_BACKEND."""
+    global _backend
+    if _backend is None:
+        if AVAILABILITY_BACKEND not in _BACKENDS:
+            raise ValueError(
+                f"Unknown AVAILABILITY_BACKEND {AVAILABILITY_BACKEND!r}; "
+                f"expected one of: {', '.join(_BACKENDS)}"
+            )
+        _backend = _BACKENDS[AVAILABILITY_BACKEND]()
+    return _backend
+
+
+def team_busy_intervals(
+    start_iso: str, end_iso: str, calendar_ids: Optional[List[str]] = None
+) -> Dict[str, List[Interval]]:
+    """Busy intervals (epoch seconds) per team calendar."""
+    return get_backend().busy(
+        start_iso, end_iso, calendar_ids or current().team_calendar_ids
+    )
+
+
+def busy_intervals(start_iso: str, end_iso: str) -> List[Interval]:
+    """
+    Busy intervals (epoch seconds, sorted by start) of the shared calendar
+    between two ISO 8601 timestamps.
+    """
+    calendar_id = current().calendar_id
+    return sorted(get_backend().busy(start_iso, end_iso, [calendar_id])[calendar_id])
@@ -0,0 +1,210 @@
+"""
+Rate limits and admission control against a bot flooding the chat.
+
+    python -m benchmarks.bench_admission [--seconds 10] [--bot-concurrency 48]
+                                         [--visitors 20] [--quota 30]
+
+Serves the ASGI app in-process (httpx's ASGI transport) with the offline
+agent of benchmarks.fake_agent, whose model has a quota like Gemini's:
+beyond --quota calls per second it answers 429. For --seconds, a bot on one
+IP posts opening messages from --bot-concurrency connections without
+keeping cookies, while --visitors visitors (each on their own IP, arriving
+spread over the run) send three messages each, a second apart. Client IPs
+come from X-Forwarded-For (TRUSTED_PROXY_COUNT=1). Each setting runs in its
+own process, since settings are read at import:
+
+- off: no limits;
+- rate_limit: RATE_LIMIT_ENABLED with the default limits;
+- admission: ADMISSION_MAX_CONCURRENT=8 and ADMISSION_MAX_QUEUE=16 only,
+  as when a bot spreads over many IPs;
+- both.
+
+Reports the visitors' messages that got a real reply and their latency,
+the bot's turns that reached the agent, the model calls made, refused by
+the quota and running at the peak, and the admission queue's counters.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+_MODES = {
+    "off": {},
+    "rate_limit": {"RATE_LIMIT_ENABLED": "true"},
+    "admission": {"ADMISSION_MAX_CONCURRENT": "8", "ADMISSION_MAX_QUEUE": "16"},
+    "both": {
+        "RATE_LIMIT_ENABLED": "true",
+        "ADMISSION_MAX_CONCURRENT": "8",
+        "ADMISSION_MAX_QUEUE": "16",
+    },
+}
+_BASE = "http://bench"
+_BOT_IP = "203.0.113.7"
+_VISITOR_MESSAGES = ("Hi, am I free tomorrow?", "What about the afternoon?", "And on Friday?")
+
+
+def _outcome(response, reply: str) -> str:
+    if response.status_code != 200:
+        return str(response.status_code)
+    return "ok" if response.json().get("reply") == reply else "error"
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ.update(
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID=os.getenv("GOOGLE_CALENDAR_ID", "primary"),
+        CONVERSATION_STORE="memory://",
+        TRUSTED_PROXY_COUNT="1",
+        BENCH_LLM_LATENCY=str(args.llm_latency),
+        **_MODES[mode],
+    )
+
+    import httpx
+    from langchain.agents import create_agent
+
+    import chat_service
+    import chatbot
+    from benchmarks.fake_agent import asgi_app, fake_check_availability
+    from benchmarks.fake_llm import FakeUpstreamError, SlowChatModel
+    from rate_limit import MemoryBuckets
+
+    quota = MemoryBuckets()
+    calls: Counter = Counter()
+    in_flight = [0]
+
+    class QuotaChatModel(SlowChatModel):
+        async def _agenerate(self, *a: Any, **kw: Any):
+            if quota.take("gemini", args.quota, args.quota):
+                calls["refused"] += 1
+                raise FakeUpstreamError(429)
+            calls["made"] += 1
+            in_flight[0] += 1
+            calls["peak"] = max(calls["peak"], in_flight[0])
+            try:
+                return await super()._agenerate(*a, **kw)
+            finally:
+                in_flight[0] -= 1
+
+    model = QuotaChatModel(latency=args.llm_latency)
+    chat_service.agent = create_agent(
+        model,
+        [chatbot._with_async(fake_check_availability)],
+        system_prompt="You are a test assistant.",
+        middleware=[
+            chatbot.conversation_context_prompt,
+            chatbot.ResilienceMiddleware(deadline=chatbot.LLM_CALL_DEADLINE_SECONDS),
+            chatbot.UpstreamLimitMiddleware(),
+        ],
+    )
+
+    transport = httpx.ASGITransport(app=asgi_app)
+    bot: Counter = Counter()
+    visitors: Counter = Counter()
+    latencies: List[float] = []
+
+    async def bot_loop(deadline: float) -> None:
+        while time.monotonic() < deadline:
+            # A fresh client per request: no session cookie is kept
+            async with httpx.AsyncClient(transport=transport, base_url=_BASE, timeout=120) as client:
+                r = await client.post(
+                    "/api/chat",
+                    json={"message": "Any free slots?"},
+                    headers={"X-Forwarded-For": _BOT_IP},
+                )
+            bot[_outcome(r, model.reply)] += 1
+            if r.status_code != 200:
+                # Ignores Retry-After, but doesn't spin
+                await asyncio.sleep(0.2)
+
+    async def visitor(n: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        headers = {"X-Forwarded-For": f"198.51.100.{n % 250 + 1}"}
+        async with httpx.AsyncClient(transport=transport, base_url=_BASE, timeout=120) as client:
+            for message in _VISITOR_MESSAGES:
+                started = time.perf_counter()
+                r = await client.post("/api/chat", json={"message": message}, headers=headers)
+                outcome = _outcome(r, model.reply)
+                visitors[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(1.0)
+
+    async def drive() -> None:
+        deadline = time.monotonic() + args.seconds
+        spread = max(args.seconds - 4, 0) / max(args.visitors, 1)
+        await asyncio.gather(
+            *(bot_loop(deadline) for _ in range(args.bot_concurrency)),
+            *(visitor(n, n * spread) for n in range(args.visitors)),
+        )
+
+    asyncio.run(drive())
+
+    from admission import get_queue
+
+    queue = get_queue()
+    latencies.sort()
+    return {
+        "visitor_ok": visitors["ok"],
+        "visitor_messages": sum(visitors.values()),
+        "visitor_outcomes": dict(visitors),
+        "visitor_p50": statistics.median(latencies) if latencies else float("nan"),
+        "visitor_p99": latencies[int(len(latencies) * 0.99)] if latencies else float("nan"),
+        "bot_served": bot["ok"],
+        "bot_outcomes": dict(bot),
+        "model_calls": calls["made"],
+        "quota_refused": calls["refused"],
+        "peak_model_calls": calls["peak"],
+        "admission": queue.stats() if queue else {},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--bot-concurrency", type=int, default=48)
+    parser.add_argument("--visitors", type=int, default=20)
+    parser.add_argument("--quota", type=float, default=30.0, help="model calls per second")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--modes", default=",".join(_MODES))
+    parser.add_argument("--mode", choices=tuple(_MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print("RESULT " + json.dumps(run_mode(args.mode, args)))
+        return
+
+    print(f"{args.seconds:.0f}s, bot x{args.bot_concurrency}, {args.visitors} visitors x3 messages, "
+          f"quota {args.quota:.0f} model calls/s, model latency {args.llm_latency}s")
+    print(f"{'mode':11} {'visitors ok':>12} {'p50':>7} {'p99':>7} {'bot served':>11} "
+          f"{'model calls':>12} {'refused':>8} {'peak':>5}")
+    for mode in args.modes.split(","):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_admission", "--mode", mode,
+             "--seconds", str(args.seconds), "--bot-concurrency", str(args.bot_concurrency),
+             "--visitors", str(args.visitors), "--quota", str(args.quota),
+             "--llm-latency", str(args.llm_latency)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(l for l in out.splitlines() if l.startswith("RESULT "))
+        r = json.loads(line[len("RESULT "):])
+        print(
+            f"{mode:11} {r['visitor_ok']:5d}/{r['visitor_messages']:<6d} {r['visitor_p50']:6.2f}s "
+            f"{r['visitor_p99']:6.2f}s {r['bot_served']:11d} {r['model_calls']:12d} "
+            f"{r['quota_refused']:8d} {r['peak_model_calls']:5d}"
+        )
+        print(f"{'':11} visitors {r['visitor_outcomes']}  bot {r['bot_outcomes']}")
+        if r["admission"]:
+            print(f"{'':11} admission {r['admission']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Batch bookings versus one create_event per booking, against the local stub.
+
+    python -m benchmarks.bench_batch [--bookings 120] [--latency 0.05]
+
+Books the same list of meetings on a fresh stub per path, each in its own
+process (every request delayed by --latency, Meet links ready after
+--conference-delay):
+
+- sequential: create_event once per booking, as the chatbot does, with an
+  availability check before each one;
+- batch: one calendar_tools.create_events_batch call.
+
+Every tenth booking overlaps an existing event and every fifteenth
+overlaps the booking before it, so both paths also have to refuse
+conflicts. Reports wall time, HTTP round-trips (a batch counts as one),
+inserts, events created and the outcome counts.
+
+The batch path also runs with the slot of booking #2 offered to (held for)
+a chat visitor, and exits with status 1 unless that booking comes back as
+a conflict and the visitor can still book the slot.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+# Booking whose slot a chat visitor holds in the batch run
+_HELD = 2
+
+
+def _bookings(count: int, base: datetime.datetime):
+    bookings, existing = [], []
+    for i in range(count):
+        day, slot = divmod(i, 16)
+        start = base + datetime.timedelta(days=day, minutes=30 * slot)
+        if i % 15 == 14:
+            # Overlaps the previous booking of the batch
+            start -= datetime.timedelta(minutes=15)
+        end = start + datetime.timedelta(minutes=30)
+        if i % 10 == 9:
+            existing.append((start.isoformat(), end.isoformat()))
+        bookings.append({
+            "start_iso": start.isoformat(),
+            "end_iso": end.isoformat(),
+            "title": f"Intro call {i}",
+            "attendees": [f"lead{i}@example.com"],
+        })
+    return bookings, existing
+
+
+def run_mode(mode: str, count: int, latency: float, conference_delay: float) -> dict:
+    from benchmarks.calendar_stub import CalendarStub
+
+    stub = CalendarStub(latency=latency, conference_delay=conference_delay).start()
+    os.environ.update(
+        CALENDAR_API_ENDPOINT=stub.endpoint,
+        GOOGLE_CALENDAR_ID="primary",
+        AVAILABILITY_BACKEND="freebusy",
+    )
+
+    from dateutil import tz as dateutil_tz
+    from google.oauth2.credentials import Credentials
+
+    from availability import busy_intervals, iso_to_epoch
+    from bookings import current_conversation
+    from calendar_service import get_manager
+    from calendar_tools import create_event, create_events_batch
+    from config import DEFAULT_TIMEZONE
+    from holds import offer, reserve
+
+    get_manager().set_credentials(Credentials(token="offline"))
+    zone = dateutil_tz.gettz(DEFAULT_TIMEZONE)
+    base = datetime.datetime.now(zone).replace(hour=9, minute=0, second=0, microsecond=0)
+    requested, existing = _bookings(count, base + datetime.timedelta(days=1))
+    for start_iso, end_iso in existing:
+        stub.add_event(start_iso, end_iso)
+    setup_requests = len(stub.requests)
+    held = requested[_HELD]
+    held_slot = (iso_to_epoch(held["start_iso"]), iso_to_epoch(held["end_iso"]))
+    held_status = visitor_booked = None
+
+    started = time.perf_counter()
+    try:
+        if mode == "batch":
+            # A chat visitor was just offered the slot of booking _HELD
+            token = current_conversation.set("visitor")
+            try:
+                offer([held_slot], 1)
+            finally:
+                current_conversation.reset(token)
+            results = create_events_batch(requested)
+            outcomes = Counter(r["status"] for r in results)
+            held_status = results[_HELD]["status"]
+        else:
+            outcomes = Counter()
+            booked = []
+            for booking in requested:
+                start, end = iso_to_epoch(booking["start_iso"]), iso_to_epoch(booking["end_iso"])
+                if busy_intervals(booking["start_iso"], booking["end_iso"]) or any(
+                    s < end and start < e for s, e in booked
+                ):
+                    outcomes["conflict"] += 1
+                    continue
+                create_event(booking["title"], booking["start_iso"], booking["end_iso"], booking["attendees"])
+                booked.append((start, end))
+                outcomes["created"] += 1
+        elapsed = time.perf_counter() - started
+        if mode == "batch":
+            # The visitor books the slot held for them
+            token = current_conversation.set("visitor")
+            try:
+                with reserve(*held_slot, "visitor-booking"):
+                    create_event("Visitor call", held["start_iso"], held["end_iso"], ["visitor@example.com"])
+                visitor_booked = True
+            except Exception as e:
+                print(f"visitor booking failed: {e}")
+                visitor_booked = False
+            finally:
+                current_conversation.reset(token)
+    finally:
+        stub.stop()
+
+    requests = stub.requests[setup_requests:]
+    inserts = sum(1 for m, p in requests + stub.batched if m == "POST" and p.endswith("/events"))
+    return {
+        "seconds": elapsed,
+        "round_trips": len(requests),
+        "inserts": inserts,
+        "events": len(stub._events) - len(existing),
+        "outcomes": dict(outcomes),
+        "held_slot": held_status,
+        "visitor_booked": visitor_booked,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bookings", type=int, default=120)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--conference-delay", type=float, default=0.3)
+    parser.add_argument("--mode", choices=("sequential", "batch"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = run_mode(args.mode, args.bookings, args.latency, args.conference_delay)
+        print("RESULT " + json.dumps(result))
+        return
+
+    print(f"bookings={args.bookings} latency={args.latency * 1000:.0f}ms "
+          f"conference delay={args.conference_delay}s")
+    print(f"{'path':11} {'seconds':>8} {'round-trips':>12} {'inserts':>8} {'events':>7}  outcomes")
+    held_ok = False
+    for mode in ("sequential", "batch"):
+        # Settings are read at import, so each path runs in its own process
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_batch", "--mode", mode,
+             "--bookings", str(args.bookings), "--latency", str(args.latency),
+             "--conference-delay", str(args.conference_delay)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(l for l in out.splitlines() if l.startswith("RESULT "))
+        r = json.loads(line[len("RESULT "):])
+        print(
+            f"{mode:11} {r['seconds']:8.2f} {r['round_trips']:12d} {r['inserts']:8d} "
+            f"{r['events']:7d}  {r['outcomes']}"
+        )
+        if mode == "batch":
+            held_ok = r["held_slot"] == "conflict" and r["visitor_booked"]
+            print(f"slot held for a visitor: batch -> {r['held_slot']}, visitor booked it: "
+                  f"{r['visitor_booked']}  {'ok' if held_ok else 'WRONG'}")
+    sys.exit(0 if held_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
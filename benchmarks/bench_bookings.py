@@ -0,0 +1,68 @@
+"""
+Duplicate bookings and Calendar API calls, against the local stub.
+
+    python -m benchmarks.bench_bookings [--bookings 20] [--conference-delay 0.6]
+
+For each booking the scenario repeats what happens in production:
+create_meeting called twice in the same turn (a repeated LLM tool call),
+then once more from a "different worker" (empty ledger, e.g. a retried
+request routed elsewhere). Reports events created per booking, the API
+calls actually sent and the booking ledger counters.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+from collections import Counter
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bookings", type=int, default=20)
+    parser.add_argument("--conference-delay", type=float, default=0.6)
+    args = parser.parse_args()
+
+    from benchmarks.calendar_stub import CalendarStub
+
+    stub = CalendarStub(conference_delay=args.conference_delay).start()
+    os.environ.update(
+        CALENDAR_API_ENDPOINT=stub.endpoint,
+        GOOGLE_CALENDAR_ID=os.getenv("GOOGLE_CALENDAR_ID", "primary"),
+    )
+
+    from google.oauth2.credentials import Credentials
+
+    import bookings
+    from calendar_service import get_manager
+    from calendar_tools import create_event
+
+    get_manager().set_credentials(Credentials(token="offline"))
+    base = datetime.datetime.now().replace(minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+    try:
+        links = 0
+        for i in range(args.bookings):
+            start = (base + datetime.timedelta(hours=i)).isoformat()
+            end = (base + datetime.timedelta(hours=i, minutes=30)).isoformat()
+            key = bookings.booking_key(f"conversation-{i}", start, end, ["guest@example.com"])
+            for attempt in range(3):
+                if attempt == 2:
+                    # Another worker: nothing in its local ledger
+                    bookings.get_ledger()._entries.clear()
+                event = create_event("Bench call", start, end, ["guest@example.com"], idempotency_key=key)
+            links += bool(event.get("hangoutLink"))
+    finally:
+        stub.stop()
+
+    created = sum(1 for m, p in stub.requests if m == "POST" and p.endswith("/events"))
+    calls = Counter(m for m, _ in stub.requests)
+    events = len(stub._events)
+    print(f"bookings={args.bookings} create_meeting calls={args.bookings * 3}")
+    print(f"events in calendar: {events} (duplicates: {events - args.bookings})   with Meet link: {links}")
+    print(f"API calls sent: {len(stub.requests)}  inserts: {created}  by method: {dict(calls)}")
+    print(f"ledger: {bookings.get_ledger().stats()}")
+
+
+if __name__ == "__main__":
+    main()
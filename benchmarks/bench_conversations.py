@@ -0,0 +1,272 @@
+"""
+Offline end-to-end benchmark: scripted booking conversations through /api/chat.
+
+    python -m benchmarks.bench_conversations [--conversations 40] [--concurrency 8]
+        [--llm-latency 0.3] [--calendar-latency 0.05] [--density 6]
+        [--no-fast-path] [--output results.json] [--compare baseline.json]
+
+The agent is the production one (real tools, prompt and middleware) with
+Gemini replaced by benchmarks.fake_llm.ReplayChatModel playing back
+benchmarks/fixtures/booking_conversations.json, and Calendar replaced by
+benchmarks.calendar_stub with `density` busy events per working day. Each
+conversation uses its own Flask test client (its own session cookie). The
+scripts are replayed in rounds, one working day per round, so a round's
+holds and bookings never meet another round's.
+
+Reports throughput, p50/p95/p99 turn latency, LLM and Calendar calls per
+booking, bytes transferred and estimated LLM input tokens per turn (~4
+characters per token, in total and from tool results), and writes them as JSON (tagged with the
+current commit) so runs can be compared across commits with --compare.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(ROOT, "benchmarks", "fixtures", "booking_conversations.json")
+
+# Shown side by side by --compare (dotted paths into "results")
+_COMPARED = (
+    "throughput_turns_per_s",
+    "latency_ms.p50",
+    "latency_ms.p95",
+    "latency_ms.p99",
+    "llm_calls_per_booking",
+    "llm_input_tokens_per_turn.total",
+    "llm_input_tokens_per_turn.tool_results",
+    "calendar_calls_per_booking",
+    "bytes.llm_prompt",
+    "bytes.llm_tool_results",
+    "bytes.calendar_out",
+    "bytes.chat",
+)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _booking_days(timezone: str, count: int) -> List[datetime.date]:
+    """
+    `count` weekdays, the first at least two days out so every scripted slot
+    is in the future.
+    """
+    from dateutil import tz as dateutil_tz
+
+    days: List[datetime.date] = []
+    day = datetime.datetime.now(dateutil_tz.gettz(timezone)).date() + datetime.timedelta(days=1)
+    while len(days) < count:
+        day += datetime.timedelta(days=1)
+        if day.weekday() < 5:
+            days.append(day)
+    return days
+
+
+def load_fixture(path: str, day: datetime.date) -> Dict[str, Any]:
+    """
+    The fixture at `path` with the date placeholders filled in: its
+    "conversations" and the "free" (start, end) windows their replies
+    treat as free.
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    values = {
+        "{date}": day.isoformat(),
+        "{date_text}": day.strftime("%b %d").replace(" 0", " "),
+        "{weekday}": day.strftime("%A"),
+    }
+    for placeholder, value in values.items():
+        text = text.replace(placeholder, value)
+    return json.loads(text)
+
+
+def recordings(conversations: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """User message -> recorded model steps, for ReplayChatModel."""
+    recorded: Dict[str, List[Dict[str, Any]]] = {}
+    for conversation in conversations:
+        for turn in conversation["turns"]:
+            user = turn["user"].strip()
+            if user in recorded and recorded[user] != turn["model"]:
+                raise ValueError(f"Fixture records two different answers to {user!r}")
+            recorded[user] = turn["model"]
+    return recorded
+
+
+def _commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT, capture_output=True, text=True, timeout=10,
+        )
+        return out.stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def _lookup(results: Dict[str, Any], dotted: str) -> Any:
+    value: Any = results
+    for part in dotted.split("."):
+        value = (value or {}).get(part)
+    return value
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    print(f"\n{'metric':30} {baseline.get('commit', '?'):>14} {current.get('commit', '?'):>14}   change")
+    for name in _COMPARED:
+        old, new = _lookup(baseline["results"], name), _lookup(current["results"], name)
+        change = f"{(new - old) / old:+.1%}" if old and new is not None else ""
+        print(f"{name:30} {old!s:>14} {new!s:>14}   {change}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--conversations", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--calendar-latency", type=float, default=0.05)
+    parser.add_argument("--density", type=int, default=6, help="busy events per working day")
+    parser.add_argument("--fixture", default=FIXTURE)
+    parser.add_argument("--no-fast-path", action="store_true")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    args = parser.parse_args()
+
+    from benchmarks.calendar_stub import CalendarStub
+
+    stub = CalendarStub(latency=args.calendar_latency).start()
+    os.environ.update(
+        CALENDAR_API_ENDPOINT=stub.endpoint,
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID=os.getenv("GOOGLE_CALENDAR_ID", "primary"),
+        CONVERSATION_STORE="memory://",
+    )
+    if args.no_fast_path:
+        os.environ["FAST_PATH_ENABLED"] = "false"
+
+    from google.oauth2.credentials import Credentials
+
+    import chat_service
+    import fast_path
+    from benchmarks.fake_llm import ReplayChatModel
+    from calendar_service import get_manager
+    from chatbot import build_agent
+    from config import DEFAULT_TIMEZONE, RESPONSE_CACHE_ENABLED
+    from response_cache import get_cache
+
+    scripts_per_round = len(load_fixture(args.fixture, datetime.date.today())["conversations"])
+    days = _booking_days(DEFAULT_TIMEZONE, -(-args.conversations // scripts_per_round))
+    fixtures = [load_fixture(args.fixture, day) for day in days]
+    conversations = [c for fixture in fixtures for c in fixture["conversations"]]
+    model = ReplayChatModel(recordings=recordings(conversations), latency=args.llm_latency)
+    chat_service.agent = build_agent(llm=model)
+    get_manager().set_credentials(Credentials(token="offline"))
+    # Busy events stay clear of the times the replayed replies offer and book
+    busy_events = stub.populate(
+        days=(days[-1] - datetime.date.today()).days + 1,
+        events_per_day=args.density,
+        timezone=DEFAULT_TIMEZONE,
+        keep_free=[window for fixture in fixtures for window in fixture["free"]],
+    )
+
+    from app import app
+
+    latencies: List[float] = []
+    chat_bytes = [0]
+    errors = Counter()
+    lock = threading.Lock()
+
+    def converse(script: Dict[str, Any]) -> None:
+        client = app.test_client()
+        for turn in script["turns"]:
+            body = json.dumps({"message": turn["user"]}).encode("utf-8")
+            started = time.perf_counter()
+            response = client.post("/api/chat", data=body, content_type="application/json")
+            elapsed = time.perf_counter() - started
+            reply = (response.get_json(silent=True) or {}).get("reply", "")
+            with lock:
+                latencies.append(elapsed)
+                chat_bytes[0] += len(body) + len(response.data)
+                if response.status_code != 200 or reply == chat_service.ERROR_REPLY:
+                    errors[script["name"]] += 1
+
+    scripts = conversations[:args.conversations]
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(converse, scripts))
+        wall = time.perf_counter() - started
+    finally:
+        stub.stop()
+
+    llm = model.stats()
+    inserts = sum(1 for m, p in stub.requests if m == "POST" and p.endswith("/events"))
+    bookings = max(inserts, 1)
+    results = {
+        "conversations": len(scripts),
+        "turns": len(latencies),
+        "bookings": inserts,
+        "errors": sum(errors.values()),
+        "replay_misses": llm["misses"],
+        "fast_path": {k: fast_path.stats()[k] for k in ("hits", "misses")},
+        "response_cache": get_cache().stats() if RESPONSE_CACHE_ENABLED else None,
+        "busy_events": busy_events,
+        "wall_seconds": round(wall, 3),
+        "throughput_turns_per_s": round(len(latencies) / wall, 2),
+        "throughput_conversations_per_s": round(len(scripts) / wall, 2),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1),
+            "p50": round(_percentile(latencies, 50) * 1000, 1),
+            "p95": round(_percentile(latencies, 95) * 1000, 1),
+            "p99": round(_percentile(latencies, 99) * 1000, 1),
+        },
+        "llm_calls": llm["calls"],
+        "llm_calls_per_booking": round(llm["calls"] / bookings, 2),
+        # Same estimate as conversation_context.estimate_tokens
+        "llm_input_tokens_per_turn": {
+            "total": round(llm["prompt_bytes"] / 4 / len(latencies), 1),
+            "tool_results": round(llm["tool_result_bytes"] / 4 / len(latencies), 1),
+        },
+        "calendar_calls": len(stub.requests),
+        "calendar_calls_per_booking": round(len(stub.requests) / bookings, 2),
+        "calendar_calls_by_method": dict(Counter(m for m, _ in stub.requests)),
+        "bytes": {
+            "chat": chat_bytes[0],
+            "calendar_in": stub.bytes_in,
+            "calendar_out": stub.bytes_out,
+            "llm_prompt": llm["prompt_bytes"],
+            "llm_tool_results": llm["tool_result_bytes"],
+            "llm_completion": llm["completion_bytes"],
+        },
+    }
+    report = {
+        "commit": _commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"wrote {args.output}")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
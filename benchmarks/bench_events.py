@@ -0,0 +1,327 @@
+"""
+Busy-index sync of a large calendar: bytes, parse time and memory.
+
+    python -m benchmarks.bench_events [--events 10000] [--days 60]
+
+Fills the Calendar stub with --events instances of recurring meetings, as
+Calendar returns them: summary, description, a dozen attendees,
+organizer, conference data, links, plus some all-day, cancelled and
+"free" (transparent) events. Then syncs a busy index of it, each way in
+its own process:
+
+- legacy: the previous sync, which requested full event resources,
+  collected every page before converting, parsed times with dateutil and
+  kept the snapshot as lists of floats;
+- current: availability.BusyIndex, which asks for id/status/transparency/
+  start/end only, converts page by page, parses with fromisoformat and
+  keeps the snapshot in array('d').
+
+Reports the bytes received, the sync time, the parse time alone (JSON
+decode and conversion of the pages, fetched beforehand), and the peak and
+retained Python memory of the sync (tracemalloc). The stub serves from a
+child process so its own allocations are not counted.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from typing import Any, Dict, List
+from urllib.parse import urlencode
+
+_TIMEZONE = "Asia/Kolkata"
+_CALENDAR = "primary"
+_PAGE_SIZE = 2500
+
+
+def fill(stub, events: int, days: int, seed: int = 0) -> None:
+    """Add `events` realistic instances of recurring meetings over `days` days."""
+    from dateutil import tz as dateutil_tz
+
+    rng = random.Random(seed)
+    zone = dateutil_tz.gettz(_TIMEZONE)
+    today = datetime.datetime.now(zone).replace(hour=0, minute=0, second=0, microsecond=0)
+    people = [f"person{n}@example.com" for n in range(200)]
+    series = [f"series{n:04d}" for n in range(max(1, events // 40))]
+    for n in range(events):
+        day = today + datetime.timedelta(days=rng.randrange(days))
+        recurring = rng.choice(series)
+        fields: Dict[str, Any] = {
+            "id": f"{recurring}_{n:06d}",
+            "summary": f"Weekly sync {recurring}",
+            "description": "Agenda: updates, blockers, next steps. " * 4,
+            "htmlLink": f"https://www.google.com/calendar/event?eid={recurring}{n}",
+            "iCalUID": f"{recurring}@google.com",
+            "recurringEventId": recurring,
+            "created": "2024-01-01T00:00:00.000Z",
+            "updated": "2024-06-01T00:00:00.000Z",
+            "creator": {"email": people[0]},
+            "organizer": {"email": people[0], "self": True},
+            "attendees": [
+                {"email": email, "responseStatus": rng.choice(("accepted", "needsAction"))}
+                for email in rng.sample(people, 12)
+            ],
+            "conferenceData": {
+                "conferenceId": "abc-defg-hij",
+                "entryPoints": [
+                    {"entryPointType": "video", "uri": "https://meet.google.com/abc-defg-hij"}
+                ],
+                "conferenceSolution": {"name": "Google Meet"},
+            },
+            "reminders": {"useDefault": True},
+        }
+        if n % 50 == 0:
+            # All-day event
+            start = {"date": day.date().isoformat()}
+            end = {"date": (day.date() + datetime.timedelta(days=1)).isoformat()}
+            stub.add_event("", "", start=start, end=end, **fields)
+            continue
+        if n % 20 == 0:
+            fields["status"] = "cancelled"
+        elif n % 10 == 0:
+            fields["transparency"] = "transparent"
+        begin = day + datetime.timedelta(minutes=8 * 60 + 15 * rng.randrange(40))
+        finish = begin + datetime.timedelta(minutes=rng.choice((15, 30, 45, 60)))
+        stub.add_event(begin.isoformat(), finish.isoformat(), **fields)
+
+
+# ------------- Legacy sync -------------
+
+
+def legacy_interval(event: Dict[str, Any]):
+    from dateutil import parser as date_parser
+    from dateutil import tz as dateutil_tz
+
+    if event.get("status") == "cancelled" or event.get("transparency") == "transparent":
+        return None
+    bounds = []
+    for when in (event.get("start", {}), event.get("end", {})):
+        if when.get("dateTime"):
+            dt = date_parser.isoparse(when["dateTime"])
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=dateutil_tz.gettz(_TIMEZONE))
+        elif when.get("date"):
+            zone = dateutil_tz.gettz(when.get("timeZone") or _TIMEZONE)
+            dt = date_parser.isoparse(when["date"]).replace(tzinfo=zone)
+        else:
+            return None
+        bounds.append(dt.timestamp())
+    if bounds[1] <= bounds[0]:
+        return None
+    return bounds[0], bounds[1]
+
+
+class LegacyIndex:
+    def __init__(self, service_factory, horizon_days: int):
+        self._service_factory = service_factory
+        self._horizon = horizon_days * 86400
+        self._events: Dict[str, Any] = {}
+        self._snapshot = ([], [], 0.0)
+
+    def sync(self) -> None:
+        from availability import epoch_to_iso
+
+        now = time.time()
+        items: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            result = self._service_factory().events().list(
+                calendarId=_CALENDAR,
+                singleEvents=True,
+                maxResults=_PAGE_SIZE,
+                pageToken=page_token,
+                timeMin=epoch_to_iso(now - 86400, _TIMEZONE),
+                timeMax=epoch_to_iso(now + self._horizon, _TIMEZONE),
+            ).execute()
+            items.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+        events = {}
+        for event in items:
+            interval = legacy_interval(event)
+            if interval:
+                events[event["id"]] = interval
+        self._events = events
+        intervals = sorted(events.values())
+        starts = [s for s, _ in intervals]
+        ends = [e for _, e in intervals]
+        self._snapshot = (starts, ends, max((e - s for s, e in intervals), default=0.0))
+
+    def busy_between(self, start: float, end: float):
+        starts, ends, longest = self._snapshot
+        i = bisect.bisect_left(starts, start - longest)
+        stop = bisect.bisect_left(starts, end)
+        return [(starts[j], ends[j]) for j in range(i, stop) if ends[j] > start]
+
+
+# ------------- Measurement -------------
+
+
+def _serve(conn, events: int, days: int) -> None:
+    """Child process: run a filled stub; answer "bytes" with bytes_out until "stop"."""
+    from benchmarks.calendar_stub import CalendarStub
+
+    stub = CalendarStub(page_size=_PAGE_SIZE).start()
+    fill(stub, events, days)
+    conn.send(stub.endpoint)
+    while conn.recv() != "stop":
+        conn.send(stub.bytes_out)
+    stub.stop()
+
+
+def _raw_pages(endpoint: str, days: int, fields: str = "") -> List[bytes]:
+    """The list responses of a full sync, as bytes."""
+    from availability import epoch_to_iso
+
+    now = time.time()
+    pages, token = [], ""
+    while True:
+        query = {
+            "singleEvents": "true",
+            "maxResults": _PAGE_SIZE,
+            "timeMin": epoch_to_iso(now - 86400, _TIMEZONE),
+            "timeMax": epoch_to_iso(now + days * 86400, _TIMEZONE),
+        }
+        if token:
+            query["pageToken"] = token
+        if fields:
+            query["fields"] = fields
+        url = f"{endpoint}calendars/{_CALENDAR}/events?{urlencode(query)}"
+        with urllib.request.urlopen(url) as response:
+            body = response.read()
+        pages.append(body)
+        token = json.loads(body).get("nextPageToken")
+        if not token:
+            return pages
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve, args=(child_conn, args.events, args.days))
+    server.start()
+    endpoint = conn.recv()
+
+    def bytes_out() -> int:
+        conn.send("bytes")
+        return conn.recv()
+
+    os.environ.update(
+        CALENDAR_API_ENDPOINT=endpoint,
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID=_CALENDAR,
+        DEFAULT_TIMEZONE=_TIMEZONE,
+        AVAILABILITY_SYNC_HORIZON_DAYS=str(args.days),
+    )
+
+    import httplib2
+    from googleapiclient import discovery_cache
+    from googleapiclient.discovery import build_from_document
+
+    from availability import BusyIndex, event_interval
+    from calendar_tools import BUSY_EVENT_FIELDS
+
+    # One service for both, built outside the measurement
+    service = build_from_document(
+        json.loads(discovery_cache.get_static_doc("calendar", "v3")),
+        http=httplib2.Http(), client_options={"api_endpoint": endpoint},
+    )
+
+    if mode == "legacy":
+        index = LegacyIndex(lambda: service, args.days)
+        fields = ""
+
+        def convert(event):
+            return legacy_interval(event)
+    else:
+        index = BusyIndex(
+            calendar_id=_CALENDAR, service_factory=lambda: service,
+            horizon_days=args.days, timezone=_TIMEZONE,
+        )
+        fields = f"nextPageToken,nextSyncToken,items({BUSY_EVENT_FIELDS})"
+
+        def convert(event):
+            return event_interval(event, _TIMEZONE)
+
+    # Parse time alone, on pages fetched up front
+    pages = _raw_pages(endpoint, args.days, fields)
+    parse_seconds = float("inf")
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        for body in pages:
+            for event in json.loads(body).get("items", []):
+                convert(event)
+        parse_seconds = min(parse_seconds, time.perf_counter() - started)
+    del pages
+
+    bytes_before = bytes_out()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    index.sync()
+    sync_seconds = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    received = bytes_out() - bytes_before
+
+    # Same answers either way
+    now = time.time()
+    busy = sum(len(index.busy_between(now + d * 86400, now + (d + 1) * 86400)) for d in range(args.days))
+    conn.send("stop")
+    server.join()
+    return {
+        "intervals": len(index._events),
+        "busy_by_day": busy,
+        "bytes": received,
+        "sync_seconds": sync_seconds,
+        "parse_seconds": parse_seconds,
+        "peak_bytes": peak - baseline,
+        "retained_bytes": retained - baseline,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--modes", default="legacy,current")
+    parser.add_argument("--mode", choices=("legacy", "current"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print("RESULT " + json.dumps(run_mode(args.mode, args)))
+        return
+
+    print(f"{args.events} events over {args.days} days, pages of {_PAGE_SIZE}")
+    print(f"{'mode':8} {'intervals':>9} {'received':>10} {'sync':>8} {'parse':>8} "
+          f"{'peak mem':>10} {'retained':>10}")
+    for mode in args.modes.split(","):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_events", "--mode", mode,
+             "--events", str(args.events), "--days", str(args.days),
+             "--repeat", str(args.repeat)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(l for l in out.splitlines() if l.startswith("RESULT "))
+        r = json.loads(line[len("RESULT "):])
+        print(
+            f"{mode:8} {r['intervals']:9d} {r['bytes'] / 1e6:8.2f}MB {r['sync_seconds'] * 1e3:6.0f}ms "
+            f"{r['parse_seconds'] * 1e3:6.0f}ms {r['peak_bytes'] / 1e6:8.2f}MB "
+            f"{r['retained_bytes'] / 1e6:8.2f}MB"
+        )
+        print(f"{'':8} busy intervals found day by day: {r['busy_by_day']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Booking-turn latency with follow-ups inline vs. in background jobs.
+
+    python -m benchmarks.bench_followups [--bookings 12] [--calendar-latency 0.15]
+                                         [--conference-delay 1.0] [--invite-latency 0.3]
+
+Books --bookings meetings through the fast path of POST /api/chat (Flask
+test client, one conversation each) against the local Calendar stub, whose
+requests take --calendar-latency seconds, whose Meet links take
+--conference-delay seconds to be created and whose inserts/patches that
+email guests take --invite-latency seconds more. Each setting runs in its
+own process:
+
+- inline: BOOKING_JOBS_ENABLED off; the turn inserts with invitations and
+  polls until the Meet link exists;
+- jobs: BOOKING_JOBS_ENABLED on; the turn confirms after the insert and the
+  widget long-polls GET /api/chat/updates for the link.
+
+Reports the booking-turn latency, the time until the visitor sees the Meet
+link, and the links and invitations that went out.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+_MODES = ("inline", "jobs")
+
+
+def _messages(count: int) -> List[str]:
+    """Fully specified booking requests on free working-hour slots."""
+    day = datetime.date.today()
+    messages: List[str] = []
+    while len(messages) < count:
+        day += datetime.timedelta(days=1)
+        if day.weekday() >= 5:
+            continue
+        for hour in (10, 11, 12, 14, 15, 16):
+            if len(messages) < count:
+                clock = f"{hour - 12}pm" if hour > 12 else f"{hour}{'pm' if hour == 12 else 'am'}"
+                messages.append(
+                    f"Book a 30 minute call on {day.isoformat()} at {clock}. "
+                    f"My email is guest{len(messages)}@example.com"
+                )
+    return messages
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.calendar_stub import CalendarStub
+
+    stub = CalendarStub(latency=args.calendar_latency, conference_delay=args.conference_delay)
+    stub.invite_latency = args.invite_latency
+    stub.start()
+    journal = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    os.environ.update(
+        CALENDAR_API_ENDPOINT=stub.endpoint,
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID=os.getenv("GOOGLE_CALENDAR_ID", "primary"),
+        CONVERSATION_STORE="memory://",
+        BOOKING_JOBS_ENABLED="true" if mode == "jobs" else "false",
+        BOOKING_JOBS_JOURNAL=journal,
+    )
+
+    from google.oauth2.credentials import Credentials
+
+    import app as flask_app
+    import benchmarks.fake_agent  # noqa: F401  (offline agent for anything off the fast path)
+    from calendar_service import get_manager
+
+    get_manager().set_credentials(Credentials(token="offline"))
+    flask_app._ready.wait(60)
+
+    turns: List[float] = []
+    to_link: List[float] = []
+    replies: Dict[str, int] = {"fast_path": 0, "other": 0}
+    try:
+        for message in _messages(args.bookings):
+            client = flask_app.app.test_client()
+            started = time.perf_counter()
+            body = client.post("/api/chat", json={"message": message}).get_json()
+            turns.append(time.perf_counter() - started)
+            replies["fast_path" if "booked the meeting" in body["reply"] else "other"] += 1
+            if "meet.google.com" in body["reply"]:
+                to_link.append(turns[-1])
+                continue
+            # What the widget does: long-poll until the link is there
+            seen = 0
+            while body.get("pending_updates") or body.get("pending"):
+                body = client.get(f"/api/chat/updates?seen={seen}&wait=20").get_json()
+                if any(u["meet_link"] for u in body["updates"]):
+                    to_link.append(time.perf_counter() - started)
+                    break
+                seen = len(body["updates"])
+        if mode == "jobs":
+            from jobs import get_queue
+
+            # Let the invitations still queued go out before counting them
+            deadline = time.time() + 30
+            while get_queue().stats()["queued"] and time.time() < deadline:
+                time.sleep(0.1)
+            time.sleep(args.invite_latency + args.calendar_latency + 0.5)
+            jobs = get_queue().stats()
+        else:
+            jobs = {}
+    finally:
+        stub.stop()
+
+    return {
+        "turn_p50": statistics.median(turns),
+        "turn_max": max(turns),
+        "link_p50": statistics.median(to_link) if to_link else float("nan"),
+        "links": len(to_link),
+        "bookings": len(turns),
+        "replies": replies,
+        "invitations": stub.invitations,
+        "events": len(stub._events),
+        "jobs": jobs,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bookings", type=int, default=12)
+    parser.add_argument("--calendar-latency", type=float, default=0.15)
+    parser.add_argument("--conference-delay", type=float, default=1.0)
+    parser.add_argument("--invite-latency", type=float, default=0.3)
+    parser.add_argument("--modes", default=",".join(_MODES))
+    parser.add_argument("--mode", choices=_MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print("RESULT " + json.dumps(run_mode(args.mode, args)))
+        return
+
+    print(f"{args.bookings} bookings, calendar latency {args.calendar_latency}s, "
+          f"Meet link after {args.conference_delay}s, invitations +{args.invite_latency}s")
+    print(f"{'mode':7} {'turn p50':>9} {'turn max':>9} {'link p50':>9} {'links':>7} "
+          f"{'invites':>8} {'events':>7}")
+    for mode in args.modes.split(","):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_followups", "--mode", mode,
+             "--bookings", str(args.bookings), "--calendar-latency", str(args.calendar_latency),
+             "--conference-delay", str(args.conference_delay),
+             "--invite-latency", str(args.invite_latency)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(l for l in out.splitlines() if l.startswith("RESULT "))
+        r = json.loads(line[len("RESULT "):])
+        print(
+            f"{mode:7} {r['turn_p50'] * 1000:7.0f}ms {r['turn_max'] * 1000:7.0f}ms "
+            f"{r['link_p50'] * 1000:7.0f}ms {r['links']:3d}/{r['bookings']:<3d} "
+            f"{r['invitations']:8d} {r['events']:7d}"
+        )
+        if r["replies"]["other"]:
+            print(f"{'':7} replies {r['replies']}")
+        if r["jobs"]:
+            print(f"{'':7} jobs {r['jobs']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Concurrency stress test of slot holds: double bookings under load.
+
+    python -m benchmarks.bench_holds [--processes 4] [--conversations 12] [--days 3]
+                                     [--arrival 3] [--popular 0.3] [--think 0.5]
+
+Runs --processes worker processes (like gunicorn workers) with
+--conversations simulated conversations each against one Calendar stub,
+arriving within --arrival seconds. Every conversation does what the agent does: call
+find_free_slots for the next --days working days, wait up to --think
+seconds (the visitor choosing), then create_meeting for the first slot
+offered, or, with probability --popular, for the same "popular" slot
+everyone asks for by name (10:00 on the first day). When create_meeting
+answers that the slot was taken, the conversation books the first
+alternative it offered, up to three times. There are about as many free
+slots (18 a day) as conversations.
+
+Each setting runs in its own process:
+
+- legacy: SLOT_HOLDS_ENABLED off (no check at booking time);
+- memory: SLOT_HOLDS_STORE=memory://, which covers one process, so all
+  conversations run in one worker;
+- sqlite: holds shared by the workers (SLOT_HOLDS_STORE=sqlite:///...);
+- claims: sqlite without offer holds (SLOT_HOLD_TTL_SECONDS=0): bookings
+  are still checked atomically, but offers aren't reserved.
+
+Reports bookings, double-booked events (events overlapping another one in
+the calendar), taken slots answered with alternatives and booked from
+them, conversations that found nothing free, and create_meeting latency.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+_MODES = ("legacy", "memory", "sqlite", "claims")
+_ROUNDS = 3
+
+
+def _working_days(count: int) -> List[datetime.date]:
+    days: List[datetime.date] = []
+    day = datetime.date.today()
+    while len(days) < count:
+        day += datetime.timedelta(days=1)
+        if day.weekday() < 5:
+            days.append(day)
+    return days
+
+
+# ------------- Worker process -------------
+
+
+def _conversation(name: str, args: argparse.Namespace, outcomes: Counter, latencies: List[float]) -> None:
+    from dateutil import tz as dateutil_tz
+
+    from bookings import current_conversation
+    from chatbot import SLOT_TAKEN_ERROR, create_meeting_tool, find_free_slots_tool
+    from tenants import current
+    from tool_format import slot_times
+
+    current_conversation.set(name)
+    rng = random.Random(name)
+    time.sleep(rng.uniform(0, args.arrival))
+    zone = dateutil_tz.gettz(current().timezone)
+    days = _working_days(args.days)
+    first = datetime.datetime.combine(days[0], datetime.time(0, 0), zone)
+    last = datetime.datetime.combine(days[-1], datetime.time(23, 59), zone)
+
+    offered = slot_times(json.loads(find_free_slots_tool.func(
+        start_iso=first.isoformat(), end_iso=last.isoformat(), duration_minutes=30, max_slots=3,
+    )))
+    if rng.random() < args.popular:
+        popular = datetime.datetime.combine(days[0], datetime.time(10, 0), zone)
+        slot = [popular.isoformat(), (popular + datetime.timedelta(minutes=30)).isoformat()]
+    elif offered:
+        slot = offered[0]
+    else:
+        outcomes["no_slot"] += 1
+        return
+    time.sleep(rng.uniform(0, args.think))
+
+    for attempt in range(_ROUNDS):
+        started = time.perf_counter()
+        try:
+            reply = create_meeting_tool.func(
+                start_iso=slot[0], end_iso=slot[1], attendees=f"{name}@example.com"
+            )
+        except Exception as e:
+            outcomes["error"] += 1
+            print(f"{name}: {type(e).__name__}: {e}", file=sys.stderr)
+            return
+        latencies.append(time.perf_counter() - started)
+        if not reply.startswith(SLOT_TAKEN_ERROR):
+            outcomes["booked" if attempt == 0 else "booked_alternative"] += 1
+            return
+        outcomes["taken"] += 1
+        alternatives = slot_times(json.loads(reply[reply.index("{"):]))
+        if not alternatives:
+            outcomes["no_slot"] += 1
+            return
+        slot = alternatives[0]
+    outcomes["gave_up"] += 1
+
+
+def run_worker(args: argparse.Namespace) -> Dict[str, Any]:
+    from google.oauth2.credentials import Credentials
+
+    from availability import get_index
+    from calendar_service import get_manager
+
+    get_manager().set_credentials(Credentials(token="offline"))
+    # Seed the busy index before the start line, as the warm-up thread does
+    get_index().sync()
+    outcomes: Counter = Counter()
+    latencies: List[float] = []
+    threads = [
+        threading.Thread(
+            target=_conversation, args=(f"w{args.worker}c{n}", args, outcomes, latencies)
+        )
+        for n in range(args.conversations)
+    ]
+    time.sleep(max(0.0, args.start_at - time.time()))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"outcomes": dict(outcomes), "latencies": latencies}
+
+
+# ------------- Mode -------------
+
+
+def _double_booked(events: List[Dict[str, Any]]) -> int:
+    """Events overlapping at least one other event."""
+    from benchmarks.calendar_stub import _end_key, _start_key
+
+    intervals = sorted((_start_key(e), _end_key(e)) for e in events)
+    overlapping = set()
+    for i, (start, end) in enumerate(intervals):
+        for j in range(i + 1, len(intervals)):
+            if intervals[j][0] >= end:
+                break
+            overlapping.update((i, j))
+    return len(overlapping)
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.calendar_stub import CalendarStub
+
+    stub = CalendarStub(latency=args.calendar_latency, conference_delay=0.2).start()
+    processes, conversations = args.processes, args.conversations
+    if mode == "memory":
+        processes, conversations = 1, args.processes * args.conversations
+    env = dict(
+        os.environ,
+        CALENDAR_API_ENDPOINT=stub.endpoint,
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID=os.getenv("GOOGLE_CALENDAR_ID", "primary"),
+        SLOT_HOLDS_ENABLED="false" if mode == "legacy" else "true",
+        SLOT_HOLDS_STORE=(
+            "memory://" if mode in ("legacy", "memory")
+            else f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'holds.db')}"
+        ),
+        SLOT_HOLD_TTL_SECONDS="0" if mode == "claims" else os.getenv("SLOT_HOLD_TTL_SECONDS", "180"),
+    )
+    # Leaves every worker time to import and seed its index
+    start_at = time.time() + 10
+    outcomes: Counter = Counter()
+    latencies: List[float] = []
+    try:
+        workers = [
+            subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.bench_holds", "--worker", str(n),
+                 "--start-at", str(start_at), "--conversations", str(conversations),
+                 "--days", str(args.days), "--arrival", str(args.arrival),
+                 "--popular", str(args.popular), "--think", str(args.think)],
+                env=env, stdout=subprocess.PIPE, text=True,
+            )
+            for n in range(processes)
+        ]
+        for worker in workers:
+            out, _ = worker.communicate()
+            line = next(l for l in out.splitlines() if l.startswith("RESULT "))
+            result = json.loads(line[len("RESULT "):])
+            outcomes.update(result["outcomes"])
+            latencies.extend(result["latencies"])
+    finally:
+        stub.stop()
+
+    events = [e for e in stub._events.values() if e.get("status") != "cancelled"]
+    latencies.sort()
+    return {
+        "conversations": args.processes * args.conversations,
+        "events": len(events),
+        "double_booked": _double_booked(events),
+        "outcomes": dict(outcomes),
+        "create_p50": statistics.median(latencies) if latencies else 0.0,
+        "create_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--conversations", type=int, default=12)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--arrival", type=float, default=3.0)
+    parser.add_argument("--popular", type=float, default=0.3)
+    parser.add_argument("--think", type=float, default=0.5)
+    parser.add_argument("--calendar-latency", type=float, default=0.03)
+    parser.add_argument("--modes", default=",".join(_MODES))
+    parser.add_argument("--mode", choices=_MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        # Keep the RESULT line apart from anything the app prints
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_worker(args)
+        print("RESULT " + json.dumps(result))
+        return
+    if args.mode:
+        print("RESULT " + json.dumps(run_mode(args.mode, args)))
+        return
+
+    print(f"{args.processes} workers x {args.conversations} conversations arriving within "
+          f"{args.arrival}s, {args.days} working days of slots, {args.popular:.0%} ask for the "
+          f"popular slot, think time <= {args.think}s, calendar latency {args.calendar_latency}s")
+    print(f"{'mode':7} {'events':>7} {'double':>7} {'taken':>6} {'alt':>5} {'no slot':>8} "
+          f"{'p50':>7} {'p95':>7}")
+    for mode in args.modes.split(","):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_holds", "--mode", mode,
+             "--processes", str(args.processes), "--conversations", str(args.conversations),
+             "--days", str(args.days), "--arrival", str(args.arrival),
+             "--popular", str(args.popular), "--think", str(args.think),
+             "--calendar-latency", str(args.calendar_latency)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(l for l in out.splitlines() if l.startswith("RESULT "))
+        r = json.loads(line[len("RESULT "):])
+        o = r["outcomes"]
+        print(
+            f"{mode:7} {r['events']:7d} {r['double_booked']:7d} {o.get('taken', 0):6d} "
+            f"{o.get('booked_alternative', 0):5d} {o.get('no_slot', 0):8d} "
+            f"{r['create_p50'] * 1000:5.0f}ms {r['create_p95'] * 1000:5.0f}ms"
+        )
+        extra = {k: v for k, v in o.items() if k in ("error", "gave_up")}
+        if extra:
+            print(f"{'':7} {extra}")
+
+
+if __name__ == "__main__":
+    main()
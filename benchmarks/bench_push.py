@@ -0,0 +1,168 @@
+"""
+Freshness of availability with polling versus Calendar push notifications.
+
+    python -m benchmarks.bench_push [--changes 10] [--staleness 5]
+
+Runs the app against the local Calendar stub twice, each mode in its own
+process (settings are read at import):
+
+- poll: the busy index re-syncs on a query once it is older than
+  AVAILABILITY_MAX_STALENESS_SECONDS (--staleness here, 60 by default);
+- push: CALENDAR_WEBHOOK_URL is set, the stub registers the watch channel
+  and posts its notifications to POST /webhooks/calendar through the Flask
+  test client, and the index syncs in the background.
+
+For each of --changes external edits (an event added straight to the
+stub, as if from Google Calendar) it queries availability every
+--interval seconds until the new event shows up, and reports that lag,
+the query latency and the Calendar reads made in total and inside the
+queries (on the request path).
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+_WEBHOOK_URL = "http://bench.local/webhooks/calendar"
+
+
+def run_mode(mode: str, changes: int, staleness: float, interval: float) -> dict:
+    from benchmarks.calendar_stub import CalendarStub
+
+    client_box = {}
+    ready = threading.Event()
+
+    def deliver(address, headers):
+        # Notifications go to the app in this process instead of over HTTP
+        ready.wait()
+        response = client_box["client"].post(urlparse(address).path, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"webhook answered {response.status_code}")
+
+    stub = CalendarStub(push_delivery=deliver).start()
+    os.environ.update(
+        CALENDAR_API_ENDPOINT=stub.endpoint,
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID="primary",
+        AVAILABILITY_BACKEND="index",
+        AVAILABILITY_MAX_STALENESS_SECONDS=str(staleness),
+        CONVERSATION_STORE="memory://",
+    )
+    if mode == "push":
+        os.environ["CALENDAR_WEBHOOK_URL"] = _WEBHOOK_URL
+    else:
+        os.environ.pop("CALENDAR_WEBHOOK_URL", None)
+
+    from google.oauth2.credentials import Credentials
+
+    from calendar_service import get_manager
+
+    get_manager().set_credentials(Credentials(token="offline"))
+
+    import app as flask_app
+    from availability import busy_intervals, epoch_to_iso, get_index
+    from calendar_push import get_push
+
+    client_box["client"] = flask_app.app.test_client()
+    ready.set()
+
+    from dateutil import tz as dateutil_tz
+
+    from config import DEFAULT_TIMEZONE
+
+    now = datetime.datetime.now(dateutil_tz.gettz(DEFAULT_TIMEZONE))
+    base = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(days=2)
+    window_start = base.isoformat()
+    window_end = (base + datetime.timedelta(days=1)).isoformat()
+
+    index = get_index()
+    index.sync()
+    if mode == "push":
+        deadline = time.time() + 10
+        while get_push().stats()["channels"] == 0 and time.time() < deadline:
+            time.sleep(0.05)
+
+    lags, latencies = [], []
+    reads_before = len(stub.requests)
+    path_reads = 0
+    try:
+        for i in range(changes):
+            start = base + datetime.timedelta(hours=i % 20, minutes=1 + i)
+            added_at = time.time()
+            stub.add_event(start.isoformat(), (start + datetime.timedelta(minutes=30)).isoformat())
+            target = start.timestamp()
+            while True:
+                seen = len(stub.requests)
+                t0 = time.perf_counter()
+                busy = busy_intervals(window_start, window_end)
+                latencies.append(time.perf_counter() - t0)
+                path_reads += len(stub.requests) - seen
+                if any(s == target for s, _ in busy):
+                    lags.append(time.time() - added_at)
+                    break
+                if time.time() - added_at > staleness * 3 + 10:
+                    lags.append(float("inf"))
+                    print(f"{mode}: change at {epoch_to_iso(target)} never became visible")
+                    break
+                time.sleep(interval)
+    finally:
+        stub.stop()
+
+    reads = sum(1 for m, _ in stub.requests[reads_before:] if m == "GET")
+    latencies.sort()
+    return {
+        "mode": mode,
+        "lag_median": statistics.median(lags),
+        "lag_max": max(lags),
+        "queries": len(latencies),
+        "latency_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "latency_p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "calendar_reads": reads,
+        "request_path_reads": path_reads,
+        "push": get_push().stats() if mode == "push" else {},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--changes", type=int, default=10)
+    parser.add_argument("--staleness", type=float, default=5.0)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--mode", choices=("poll", "push"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = run_mode(args.mode, args.changes, args.staleness, args.interval)
+        print("RESULT " + json.dumps(result))
+        return
+
+    print(f"changes={args.changes} staleness bound={args.staleness}s query every {args.interval}s")
+    print(f"{'mode':6} {'lag p50':>9} {'lag max':>9} {'queries':>8} {'query p50':>10} {'query p99':>10} {'reads':>6} {'in queries':>10}")
+    for mode in ("poll", "push"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_push", "--mode", mode,
+             "--changes", str(args.changes), "--staleness", str(args.staleness),
+             "--interval", str(args.interval)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(l for l in out.splitlines() if l.startswith("RESULT "))
+        r = json.loads(line[len("RESULT "):])
+        print(
+            f"{mode:6} {r['lag_median']:8.2f}s {r['lag_max']:8.2f}s {r['queries']:8d} "
+            f"{r['latency_p50_ms']:8.2f}ms {r['latency_p99_ms']:8.2f}ms {r['calendar_reads']:6d} {r['request_path_reads']:10d}"
+        )
+        if r["push"]:
+            print(f"       push: {r['push']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Resilience layer under injected faults (local Calendar stub + fake Gemini).
+
+    python -m benchmarks.bench_resilience [--calls 200] [--error-rate 0.2]
+
+1. Calendar reads while the stub fails `error-rate` of requests with 503
+   and stalls `slow-rate` of them: success rate and p50/p99, without and
+   with hedging.
+2. A full Calendar outage: how quickly calls fail once the circuit opens.
+3. Agent turns while the fake model fails `error-rate` of calls.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+import time
+import uuid
+from typing import Callable, List
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _run(label: str, calls: int, fn: Callable[[], object]) -> None:
+    latencies: List[float] = []
+    failures = 0
+    for _ in range(calls):
+        started = time.perf_counter()
+        try:
+            fn()
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            failures += 1
+    ok = len(latencies)
+    line = f"{label:34} ok {ok}/{calls}"
+    if latencies:
+        line += (f"  p50 {_percentile(latencies, 50) * 1000:7.1f} ms"
+                 f"  p99 {_percentile(latencies, 99) * 1000:7.1f} ms")
+    print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    from benchmarks.calendar_stub import CalendarStub
+
+    stub = CalendarStub().start()
+    os.environ.update(
+        CALENDAR_API_ENDPOINT=stub.endpoint,
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID=os.getenv("GOOGLE_CALENDAR_ID", "primary"),
+        UPSTREAM_RETRY_BASE_SECONDS="0.05",
+        CIRCUIT_RESET_SECONDS="2",
+    )
+
+    from google.oauth2.credentials import Credentials
+
+    import resilience
+    from calendar_service import get_manager
+    from calendar_tools import list_events
+
+    get_manager().set_credentials(Credentials(token="offline"))
+    day = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+    start, end = day.isoformat(), (day + datetime.timedelta(hours=8)).isoformat()
+
+    def read():
+        return list_events(start, end)
+
+    try:
+        _run("calendar, no faults", args.calls, read)
+        stub.inject_faults(args.error_rate, 503, args.slow_rate, args.slow_seconds)
+        _run(f"calendar, {args.error_rate:.0%} 503 + slow", args.calls, read)
+        stub.inject_faults(args.error_rate, 503, args.slow_rate, args.slow_seconds)
+        resilience.HEDGE_ENABLED = True
+        _run("calendar, same faults, hedged", args.calls, read)
+        resilience.HEDGE_ENABLED = False
+
+        stub.inject_faults(error_rate=1.0)
+        before = len(stub.requests)
+        _run("calendar outage", 50, read)
+        print(f"  requests reaching the stub during the outage: {len(stub.requests) - before}")
+        stub.inject_faults()
+        time.sleep(2.1)
+        _run("calendar recovered (after reset)", 10, read)
+
+        from langchain.agents import create_agent
+
+        import chat_service
+        import chatbot
+        from benchmarks.fake_llm import SlowChatModel
+
+        chat_service.agent = create_agent(
+            SlowChatModel(latency=0.01, error_rate=args.error_rate),
+            [chatbot.check_availability_tool],
+            system_prompt="You are a test assistant.",
+            middleware=[chatbot.conversation_context_prompt, chatbot.ResilienceMiddleware(deadline=5)],
+        )
+        _run(f"agent turns, {args.error_rate:.0%} model errors", 50,
+             lambda: chat_service.run_turn(uuid.uuid4().hex, "Am I free tomorrow?"))
+    finally:
+        stub.stop()
+
+    print(f"\nfaults injected by the stub: {stub.faults_injected}")
+    print(resilience.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark for slots.find_free_slots.
+
+    python -m benchmarks.bench_slots [--events 300] [--days 42]
+
+Builds a synthetic calendar with random busy blocks within working hours
+(09:00-18:00 on weekdays, the find_free_slots defaults, in the business
+timezone) and times a full sweep of the window (max_slots large enough that
+every day is scanned). Reports microseconds per call and per day, and exits
+with status 1 if no free slot was found (the sweep would then skip the work
+of emitting slots).
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import timeit
+
+
+def synthetic_busy(events: int, days: int, timezone: str, seed: int = 7):
+    """`events` busy blocks on the quarter-hour grid of the working hours of the next `days` days."""
+    from dateutil import tz as dateutil_tz
+
+    rng = random.Random(seed)
+    zone = dateutil_tz.gettz(timezone)
+    today = datetime.datetime.now(zone).date()
+    working_days = [
+        datetime.datetime.combine(today + datetime.timedelta(days=n), datetime.time(9), zone)
+        for n in range(days)
+        if (today + datetime.timedelta(days=n)).weekday() < 5
+    ]
+    busy = []
+    for _ in range(events):
+        length = rng.choice((15, 30, 45, 60, 90))
+        s = rng.choice(working_days) + datetime.timedelta(minutes=15 * rng.randrange((540 - length) // 15 + 1))
+        busy.append((s.timestamp(), s.timestamp() + length * 60))
+    start = datetime.datetime.combine(today, datetime.time(), zone).timestamp()
+    return start, start + days * 86400, busy
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=300)
+    parser.add_argument("--days", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("GOOGLE_CALENDAR_ID", "primary")
+    from config import DEFAULT_TIMEZONE
+    from slots import find_free_slots
+
+    range_start, range_end, busy = synthetic_busy(args.events, args.days, DEFAULT_TIMEZONE)
+
+    def run():
+        return find_free_slots(
+            busy, range_start, range_end, duration_minutes=30,
+            max_slots=10 ** 6, max_per_day=10 ** 6,
+        )
+
+    slots = run()
+    best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+    print(f"events={args.events} days={args.days} free_slots={len(slots)}")
+    print(f"per call: {best * 1e6:.1f} us   per day: {best * 1e6 / args.days:.1f} us")
+    if not slots:
+        print("no free slots: lower --events so the sweep emits slots")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
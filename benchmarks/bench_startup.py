@@ -0,0 +1,120 @@
+"""
+Cold-start time: how soon a fresh worker answers health checks and is ready.
+
+    python -m benchmarks.bench_startup [--runs 5]
+
+For each run, in a fresh interpreter:
+
+- import: time to `import app` (Flask) and `import asgi`, and, for
+  comparison, `import chat_service`, the chat stack (LangChain, Gemini,
+  googleapiclient) that app.py used to import up front;
+- serve: starts gunicorn (Flask) and uvicorn (ASGI) on a local port and
+  polls until GET /healthz answers 200 (the process can take traffic) and
+  GET /readyz answers 200 (the background warm-up is done).
+
+Reports the median over --runs. GOOGLE_API_KEY / GOOGLE_CALENDAR_ID only
+need placeholder values; no network access is needed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t); import os; os._exit(0)"
+)
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "offline")
+    env.setdefault("GOOGLE_CALENDAR_ID", "primary")
+    env["CONVERSATION_STORE"] = "memory://"
+    return env
+
+
+def _import_seconds(module: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET.format(module=module)],
+        cwd=ROOT, env=_env(), capture_output=True, text=True, check=True,
+    ).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def _serve_seconds(mode: str, timeout: float = 60.0) -> Dict[str, float]:
+    port = _free_port()
+    if mode == "flask":
+        command = [sys.executable, "-m", "gunicorn", "--workers", "1", "--threads", "4",
+                   "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port),
+                   "--log-level", "warning"]
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=_env(),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result: Dict[str, float] = {}
+    try:
+        while time.perf_counter() - started < timeout and len(result) < 2:
+            if "healthy" not in result and _status(base + "/healthz") == 200:
+                result["healthy"] = time.perf_counter() - started
+            if "healthy" in result and _status(base + "/readyz") == 200:
+                result["ready"] = time.perf_counter() - started
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"median of {args.runs} runs, seconds")
+    for module in ("app", "asgi", "chat_service"):
+        times = [_import_seconds(module) for _ in range(args.runs)]
+        print(f"import {module:14} {statistics.median(times):7.3f}")
+
+    for mode in ("flask", "asgi"):
+        runs: List[Dict[str, float]] = [_serve_seconds(mode) for _ in range(args.runs)]
+        healthy = [r["healthy"] for r in runs if "healthy" in r]
+        ready = [r["ready"] for r in runs if "ready" in r]
+        print(
+            f"{mode:6} server  healthy {statistics.median(healthy) if healthy else float('nan'):7.3f}"
+            f"   ready {statistics.median(ready) if ready else float('nan'):7.3f}"
+            f"   ({len(ready)}/{args.runs} became ready)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Which calendar chat bookings land in, per tenant and endpoint.
+
+    python -m benchmarks.bench_tenants
+
+Registers two tenants (the default one on "primary" and "acme" on
+"acme-cal") against the local Calendar stub and books one meeting per
+tenant through each chat endpoint: POST /api/chat and /api/chat/stream of
+the Flask app (test client) and of the ASGI app (httpx). The agent is the
+production one with Gemini replaced by benchmarks.fake_llm.ReplayChatModel,
+which answers each booking message with a create_meeting call for its own
+slot. Then both tenants batch-book the same slot for the same attendee
+with the same client idempotency key (calendar_tools.create_events_batch),
+which must give one event in each calendar rather than one shared booking.
+
+Prints the calendar every booking was inserted into and exits with status
+1 if any landed in another tenant's calendar (or nowhere).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import datetime
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+_TENANTS = {"default": "primary", "acme": "acme-cal"}
+_ENDPOINTS = ("flask /api/chat", "flask /api/chat/stream", "asgi /api/chat", "asgi /api/chat/stream")
+
+
+def _slots(count: int, timezone: str) -> List[Tuple[str, str]]:
+    """`count` free half hours on the next working day."""
+    from dateutil import tz as dateutil_tz
+
+    day = datetime.date.today() + datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    start = datetime.datetime.combine(day, datetime.time(10, 0), dateutil_tz.gettz(timezone))
+    return [
+        (
+            (start + datetime.timedelta(minutes=30 * n)).isoformat(),
+            (start + datetime.timedelta(minutes=30 * n + 30)).isoformat(),
+        )
+        for n in range(count)
+    ]
+
+
+def main() -> None:
+    from benchmarks.calendar_stub import CalendarStub
+
+    stub = CalendarStub(latency=0.01).start()
+    tenants_file = os.path.join(tempfile.mkdtemp(), "tenants.json")
+    with open(tenants_file, "w", encoding="utf-8") as f:
+        json.dump({"tenants": [{"key": "acme", "calendar_id": _TENANTS["acme"]}]}, f)
+    os.environ.update(
+        CALENDAR_API_ENDPOINT=stub.endpoint,
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID=_TENANTS["default"],
+        TENANTS_FILE=tenants_file,
+        CONVERSATION_STORE="memory://",
+        FAST_PATH_ENABLED="false",
+        RESPONSE_CACHE_ENABLED="false",
+        RATE_LIMIT_ENABLED="false",
+    )
+
+    import httpx
+    from google.oauth2.credentials import Credentials
+
+    import chat_service
+    from benchmarks.fake_llm import ReplayChatModel
+    from calendar_service import get_manager
+    from chatbot import build_agent
+    from calendar_tools import create_events_batch
+    from config import DEFAULT_TIMEZONE
+    from tenants import current_tenant, get_tenant
+
+    # (tenant, endpoint, message) for every booking, each on its own slot
+    bookings = [
+        (tenant, endpoint, f"Book slot {n} for the {tenant} team, guest{n}@example.com")
+        for n, (tenant, endpoint) in enumerate(
+            (tenant, endpoint) for tenant in _TENANTS for endpoint in _ENDPOINTS
+        )
+    ]
+    recorded: Dict[str, List[Dict[str, Any]]] = {}
+    for (_, _, message), (start, end) in zip(bookings, _slots(len(bookings), DEFAULT_TIMEZONE)):
+        recorded[message] = [
+            {"tool_calls": [{"name": "create_meeting", "args": {
+                "start_iso": start, "end_iso": end, "attendees": message.rsplit(" ", 1)[1],
+            }}]},
+            {"content": "Booked."},
+        ]
+    chat_service.agent = build_agent(llm=ReplayChatModel(recordings=recorded))
+    for key in _TENANTS:
+        get_manager(get_tenant(key)).set_credentials(Credentials(token="offline"))
+
+    from app import app as flask_app
+    from asgi import app as asgi_app
+
+    async def post_asgi(path: str, body: Dict[str, Any]) -> None:
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            (await client.post(path, json=body, timeout=60)).raise_for_status()
+
+    wrong = 0
+    try:
+        for tenant, endpoint, message in bookings:
+            body = {"message": message, "tenant": tenant}
+            server, path = endpoint.split(" ")
+            inserts = len(stub.requests)
+            if server == "flask":
+                response = flask_app.test_client().post(path, json=body)
+                assert response.status_code == 200, response.status_code
+                response.get_data()
+            else:
+                # In an empty context, as in a server (the Flask requests above
+                # set the tenant and conversation of this thread)
+                contextvars.Context().run(asyncio.run, post_asgi(path, body))
+            calendars = [
+                p.split("/")[2] for m, p in stub.requests[inserts:]
+                if m == "POST" and p.startswith("/calendars/") and p.endswith("/events")
+            ]
+            ok = calendars == [_TENANTS[tenant]]
+            wrong += not ok
+            print(f"{tenant:8} {endpoint:24} -> {', '.join(calendars) or 'no insert':12} "
+                  f"{'ok' if ok else 'WRONG'}")
+
+        start, end = _slots(len(bookings) + 1, DEFAULT_TIMEZONE)[-1]
+        batch = [{
+            "start_iso": start, "end_iso": end, "attendees": ["lead@example.com"],
+            "idempotency_key": "lead-42",
+        }]
+        for tenant in _TENANTS:
+            sent, batched = len(stub.requests), len(stub.batched)
+            token = current_tenant.set(get_tenant(tenant))
+            try:
+                status = create_events_batch(batch)[0]["status"]
+            finally:
+                current_tenant.reset(token)
+            calendars = [
+                p.split("/")[2] for m, p in stub.requests[sent:] + stub.batched[batched:]
+                if m == "POST" and p.startswith("/calendars/") and p.endswith("/events")
+            ]
+            ok = status == "created" and calendars == [_TENANTS[tenant]]
+            wrong += not ok
+            print(f"{tenant:8} {'batch (same key)':24} -> {', '.join(calendars) or 'no insert':12} "
+                  f"{'ok' if ok else 'WRONG'}")
+    finally:
+        stub.stop()
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,668 @@
+"""
+Local stand-in for the parts of the Google Calendar v3 API this app uses.
+
+Runs an HTTP server on 127.0.0.1 that speaks enough of the real wire format
+for googleapiclient to talk to it:
+
+- GET  /calendars/{id}/events            (timeMin/timeMax, paging, syncToken)
+- POST /calendars/{id}/events            (insert)
+- GET  /calendars/{id}/events/{eventId}
+- PATCH /calendars/{id}/events/{eventId}
+- POST /calendars/{id}/events/watch      (push notification channels)
+- POST /channels/stop
+- POST /freeBusy
+- POST /batch/calendar/v3                (multipart/mixed batch of the above)
+
+Inserted events that request a Meet conference report it as "pending"
+until `conference_delay` seconds have passed. `invitations` counts the
+attendees invited by writes with sendUpdates="all", and `invite_latency`
+adds that many seconds to such writes (Google mails the guests before
+answering). `inject_faults` makes a
+share of requests fail (e.g. 503/429) or respond slowly; `latency` adds a
+fixed delay to every request and `populate` fills working hours with busy
+events. `bytes_in` / `bytes_out` count request and response bodies, which
+honour `fields` partial-response masks (e.g. "nextPageToken,items(id,start)").
+
+Events added without a calendar_id are visible on every calendar id, so the
+stub works whatever GOOGLE_CALENDAR_ID is set to.
+
+Watch channels make the stub a simulated push sender: every change to an
+event posts a notification (the X-Goog-* headers Google sends) to each
+live channel of that calendar. Delivery is an HTTP POST to the channel
+address, or `push_delivery(address, headers)` when given (e.g. a Flask
+test client); `send_notifications` fires one by hand.
+
+Usage:
+
+    stub = CalendarStub()
+    stub.start()
+    stub.add_event("2030-01-01T10:00:00+05:30", "2030-01-01T11:00:00+05:30")
+    service = stub.service()          # googleapiclient service bound to the stub
+
+or point the app at it with CALENDAR_API_ENDPOINT=<stub.endpoint>.
+"""
+
+from __future__ import annotations
+
+import datetime
+import email.parser
+import functools
+import itertools
+import json
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+import httplib2
+from dateutil import parser as date_parser
+from dateutil import tz as dateutil_tz
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+_PREFIX = "/calendar/v3"
+_BATCH_PATH = "/batch/calendar/v3"
+
+
+@functools.lru_cache(maxsize=65536)
+def _epoch(value: str) -> float:
+    return date_parser.isoparse(value).timestamp()
+
+
+def _start_key(event: Dict[str, Any]) -> float:
+    when = event.get("start", {})
+    return _epoch(when.get("dateTime") or when.get("date"))
+
+
+def _end_key(event: Dict[str, Any]) -> float:
+    when = event.get("end", {})
+    return _epoch(when.get("dateTime") or when.get("date"))
+
+
+Mask = Dict[str, Any]
+
+
+def _parse_fields(spec: str) -> Mask:
+    """
+    Parse a partial-response mask ("a,b/c,d(e,f)") into nested dicts; an
+    empty dict means "the whole value".
+    """
+    mask: Mask = {}
+    stack = [mask]
+    path: List[str] = []
+    token = ""
+
+    def flush() -> None:
+        nonlocal token
+        if token:
+            node = stack[-1]
+            for name in token.split("/"):
+                node = node.setdefault(name, {})
+            path.append(token)
+        token = ""
+
+    for ch in spec.replace(" ", ""):
+        if ch == ",":
+            flush()
+            path.clear()
+        elif ch == "(":
+            flush()
+            node = stack[-1]
+            for name in path[-1].split("/"):
+                node = node[name]
+            stack.append(node)
+            path.clear()
+        elif ch == ")":
+            flush()
+            stack.pop()
+            path.clear()
+        else:
+            token += ch
+    flush()
+    return mask
+
+
+def _select(value: Any, mask: Mask) -> Any:
+    if not mask:
+        return value
+    if isinstance(value, list):
+        return [_select(v, mask) for v in value]
+    if not isinstance(value, dict):
+        return value
+    return {k: _select(value[k], sub) for k, sub in mask.items() if k in value}
+
+
+class CalendarStub:
+    def __init__(
+        self,
+        page_size: int = 250,
+        conference_delay: float = 0.0,
+        latency: float = 0.0,
+        push_delivery: Optional[Callable[[str, Dict[str, str]], None]] = None,
+    ):
+        self.page_size = page_size
+        # Seconds added to every request (a Calendar round-trip)
+        self.latency = latency
+        # Seconds before a requested Meet conference leaves "pending"
+        self.conference_delay = conference_delay
+        # Seconds added to writes that invite attendees
+        self.invite_latency = 0.0
+        self._lock = threading.Lock()
+        self._events: Dict[str, Dict[str, Any]] = {}
+        # Event id -> owning calendar, for events pinned to one calendar
+        self._calendar_of: Dict[str, str] = {}
+        # Change log for sync tokens: (sequence, event id)
+        self._changes: List[Tuple[int, str]] = []
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        # Sync tokens older than this sequence number get HTTP 410
+        self._min_valid_seq = 0
+        # Event id -> time its Meet conference becomes ready
+        self._conference_ready: Dict[str, float] = {}
+        # Fault injection (see inject_faults)
+        self._faults: Dict[str, Any] = {}
+        self._rng = random.Random(0)
+        self.faults_injected = 0
+        # Watch channels by id, and how notifications are delivered
+        self._channels: Dict[str, Dict[str, Any]] = {}
+        self._push_delivery = push_delivery or _post_notification
+        # Notifications go out in order, off the request threads
+        self._outbox: "queue.Queue[Tuple[str, Dict[str, str]]]" = queue.Queue()
+        self._message_numbers = itertools.count(1)
+        self.notifications_sent = 0
+        self.notification_failures = 0
+        # Attendees emailed an invitation (added by an insert/patch with sendUpdates)
+        self.invitations = 0
+        self.requests: List[Tuple[str, str]] = []
+        # Requests that arrived inside batch requests (each batch is one entry in `requests`)
+        self.batched: List[Tuple[str, str]] = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # ------------- Data -------------
+
+    def _touch(self, event_id: str) -> None:
+        self._last_seq = next(self._seq)
+        self._changes.append((self._last_seq, event_id))
+        owner = self._calendar_of.get(event_id)
+        for channel in self._channels.values():
+            if owner is None or channel["calendar_id"] == owner:
+                self._notify_locked(channel, "exists")
+
+    def add_event(
+        self, start_iso: str, end_iso: str, calendar_id: Optional[str] = None, **fields
+    ) -> Dict[str, Any]:
+        event = {
+            "id": fields.pop("id", uuid.uuid4().hex),
+            "status": "confirmed",
+            "summary": fields.pop("summary", "Busy"),
+            "start": {"dateTime": start_iso},
+            "end": {"dateTime": end_iso},
+        }
+        event.update(fields)
+        with self._lock:
+            self._events[event["id"]] = event
+            if calendar_id:
+                self._calendar_of[event["id"]] = calendar_id
+            self._touch(event["id"])
+        return event
+
+    def populate(
+        self,
+        days: int,
+        events_per_day: int,
+        timezone: str = "UTC",
+        start_hour: int = 9,
+        end_hour: int = 18,
+        seed: int = 0,
+        keep_free: Sequence[Tuple[str, str]] = (),
+    ) -> int:
+        """
+        Add `events_per_day` busy events (30-90 minutes, on half hours) within
+        working hours on each weekday of the next `days` days; returns how many.
+        Events are placed clear of the `keep_free` (start, end) ISO windows
+        (naive ones in `timezone`); one that fits nowhere else is left out, so
+        there can be fewer on those days.
+        """
+        rng = random.Random(seed)
+        zone = dateutil_tz.gettz(timezone)
+        free = [
+            tuple(date_parser.isoparse(value).replace(tzinfo=zone).timestamp() for value in window)
+            if date_parser.isoparse(window[0]).tzinfo is None
+            else (_epoch(window[0]), _epoch(window[1]))
+            for window in keep_free
+        ]
+        today = datetime.datetime.now(zone).date()
+        added = 0
+        for n in range(days):
+            day = today + datetime.timedelta(days=n)
+            if day.weekday() >= 5:
+                continue
+            midnight = datetime.datetime.combine(day, datetime.time(), zone)
+            for _ in range(events_per_day):
+                length = datetime.timedelta(minutes=rng.choice((30, 60, 90)))
+                starts = [
+                    start for start in (
+                        midnight + datetime.timedelta(minutes=offset)
+                        for offset in range(start_hour * 60, end_hour * 60, 30)
+                    )
+                    if (start + length).hour * 60 + (start + length).minute <= end_hour * 60
+                    and not any(
+                        s < (start + length).timestamp() and start.timestamp() < e for s, e in free
+                    )
+                ]
+                if not starts:
+                    continue
+                start = rng.choice(starts)
+                self.add_event(start.isoformat(), (start + length).isoformat())
+                added += 1
+        return added
+
+    def cancel_event(self, event_id: str) -> None:
+        with self._lock:
+            self._events[event_id]["status"] = "cancelled"
+            self._touch(event_id)
+
+    def send_notifications(self, calendar_id: Optional[str] = None, state: str = "exists") -> int:
+        """Notify every live channel (of `calendar_id`, if given); returns how many."""
+        with self._lock:
+            channels = [
+                c for c in self._channels.values()
+                if calendar_id is None or c["calendar_id"] == calendar_id
+            ]
+            for channel in channels:
+                self._notify_locked(channel, state)
+        return len(channels)
+
+    def channels(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(c) for c in self._channels.values()]
+
+    def expire_sync_tokens(self) -> None:
+        """Invalidate every sync token handed out so far (next use gets 410)."""
+        with self._lock:
+            self._min_valid_seq = self._last_seq + 1
+
+    def inject_faults(
+        self,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        slow_rate: float = 0.0,
+        slow_seconds: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        """
+        Fail `error_rate` of requests with `error_status` and delay
+        `slow_rate` of them by `slow_seconds`; call with no arguments to stop.
+        """
+        with self._lock:
+            self._faults = {
+                "error_rate": error_rate,
+                "error_status": error_status,
+                "slow_rate": slow_rate,
+                "slow_seconds": slow_seconds,
+            }
+            self._rng = random.Random(seed)
+
+    def _fault(self) -> Tuple[float, Optional[int]]:
+        """(delay, error status or None) for the next request."""
+        with self._lock:
+            faults = self._faults
+            if not faults:
+                return 0.0, None
+            delay = faults["slow_seconds"] if self._rng.random() < faults["slow_rate"] else 0.0
+            error = faults["error_status"] if self._rng.random() < faults["error_rate"] else None
+            if delay or error:
+                self.faults_injected += 1
+        return delay, error
+
+    # ------------- Server -------------
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{_PREFIX}/"
+
+    def start(self) -> "CalendarStub":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._dispatch(self, "GET")
+
+            def do_POST(self):
+                stub._dispatch(self, "POST")
+
+            def do_PATCH(self):
+                stub._dispatch(self, "PATCH")
+
+        threading.Thread(target=self._deliver_forever, daemon=True).start()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def service(self):
+        """googleapiclient Calendar service bound to this stub."""
+        doc = json.loads(discovery_cache.get_static_doc("calendar", "v3"))
+        return build_from_document(
+            doc, http=httplib2.Http(), client_options={"api_endpoint": self.endpoint}
+        )
+
+    # ------------- Request handling -------------
+
+    def _dispatch(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        url = urlparse(handler.path)
+        path = url.path[len(_PREFIX):] if url.path.startswith(_PREFIX) else url.path
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw = handler.rfile.read(length) if length else b""
+        with self._lock:
+            self.requests.append((method, path))
+            self.bytes_in += length
+
+        if self.latency:
+            time.sleep(self.latency)
+        delay, error = self._fault()
+        if delay:
+            time.sleep(delay)
+        if error:
+            self._respond(handler, error, {"error": {"code": error, "message": "Injected fault"}})
+            return
+
+        if path == _BATCH_PATH and method == "POST":
+            self._batch(handler, raw)
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = json.loads(raw or b"{}")
+        status, payload = self._route(method, path, query, body)
+        self._respond(handler, status, payload)
+
+    def _route(
+        self, method: str, path: str, query: Dict[str, str], body: Dict[str, Any]
+    ) -> Tuple[int, Optional[Dict[str, Any]]]:
+        parts = [unquote(p) for p in path.strip("/").split("/")]
+        status, payload = 404, {"error": {"code": 404, "message": "Not Found"}}
+        fields = query.pop("fields", None)
+        if parts == ["freeBusy"] and method == "POST":
+            status, payload = self._free_busy(body)
+        elif parts == ["channels", "stop"] and method == "POST":
+            status, payload = self._stop_channel(body)
+        elif len(parts) >= 3 and parts[0] == "calendars" and parts[2] == "events":
+            if len(parts) == 3 and method == "GET":
+                status, payload = self._list(parts[1], query)
+            elif len(parts) == 3 and method == "POST":
+                status, payload = self._insert(body, query)
+            elif parts[3:] == ["watch"] and method == "POST":
+                status, payload = self._watch(parts[1], body)
+            elif len(parts) == 4 and method == "GET":
+                status, payload = self._get(parts[3])
+            elif len(parts) == 4 and method == "PATCH":
+                status, payload = self._patch(parts[3], body, query)
+        if fields and payload is not None and status < 300:
+            payload = _select(payload, _parse_fields(fields))
+        return status, payload
+
+    def _batch(self, handler: BaseHTTPRequestHandler, raw: bytes) -> None:
+        """
+        Batch endpoint: a multipart/mixed body of HTTP requests, answered by
+        a multipart/mixed body of their responses in the same order.
+        """
+        message = email.parser.BytesParser().parsebytes(
+            b"Content-Type: " + handler.headers["Content-Type"].encode("ascii") + b"\r\n\r\n" + raw
+        )
+        boundary = uuid.uuid4().hex
+        out: List[str] = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().partition("\n")
+            _, _, inner_body = rest.partition("\r\n\r\n") if "\r\n\r\n" in rest else rest.partition("\n\n")
+            method, target = request_line.split()[:2]
+            url = urlparse(target)
+            path = url.path[len(_PREFIX):] if url.path.startswith(_PREFIX) else url.path
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            with self._lock:
+                self.batched.append((method, path))
+            status, payload = self._route(method, path, query, json.loads(inner_body or "{}"))
+            data = json.dumps(payload) if payload is not None else ""
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'].strip('<>')}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(data.encode('utf-8'))}\r\n\r\n{data}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        data = "".join(out).encode("utf-8")
+        with self._lock:
+            self.bytes_out += len(data)
+        handler.send_response(200)
+        handler.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _respond(
+        self, handler: BaseHTTPRequestHandler, status: int, payload: Optional[Dict[str, Any]]
+    ) -> None:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        with self._lock:
+            self.bytes_out += len(data)
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=UTF-8")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _on_calendar(self, event_id: str, calendar_id: str) -> bool:
+        return self._calendar_of.get(event_id, calendar_id) == calendar_id
+
+    def _list(self, calendar_id: str, query: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            if "syncToken" in query:
+                since = int(query["syncToken"].lstrip("s"))
+                if since < self._min_valid_seq:
+                    return 410, {"error": {"code": 410, "message": "Sync token is no longer valid"}}
+                changed = {eid for seq, eid in self._changes if seq > since}
+                items = [
+                    self._events[eid] for eid in changed if self._on_calendar(eid, calendar_id)
+                ]
+            else:
+                items = [
+                    e for e in self._events.values()
+                    if e.get("status") != "cancelled" and self._on_calendar(e["id"], calendar_id)
+                ]
+                if "timeMin" in query:
+                    lo = date_parser.isoparse(query["timeMin"]).timestamp()
+                    items = [e for e in items if _end_key(e) > lo]
+                if "timeMax" in query:
+                    hi = date_parser.isoparse(query["timeMax"]).timestamp()
+                    items = [e for e in items if _start_key(e) < hi]
+            items.sort(key=_start_key)
+            sync_token = f"s{self._last_seq}"
+
+        offset = int(query.get("pageToken") or 0)
+        page_size = min(int(query.get("maxResults") or self.page_size), self.page_size)
+        page = items[offset:offset + page_size]
+        payload: Dict[str, Any] = {"kind": "calendar#events", "items": page}
+        if offset + page_size < len(items):
+            payload["nextPageToken"] = str(offset + page_size)
+        else:
+            payload["nextSyncToken"] = sync_token
+        return 200, payload
+
+    def _free_busy(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        lo = date_parser.isoparse(body["timeMin"]).timestamp()
+        hi = date_parser.isoparse(body["timeMax"]).timestamp()
+        calendars: Dict[str, Any] = {}
+        with self._lock:
+            for item in body.get("items", []):
+                cal_id = item["id"]
+                busy = sorted(
+                    (e["start"]["dateTime"], e["end"]["dateTime"])
+                    for e in self._events.values()
+                    if e.get("status") != "cancelled"
+                    and e.get("transparency") != "transparent"
+                    and self._on_calendar(e["id"], cal_id)
+                    and _start_key(e) < hi
+                    and _end_key(e) > lo
+                )
+                calendars[cal_id] = {"busy": [{"start": s, "end": e} for s, e in busy]}
+        return 200, {
+            "kind": "calendar#freeBusy",
+            "timeMin": body["timeMin"],
+            "timeMax": body["timeMax"],
+            "calendars": calendars,
+        }
+
+    def _invite_locked(
+        self, before: List[Dict[str, Any]], after: List[Dict[str, Any]], query: Dict[str, str]
+    ) -> int:
+        """Count the attendees a write invites; returns how many."""
+        if query.get("sendUpdates") not in ("all", "externalOnly"):
+            return 0
+        known = {a.get("email") for a in before}
+        invited = sum(1 for a in after if a.get("email") not in known)
+        self.invitations += invited
+        return invited
+
+    def _mail(self, invited: int) -> None:
+        # Outside the lock, like the rest of a request's latency
+        if invited and self.invite_latency:
+            time.sleep(self.invite_latency)
+
+    def _insert(self, body: Dict[str, Any], query: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        event = dict(body)
+        event.setdefault("id", uuid.uuid4().hex)
+        event.setdefault("status", "confirmed")
+        event["htmlLink"] = f"https://calendar.google.com/event?eid={event['id']}"
+        request = (event.get("conferenceData") or {}).get("createRequest")
+        with self._lock:
+            if event["id"] in self._events:
+                return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+            if request:
+                event["conferenceData"] = {
+                    "createRequest": dict(request, status={"statusCode": "pending"}),
+                }
+                self._conference_ready[event["id"]] = time.time() + self.conference_delay
+                self._resolve_conference_locked(event)
+            self._events[event["id"]] = event
+            invited = self._invite_locked([], event.get("attendees") or [], query)
+            self._touch(event["id"])
+            payload = json.loads(json.dumps(event))
+        self._mail(invited)
+        return 200, payload
+
+    def _patch(
+        self, event_id: str, body: Dict[str, Any], query: Dict[str, str]
+    ) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            event = self._events.get(event_id)
+            if event is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            invited = self._invite_locked(
+                event.get("attendees") or [], body.get("attendees") or [], query
+            )
+            event.update({k: v for k, v in body.items() if k != "id"})
+            self._resolve_conference_locked(event)
+            self._touch(event_id)
+            payload = json.loads(json.dumps(event))
+        self._mail(invited)
+        return 200, payload
+
+    def _resolve_conference_locked(self, event: Dict[str, Any]) -> None:
+        ready_at = self._conference_ready.get(event["id"])
+        if ready_at is None or ready_at > time.time():
+            return
+        del self._conference_ready[event["id"]]
+        code = f"{event['id'][:3]}-{event['id'][3:7]}-{event['id'][7:10]}"
+        event["conferenceData"]["createRequest"]["status"] = {"statusCode": "success"}
+        event["conferenceData"].update(
+            conferenceId=code,
+            entryPoints=[{"entryPointType": "video", "uri": f"https://meet.google.com/{code}"}],
+        )
+        event["hangoutLink"] = f"https://meet.google.com/{code}"
+
+    # ------------- Push notifications -------------
+
+    def _watch(self, calendar_id: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        if body.get("type") != "web_hook" or not body.get("address") or not body.get("id"):
+            return 400, {"error": {"code": 400, "message": "Invalid channel"}}
+        ttl = float((body.get("params") or {}).get("ttl") or 604800)
+        channel = {
+            "kind": "api#channel",
+            "id": body["id"],
+            "resourceId": uuid.uuid4().hex,
+            "resourceUri": f"{_PREFIX}/calendars/{quote(calendar_id)}/events",
+            "token": body.get("token", ""),
+            "expiration": str(int((time.time() + ttl) * 1000)),
+            "address": body["address"],
+            "calendar_id": calendar_id,
+        }
+        with self._lock:
+            self._channels[channel["id"]] = channel
+            # Google confirms every new channel with a "sync" message
+            self._notify_locked(channel, "sync")
+        return 200, {k: v for k, v in channel.items() if k not in ("address", "calendar_id")}
+
+    def _stop_channel(self, body: Dict[str, Any]) -> Tuple[int, Optional[Dict[str, Any]]]:
+        with self._lock:
+            channel = self._channels.get(body.get("id"))
+            if channel is None or channel["resourceId"] != body.get("resourceId"):
+                return 404, {"error": {"code": 404, "message": "Channel not found"}}
+            del self._channels[channel["id"]]
+        return 204, None
+
+    def _notify_locked(self, channel: Dict[str, Any], state: str) -> None:
+        if float(channel["expiration"]) / 1000 < time.time():
+            return
+        headers = {
+            "X-Goog-Channel-ID": channel["id"],
+            "X-Goog-Channel-Token": channel["token"],
+            "X-Goog-Channel-Expiration": time.strftime(
+                "%a, %d %b %Y %H:%M:%S GMT", time.gmtime(float(channel["expiration"]) / 1000)
+            ),
+            "X-Goog-Resource-ID": channel["resourceId"],
+            "X-Goog-Resource-URI": channel["resourceUri"],
+            "X-Goog-Resource-State": state,
+            "X-Goog-Message-Number": str(next(self._message_numbers)),
+        }
+        self._outbox.put((channel["address"], headers))
+
+    def _deliver_forever(self) -> None:
+        while True:
+            address, headers = self._outbox.get()
+            try:
+                self._push_delivery(address, headers)
+                self.notifications_sent += 1
+            except Exception as e:
+                self.notification_failures += 1
+                print(f"stub: notification to {address} failed: {e}")
+
+    def _get(self, event_id: str) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            event = self._events.get(event_id)
+            if event is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            self._resolve_conference_locked(event)
+            return 200, json.loads(json.dumps(event))
+
+
+def _post_notification(address: str, headers: Dict[str, str]) -> None:
+    request = urllib.request.Request(address, data=b"", headers=headers, method="POST")
+    with urllib.request.urlopen(request, timeout=10) as response:
+        response.read()
@@ -0,0 +1,51 @@
+"""
+The web apps wired to an offline agent, for load tests.
+
+    gunicorn --threads 8 benchmarks.fake_agent:flask_app
+    uvicorn benchmarks.fake_agent:asgi_app
+
+Replaces chat_service.agent with the production middleware stack around
+benchmarks.fake_llm.SlowChatModel and a check_availability tool that sleeps
+like a Calendar round-trip. Latencies come from BENCH_LLM_LATENCY and
+BENCH_CALENDAR_LATENCY (seconds). GOOGLE_API_KEY / GOOGLE_CALENDAR_ID only
+need placeholder values.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+from langchain.agents import create_agent
+from langchain.tools import tool
+
+import chat_service
+import chatbot
+from benchmarks.fake_llm import SlowChatModel
+
+LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY", "0.5"))
+CALENDAR_LATENCY = float(os.getenv("BENCH_CALENDAR_LATENCY", "0.2"))
+
+
+@tool("check_availability")
+def fake_check_availability(start_iso: str, end_iso: str) -> str:
+    """Pretend to query the calendar."""
+    time.sleep(CALENDAR_LATENCY)
+    return "[]"
+
+
+chat_service.agent = create_agent(
+    SlowChatModel(latency=LLM_LATENCY),
+    [chatbot._with_async(fake_check_availability)],
+    system_prompt="You are a test assistant.",
+    middleware=[
+        chatbot.conversation_context_prompt,
+        chatbot.ResilienceMiddleware(deadline=chatbot.LLM_CALL_DEADLINE_SECONDS),
+        chatbot.UpstreamLimitMiddleware(),
+    ],
+)
+
+from app import app as flask_app  # noqa: E402
+from asgi import app as asgi_app  # noqa: E402
+
+__all__ = ["flask_app", "asgi_app"]
@@ -0,0 +1,168 @@
+"""
+Offline stand-ins for the Gemini chat model.
+
+SlowChatModel answers every turn with one tool call followed by a fixed
+reply, sleeping `latency` seconds per model call (time.sleep when invoked
+synchronously, asyncio.sleep when awaited) so serving modes can be compared
+without network access or API quota. `error_rate` injects transient
+failures.
+
+ReplayChatModel plays back recorded responses (see
+benchmarks/fixtures/booking_conversations.json) so whole conversations run
+against the real tools and the Calendar stub.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+
+class FakeUpstreamError(Exception):
+    """Stands in for a Gemini API error; `code` is the HTTP status."""
+
+    def __init__(self, code: int):
+        super().__init__(f"{code} injected fault")
+        self.code = code
+
+
+class SlowChatModel(BaseChatModel):
+    """Tool call on a new user message, plain reply once the tool answered."""
+
+    latency: float = 0.5
+    tool_name: str = "check_availability"
+    reply: str = "You are free all afternoon."
+    # Share of calls that fail with FakeUpstreamError(503)
+    error_rate: float = 0.0
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeUpstreamError(503)
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "SlowChatModel":
+        return self
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        if messages and isinstance(messages[-1], ToolMessage):
+            message = AIMessage(content=self.reply)
+        else:
+            message = AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": self.tool_name,
+                    "args": {"start_iso": "2030-01-07T09:00:00", "end_iso": "2030-01-07T18:00:00"},
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                }],
+            )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        self._maybe_fail()
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        return self._respond(messages)
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Replays recorded responses. `recordings` maps each user message to what
+    the model answered in that turn, in order: typically one or more
+    {"tool_calls": [{"name", "args"}]} steps, then {"content": "..."}. The
+    step is picked by counting model responses since the last user message,
+    so it works with windowed history and concurrent conversations.
+
+    Prompt and completion sizes (characters of message content and tool
+    arguments) are counted as a proxy for bytes sent to / received from
+    Gemini; `tool_result_bytes` is the part of the prompts that is tool
+    results. Turns without a recording answer with a placeholder and count
+    as misses. `last_messages` is the prompt of the most recent call.
+    """
+
+    recordings: Dict[str, List[Dict[str, Any]]]
+    latency: float = 0.0
+    last_messages: List[BaseMessage] = []
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: Dict[str, int] = PrivateAttr(
+        default_factory=lambda: {
+            "calls": 0, "misses": 0, "prompt_bytes": 0, "tool_result_bytes": 0, "completion_bytes": 0,
+        }
+    )
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay-fake"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ReplayChatModel":
+        return self
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    @staticmethod
+    def _size(message: BaseMessage) -> int:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        tool_calls = getattr(message, "tool_calls", None)
+        return len(content) + (len(json.dumps([c["args"] for c in tool_calls])) if tool_calls else 0)
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        step = 0
+        user = ""
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                user = message.content if isinstance(message.content, str) else str(message.content)
+                break
+            if isinstance(message, AIMessage):
+                step += 1
+        steps = self.recordings.get(user.strip(), [])
+        if step < len(steps):
+            recorded = steps[step]
+            message = AIMessage(
+                content=recorded.get("content", ""),
+                tool_calls=[
+                    {"name": c["name"], "args": c["args"], "id": f"call_{uuid.uuid4().hex[:12]}"}
+                    for c in recorded.get("tool_calls", [])
+                ],
+            )
+        else:
+            message = AIMessage(content="(no recording for this turn)")
+        with self._lock:
+            self.last_messages = list(messages)
+            self._stats["calls"] += 1
+            self._stats["misses"] += step >= len(steps)
+            self._stats["prompt_bytes"] += sum(self._size(m) for m in messages)
+            self._stats["tool_result_bytes"] += sum(
+                self._size(m) for m in messages if isinstance(m, ToolMessage)
+            )
+            self._stats["completion_bytes"] += self._size(message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
@@ -0,0 +1,150 @@
+"""
+Load test: threaded Flask (gunicorn) versus the ASGI app (uvicorn).
+
+    python -m benchmarks.load_test [--concurrency 64] [--requests 256]
+                                   [--threads 8] [--llm-latency 0.5]
+
+Starts each server in turn on a local port with the offline agent from
+benchmarks.fake_agent (two model calls and one calendar call per turn, all
+simulated with sleeps), drives POST /api/chat from `concurrency` clients
+(one conversation each) and reports requests/sec and p50/p99 latency.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _server_command(mode: str, port: int, threads: int) -> List[str]:
+    if mode == "flask":
+        return [
+            sys.executable, "-m", "gunicorn", "--workers", "1", "--threads", str(threads),
+            "--bind", f"127.0.0.1:{port}", "--log-level", "warning",
+            "benchmarks.fake_agent:flask_app",
+        ]
+    return [
+        sys.executable, "-m", "uvicorn", "benchmarks.fake_agent:asgi_app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+    ]
+
+
+def _wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            httpx.get(base_url + "/", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start in time")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def _drive(base_url: str, concurrency: int, total: int, timeout: float) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def client_loop(n: int) -> None:
+        nonlocal remaining, errors
+        # Own client per conversation so each keeps its session cookie
+        async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    r = await client.post("/api/chat", json={"message": f"Am I free, client {n}?"})
+                    ok = r.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1) if latencies else 0.0,
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, float]:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY", "offline"),
+        GOOGLE_CALENDAR_ID=os.getenv("GOOGLE_CALENDAR_ID", "primary"),
+        BENCH_LLM_LATENCY=str(args.llm_latency),
+        BENCH_CALENDAR_LATENCY=str(args.calendar_latency),
+        CONVERSATION_STORE="memory://",
+    )
+    proc = subprocess.Popen(
+        _server_command(mode, port, args.threads), cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(base_url, proc)
+        return asyncio.run(_drive(base_url, args.concurrency, args.requests, args.timeout))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads (Flask mode)")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--calendar-latency", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--modes", default="flask,asgi")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = {mode: run_mode(mode, args) for mode in args.modes.split(",")}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"concurrency={args.concurrency} requests={args.requests} "
+          f"llm={args.llm_latency}s calendar={args.calendar_latency}s")
+    for mode, r in results.items():
+        label = f"flask (gunicorn, {args.threads} threads)" if mode == "flask" else "asgi (uvicorn)"
+        print(f"{label:32} {r['rps']:7.1f} req/s  p50 {r['p50_ms']:8.1f} ms  "
+              f"p99 {r['p99_ms']:8.1f} ms  errors {r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
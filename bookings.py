@@ -0,0 +1,146 @@
+"""
+Booking idempotency.
+
+A booking is identified by a stable key derived from the tenant and its
+calendar, the conversation, the slot (as absolute times, so equivalent ISO
+spellings match) and the sorted attendee list; keys sent by API clients are
+scoped to the tenant and calendar the same way (`client_key`). Two tenants
+booking the same slot for the same people therefore never share a key. The key doubles as the Calendar event id and the Meet
+`requestId`, so:
+
+- a repeated create_meeting call in the same process is answered from a
+  short-lived local ledger without any API call;
+- a retried HTTP insert (or the same booking from another worker) hits
+  "409 already exists" on the event id and the existing event is returned
+  instead of a duplicate with duplicate invites.
+
+The current conversation id reaches the tools through a context variable
+set by chat_service for each turn.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from dateutil import parser as date_parser
+from dateutil import tz as dateutil_tz
+
+from config import BOOKING_LEDGER_TTL_SECONDS
+from tenants import current
+
+# Conversation the current turn belongs to ("" outside a chat turn)
+current_conversation: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_conversation", default=""
+)
+
+# Ledger entries kept at most (oldest evicted first)
+_LEDGER_MAX_ENTRIES = 10000
+
+
+def _instant(value: str) -> str:
+    """Epoch seconds of an ISO time (naive = the tenant's timezone), else the raw value."""
+    try:
+        parsed = date_parser.parse(value)
+    except (ValueError, OverflowError):
+        return value.strip()
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dateutil_tz.gettz(current().timezone))
+    return str(int(parsed.timestamp()))
+
+
+def booking_key(
+    conversation_id: str, start_iso: str, end_iso: str, attendees: Iterable[str]
+) -> str:
+    """
+    Stable idempotency key for one booking.
+
+    32 lowercase hex characters, which is also a valid Calendar event id
+    (base32hex alphabet, 5-1024 characters). Scoped to the current tenant's
+    calendar.
+    """
+    tenant = current()
+    people = ",".join(sorted({a.strip().lower() for a in attendees if a.strip()}))
+    raw = (
+        f"{tenant.key}|{tenant.calendar_id}|{conversation_id}"
+        f"|{_instant(start_iso)}|{_instant(end_iso)}|{people}"
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def client_key(idempotency_key: str) -> str:
+    """Key for an idempotency key sent by an API client, scoped like booking_key."""
+    tenant = current()
+    raw = f"client|{tenant.key}|{tenant.calendar_id}|{idempotency_key.strip()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class BookingLedger:
+    """
+    Recently created events by idempotency key, with a TTL.
+
+    Counters:
+    - ledger_hits: bookings answered from the ledger (no API call)
+    - conflicts: inserts that found the event id already taken and
+      returned the existing event
+    - conference_polls: events.get calls made while waiting for Meet
+    - api_calls_saved: Calendar calls avoided compared with inserting
+      every booking (one insert per ledger hit)
+    """
+
+    def __init__(self, ttl_seconds: float = BOOKING_LEDGER_TTL_SECONDS):
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._counters = {"ledger_hits": 0, "conflicts": 0, "conference_polls": 0, "api_calls_saved": 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._counters["ledger_hits"] += 1
+            self._counters["api_calls_saved"] += 1
+            return entry[1]
+
+    def contains(self, key: str) -> bool:
+        """Whether `key` was booked recently (not counted as a hit)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] >= time.time()
+
+    def put(self, key: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self._ttl, event)
+            self._entries.move_to_end(key)
+            while len(self._entries) > _LEDGER_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += n
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+
+_ledger: Optional[BookingLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> BookingLedger:
+    """Process-wide booking ledger."""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = BookingLedger()
+    return _ledger
@@ -0,0 +1,368 @@
+"""
+Push notifications for calendar changes (Calendar `events.watch`).
+
+With CALENDAR_WEBHOOK_URL set (and AVAILABILITY_BACKEND=index), every
+tenant whose busy index is in memory gets a watch channel on its calendar
+that points at POST /webhooks/calendar. Google calls that URL whenever an
+event changes; the notification queues an incremental sync of the tenant's
+index on a background worker, and cached availability answers are dropped
+once the sync sees a change. External edits show up within seconds and,
+while a channel is live, the index polls only every
+CALENDAR_PUSH_MAX_STALENESS_SECONDS as a safety net, so no Calendar read
+sits on the request path.
+
+One worker thread registers channels, renews them
+CALENDAR_WATCH_RENEW_MARGIN_SECONDS before they expire (new channel first,
+then the old one is stopped), stops them when a tenant's index is evicted
+and runs the syncs. Repeated notifications for a tenant while its sync is
+queued collapse into one.
+
+Notifications are authenticated by the channel token: the tenant key and
+an HMAC of it under CALENDAR_WEBHOOK_SECRET. Channels survive a restart
+(until they expire) and their notifications are still accepted.
+
+`warm_up` (run by app.py at startup) syncs and watches the first
+TENANT_CACHE_SIZE tenants in the background. benchmarks/calendar_stub.py
+implements watch channels and sends the same notifications, for local
+testing without a public URL (see benchmarks/bench_push.py).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import resilience
+from config import (
+    CALENDAR_CALL_DEADLINE_SECONDS,
+    CALENDAR_WATCH_RENEW_MARGIN_SECONDS,
+    CALENDAR_WATCH_TTL_SECONDS,
+    CALENDAR_WEBHOOK_SECRET,
+    CALENDAR_WEBHOOK_URL,
+    RESPONSE_CACHE_ENABLED,
+    TENANT_CACHE_SIZE,
+)
+from tenants import Tenant, UnknownTenant, current_tenant, get_tenant, get_tenants
+
+# Retry a failed channel registration after this many seconds
+_RETRY_SECONDS = 60
+
+
+def channel_token(tenant_key: str) -> str:
+    """Token sent back with every notification of the tenant's channels."""
+    digest = hmac.new(
+        CALENDAR_WEBHOOK_SECRET.encode("utf-8"), tenant_key.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+    return f"{tenant_key}.{digest[:40]}"
+
+
+def tenant_key_of(token: str) -> Optional[str]:
+    """Tenant key of a channel token, or None if the token isn't ours."""
+    key, _, _ = token.rpartition(".")
+    if key and hmac.compare_digest(channel_token(key), token):
+        return key
+    return None
+
+
+class Channel:
+    def __init__(self, channel_id: str, resource_id: str, expires_at: float):
+        self.id = channel_id
+        self.resource_id = resource_id
+        self.expires_at = expires_at
+
+
+class PushChannels:
+    """
+    Watch channels of the tenants in memory, and the worker that keeps them
+    alive and applies their notifications.
+
+    Counters:
+    - notifications: accepted notifications (sync messages included)
+    - rejected: notifications with a bad token or for an unknown tenant
+    - syncs / changes: syncs run, and those that changed the busy data
+    - coalesced: notifications folded into an already queued sync
+    - watches / renewals / stops / failures: channel API calls
+    """
+
+    def __init__(
+        self,
+        address: Optional[str] = CALENDAR_WEBHOOK_URL,
+        ttl_seconds: int = CALENDAR_WATCH_TTL_SECONDS,
+        renew_margin_seconds: int = CALENDAR_WATCH_RENEW_MARGIN_SECONDS,
+    ):
+        self.address = address
+        self._ttl = ttl_seconds
+        self._renew_margin = renew_margin_seconds
+        self._lock = threading.Lock()
+        self._channels: Dict[str, Channel] = {}
+        # Tenant key -> when to (re-)register its channel
+        self._due: Dict[str, float] = {}
+        # Tenants with a sync queued
+        self._pending: set = set()
+        self._jobs: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._counters = {
+            "notifications": 0, "rejected": 0, "syncs": 0, "changes": 0, "coalesced": 0,
+            "watches": 0, "renewals": 0, "stops": 0, "failures": 0,
+        }
+
+    # ------------- Channels -------------
+
+    def watch(self, tenant: Tenant) -> None:
+        """Register a channel for the tenant's calendar (asynchronously)."""
+        self._start()
+        with self._lock:
+            if tenant.key in self._channels or tenant.key in self._due:
+                return
+            self._due[tenant.key] = 0.0
+        self._jobs.put(("wake", None))
+
+    def unwatch(self, tenant_key: str) -> None:
+        """Stop the tenant's channel (asynchronously); its index was dropped."""
+        with self._lock:
+            self._due.pop(tenant_key, None)
+            channel = self._channels.pop(tenant_key, None)
+        if channel is not None:
+            self._jobs.put(("stop", (tenant_key, channel)))
+
+    def _register(self, tenant: Tenant) -> Channel:
+        from calendar_service import get_manager
+
+        channel_id = uuid.uuid4().hex
+        body = {
+            "id": channel_id,
+            "type": "web_hook",
+            "address": self.address,
+            "token": channel_token(tenant.key),
+            "params": {"ttl": str(self._ttl)},
+        }
+        result = resilience.call(
+            "calendar",
+            "calendar.events.watch",
+            lambda: get_manager(tenant)
+            .get_service()
+            .events()
+            .watch(calendarId=tenant.calendar_id, body=body)
+            .execute(),
+            deadline=CALENDAR_CALL_DEADLINE_SECONDS,
+        )
+        expires_at = float(result.get("expiration") or 0) / 1000 or time.time() + self._ttl
+        return Channel(result.get("id", channel_id), result["resourceId"], expires_at)
+
+    def _stop(self, tenant_key: str, channel: Channel) -> None:
+        from calendar_service import get_manager
+
+        try:
+            tenant = get_tenant(tenant_key)
+            resilience.call(
+                "calendar",
+                "calendar.channels.stop",
+                lambda: get_manager(tenant)
+                .get_service()
+                .channels()
+                .stop(body={"id": channel.id, "resourceId": channel.resource_id})
+                .execute(),
+                deadline=CALENDAR_CALL_DEADLINE_SECONDS,
+                retries=1,
+            )
+            self._count("stops")
+        except Exception as e:
+            # It expires on its own; until then it only causes extra syncs
+            print(f"Could not stop watch channel {channel.id} of {tenant_key}: {e}")
+
+    def _renew(self, tenant_key: str) -> None:
+        with self._lock:
+            if tenant_key not in self._due:
+                return  # unwatched meanwhile
+            old = self._channels.get(tenant_key)
+        try:
+            tenant = get_tenant(tenant_key)
+            channel = self._register(tenant)
+        except Exception as e:
+            self._count("failures")
+            print(f"Watch channel for {tenant_key} failed, retrying in {_RETRY_SECONDS}s: {e}")
+            with self._lock:
+                if tenant_key in self._due:
+                    self._due[tenant_key] = time.time() + _RETRY_SECONDS
+            return
+
+        with self._lock:
+            # Unwatched while registering?
+            watched = tenant_key in self._due
+            if watched:
+                self._channels[tenant_key] = channel
+                self._due[tenant_key] = channel.expires_at - self._renew_margin
+        if not watched:
+            self._stop(tenant_key, channel)
+            return
+        self._count("renewals" if old else "watches")
+        self._mark_index(tenant_key, channel.expires_at)
+        if old is not None:
+            # The new channel is live, so no notification falls in a gap
+            self._stop(tenant_key, old)
+        else:
+            # Catch up on changes made before the channel existed
+            self._sync(tenant_key)
+
+    # ------------- Notifications -------------
+
+    def handle(self, headers: Mapping[str, str]) -> int:
+        """
+        Handle one notification (request headers); returns the HTTP status.
+        Only queues work, so Google gets its answer right away.
+        """
+        key = tenant_key_of(headers.get("X-Goog-Channel-Token") or "")
+        if key is None:
+            self._count("rejected")
+            return 403
+        try:
+            get_tenant(key)
+        except UnknownTenant:
+            self._count("rejected")
+            return 404
+        self._count("notifications")
+        if headers.get("X-Goog-Resource-State") == "sync":
+            # Channel confirmation; nothing changed yet
+            return 200
+        self._start()
+        with self._lock:
+            if key in self._pending:
+                self._counters["coalesced"] += 1
+                return 200
+            self._pending.add(key)
+        self._jobs.put(("sync", key))
+        return 200
+
+    def _sync(self, tenant_key: str) -> None:
+        from availability import loaded_index
+
+        with self._lock:
+            # Notifications from here on queue another sync
+            self._pending.discard(tenant_key)
+        index = loaded_index(tenant_key)
+        if index is None:
+            # Not in memory: the next use starts with a full sync anyway
+            return
+        before = index.version
+        try:
+            index.sync()
+        except Exception as e:
+            self._count("failures")
+            print(f"Push-triggered sync for {tenant_key} failed: {e}")
+            return
+        self._count("syncs")
+        if index.version != before:
+            self._count("changes")
+            if RESPONSE_CACHE_ENABLED:
+                from response_cache import get_cache
+
+                get_cache(get_tenant(tenant_key)).invalidate()
+
+    # ------------- Worker -------------
+
+    def _start(self) -> None:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._run, name="calendar-push", daemon=True
+                    )
+                    self._worker.start()
+
+    def _next_due(self) -> Optional[float]:
+        with self._lock:
+            return min(self._due.values(), default=None)
+
+    def _run(self) -> None:
+        while True:
+            due = self._next_due()
+            timeout = None if due is None else max(due - time.time(), 0.0)
+            try:
+                kind, arg = self._jobs.get(timeout=timeout)
+            except queue.Empty:
+                kind, arg = "wake", None
+            try:
+                if kind == "sync":
+                    self._run_for(arg, self._sync, arg)
+                elif kind == "stop":
+                    self._run_for(arg[0], self._stop, *arg)
+                self._renew_due()
+            except Exception as e:
+                print("Calendar push worker error:", e)
+
+    def _renew_due(self) -> None:
+        now = time.time()
+        with self._lock:
+            due = [key for key, at in self._due.items() if at <= now]
+        for key in due:
+            self._run_for(key, self._renew, key)
+
+    @staticmethod
+    def _run_for(tenant_key: str, fn, *args) -> None:
+        # Calendar code reads the current tenant
+        try:
+            tenant = get_tenant(tenant_key)
+        except UnknownTenant:
+            return
+        token = current_tenant.set(tenant)
+        try:
+            fn(*args)
+        finally:
+            current_tenant.reset(token)
+
+    @staticmethod
+    def _mark_index(tenant_key: str, live_until: float) -> None:
+        from availability import loaded_index
+
+        index = loaded_index(tenant_key)
+        if index is not None:
+            index.push_until = live_until
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counters, channels=len(self._channels))
+
+
+def warm_up() -> threading.Thread:
+    """
+    In the background, sync (and so watch) the busy indexes of as many
+    tenants as stay in memory, so first questions don't wait for a full sync.
+    """
+    from availability import get_index
+
+    def run() -> None:
+        for tenant in list(get_tenants().values())[:TENANT_CACHE_SIZE]:
+            token = current_tenant.set(tenant)
+            try:
+                get_index(tenant).sync()
+            except Exception as e:
+                print(f"Could not warm up availability for {tenant.key}: {e}")
+            finally:
+                current_tenant.reset(token)
+
+    thread = threading.Thread(target=run, name="calendar-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+_push: Optional[PushChannels] = None
+_push_lock = threading.Lock()
+
+
+def get_push() -> PushChannels:
+    """Process-wide channel registry, created on first use."""
+    global _push
+    if _push is None:
+        with _push_lock:
+            if _push is None:
+                _push = PushChannels()
+    return _push
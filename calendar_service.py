@@ -0,0 +1,220 @@
+"""
+Google Calendar service clients, one manager per tenant.
+
+Credentials are loaded from disk once and kept in memory. A background timer
+refreshes them shortly before they expire, so tool calls never pay for a
+synchronous token refresh. Each worker thread gets its own service object
+(httplib2 connections are not thread-safe) bound to a keep-alive HTTP
+connection, and the discovery document is parsed only once per process and
+shared by every tenant's manager.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urljoin
+
+import google_auth_httplib2
+import httplib2
+import requests
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+from config import (
+    CALENDAR_API_ENDPOINT,
+    CALENDAR_HTTP_TIMEOUT,
+    CREDENTIAL_REFRESH_MARGIN_SECONDS,
+    GOOGLE_OAUTH_TOKEN_FILE,
+)
+from google_oauth import load_credentials, save_credentials
+from metrics import span
+from tenants import Tenant, TenantLRU
+
+# Retry a failed background refresh after this many seconds
+_REFRESH_RETRY_SECONDS = 30
+
+_discovery_doc: Optional[Dict[str, Any]] = None
+_discovery_lock = threading.Lock()
+# One pooled HTTP session shared by all token refreshes, of all tenants
+_refresh_request = Request(session=requests.Session())
+
+
+def _get_discovery_doc() -> Dict[str, Any]:
+    global _discovery_doc
+    if _discovery_doc is None:
+        with _discovery_lock:
+            if _discovery_doc is None:
+                # Static document shipped with google-api-python-client;
+                # parsed once instead of on every build().
+                doc = json.loads(discovery_cache.get_static_doc("calendar", "v3"))
+                if CALENDAR_API_ENDPOINT:
+                    # api_endpoint only moves regular calls; batch requests
+                    # go to rootUrl + batchPath
+                    doc["rootUrl"] = urljoin(CALENDAR_API_ENDPOINT, "/")
+                _discovery_doc = doc
+    return _discovery_doc
+
+
+class CalendarServiceManager:
+    """
+    Owns the OAuth credentials and hands out per-thread Calendar services.
+
+    Counters:
+    - hits: a thread reused its existing service
+    - misses: a new service had to be built (first use on a thread, or after
+      the credentials were replaced)
+    - refreshes / refresh_failures: access-token refresh attempts
+    """
+
+    def __init__(
+        self,
+        token_file: str = GOOGLE_OAUTH_TOKEN_FILE,
+        refresh_margin_seconds: int = CREDENTIAL_REFRESH_MARGIN_SECONDS,
+    ):
+        self._token_file = token_file
+        self._refresh_margin = datetime.timedelta(seconds=refresh_margin_seconds)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._creds: Optional[Credentials] = None
+        # Bumped whenever the credentials are replaced so threads rebuild
+        self._generation = 0
+        self._timer: Optional[threading.Timer] = None
+        self._counters = {"hits": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0}
+
+    # ------------- Credentials -------------
+
+    def _ensure_credentials(self) -> Credentials:
+        creds = self._creds
+        if creds is not None and not self._needs_refresh(creds):
+            return creds
+
+        with self._lock:
+            if self._creds is None:
+                creds = load_credentials(self._token_file)
+                if not creds:
+                    # No OAuth token yet – tell developer to visit /auth/google
+                    raise RuntimeError(
+                        "Google OAuth credentials not found. "
+                        "Open http://localhost:5000/auth/google in your browser and authorize."
+                    )
+                self._creds = creds
+                self._generation += 1
+                self._schedule_refresh()
+            elif self._needs_refresh(self._creds):
+                # The background timer did not get to it (e.g. the process
+                # was suspended); refresh inline rather than send a stale token.
+                self._refresh_locked()
+            return self._creds
+
+    def _needs_refresh(self, creds: Credentials) -> bool:
+        if not creds.expiry or not creds.refresh_token:
+            return False
+        return self._time_to_expiry(creds) <= self._refresh_margin
+
+    @staticmethod
+    def _time_to_expiry(creds: Credentials) -> datetime.timedelta:
+        # google-auth stores expiry as a naive UTC datetime
+        expiry = creds.expiry.replace(tzinfo=datetime.timezone.utc)
+        return expiry - datetime.datetime.now(datetime.timezone.utc)
+
+    def _refresh_locked(self) -> None:
+        creds = self._creds
+        if creds is None or not creds.refresh_token:
+            return
+        try:
+            with span("credential_refresh"):
+                creds.refresh(_refresh_request)
+            save_credentials(creds, self._token_file)
+            self._counters["refreshes"] += 1
+        except Exception:
+            self._counters["refresh_failures"] += 1
+            raise
+        finally:
+            self._schedule_refresh()
+
+    def _schedule_refresh(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        creds = self._creds
+        if creds is None or not creds.expiry or not creds.refresh_token:
+            return
+
+        delay = (self._time_to_expiry(creds) - self._refresh_margin).total_seconds()
+        self._timer = threading.Timer(max(delay, 0), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self) -> None:
+        with self._lock:
+            try:
+                self._refresh_locked()
+            except Exception as e:
+                print("Credential refresh failed, retrying:", e)
+                self._timer = threading.Timer(_REFRESH_RETRY_SECONDS, self._background_refresh)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def set_credentials(self, creds: Credentials) -> None:
+        """Replace the in-memory credentials (e.g. after the OAuth callback)."""
+        with self._lock:
+            self._creds = creds
+            self._generation += 1
+            self._schedule_refresh()
+
+    def close(self) -> None:
+        """Stop background refreshes (the manager is being dropped)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    # ------------- Service -------------
+
+    def get_service(self):
+        """Return the Calendar service for the current thread."""
+        creds = self._ensure_credentials()
+        local = self._local
+        if getattr(local, "generation", None) == self._generation:
+            self._counters["hits"] += 1
+            return local.service
+
+        # A persistent httplib2.Http keeps connections to googleapis.com alive
+        # between requests made from this thread.
+        http = google_auth_httplib2.AuthorizedHttp(
+            creds, http=httplib2.Http(timeout=CALENDAR_HTTP_TIMEOUT)
+        )
+        client_options = (
+            {"api_endpoint": CALENDAR_API_ENDPOINT} if CALENDAR_API_ENDPOINT else None
+        )
+        local.service = build_from_document(
+            _get_discovery_doc(), http=http, client_options=client_options
+        )
+        local.generation = self._generation
+        self._counters["misses"] += 1
+        return local.service
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._counters)
+
+
+_managers: TenantLRU[CalendarServiceManager] = TenantLRU(
+    lambda tenant: CalendarServiceManager(token_file=tenant.token_file),
+    close=lambda key, manager: manager.close(),
+)
+
+
+def get_manager(tenant: Optional[Tenant] = None) -> CalendarServiceManager:
+    """Manager of `tenant` (default: the current tenant)."""
+    return _managers.get(tenant)
+
+
+def get_service():
+    """Shortcut for the current tenant's per-thread service."""
+    return _managers.get().get_service()
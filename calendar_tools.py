@@ -1,39 +1,145 @@
 from __future__ import annotations
 
-import uuid
-from typing import List, Dict, Any
+import bisect
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
-from config import CALENDAR_ID, DEFAULT_TIMEZONE
-from google_oauth import load_credentials
+import resilience
+from bookings import booking_key, client_key, get_ledger
+from calendar_service import get_service
+from config import CALENDAR_CALL_DEADLINE_SECONDS, MEET_LINK_POLL_SECONDS
+from tenants import current
+
+# freeBusy.query accepts at most this many calendars per request
+_FREEBUSY_MAX_CALENDARS = 50
+# Deterministic event ids tried per booking (see _insert_once)
+_MAX_ID_ATTEMPTS = 3
+# First Meet-link poll delay (seconds); doubles after each poll
+_POLL_INITIAL_DELAY = 0.25
+# The batch HTTP endpoint accepts at most this many requests per round-trip
+_BATCH_MAX_REQUESTS = 50
+# Batch bookings must start at least this many seconds from now
+_MIN_LEAD_SECONDS = 60
+# Largest page the events endpoint allows
+_PAGE_SIZE = 2500
+
+# Partial-response masks for events.list (`fields=`): busy-time math needs
+# only these, and skipping descriptions, attendees, conference data and
+# links shrinks pages of recurring instances several times over
+BUSY_EVENT_FIELDS = "id,status,transparency,start,end"
+LISTED_EVENT_FIELDS = BUSY_EVENT_FIELDS + ",summary"
 
 def _get_calendar_service():
-    creds = load_credentials()
-    if not creds:
-        # No OAuth token yet – tell developer to visit /auth/google
-        raise RuntimeError(
-            "Google OAuth credentials not found. "
-            "Open http://localhost:5000/auth/google in your browser and authorize."
+    # Pooled, per-thread service; credentials stay in memory between calls
+    return get_service()
+
+def execute(
+    name: str,
+    build_request: Callable[[Any], Any],
+    hedge: bool = False,
+    retries: int | None = None,
+) -> Dict[str, Any]:
+    """
+    Execute a Calendar API request through the resilience layer (retries,
+    deadline, circuit breaker, optional hedging). `build_request` receives
+    a service and returns the request, e.g.
+    `lambda s: s.events().get(calendarId=..., eventId=...)`; it is rebuilt
+    on the worker thread that runs each attempt.
+    """
+    kwargs = {} if retries is None else {"retries": retries}
+    return resilience.call(
+        "calendar",
+        name,
+        lambda: build_request(_get_calendar_service()).execute(),
+        deadline=CALENDAR_CALL_DEADLINE_SECONDS,
+        hedge=hedge,
+        **kwargs,
+    )
+
+def iter_event_pages(
+    calendar_id: str,
+    item_fields: str = BUSY_EVENT_FIELDS,
+    service_factory: Callable[[], Any] = _get_calendar_service,
+    **params: Any,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Pages of events.list (recurring events expanded into instances),
+    following nextPageToken. Each page is requested once the previous one
+    has been consumed, so callers can convert and drop pages as they go.
+    Items carry only `item_fields`; the last page has nextSyncToken.
+    """
+    fields = f"nextPageToken,nextSyncToken,items({item_fields})"
+    page_token = None
+    while True:
+        page = resilience.call(
+            "calendar",
+            "calendar.events.list",
+            lambda token=page_token: service_factory()
+            .events()
+            .list(
+                calendarId=calendar_id,
+                singleEvents=True,
+                maxResults=_PAGE_SIZE,
+                pageToken=token,
+                fields=fields,
+                **params,
+            )
+            .execute(),
+            deadline=CALENDAR_CALL_DEADLINE_SECONDS,
+            hedge=True,
         )
-    service = build("calendar", "v3", credentials=creds)
-    return service
+        yield page
+        page_token = page.get("nextPageToken")
+        if not page_token:
+            return
 
 def list_events(start_iso: str, end_iso: str) -> List[Dict[str, Any]]:
-    """List events in the time range, returned as raw Google event objects."""
-    service = _get_calendar_service()
-    events_result = (
-        service.events()
-        .list(
-            calendarId=CALENDAR_ID,
-            timeMin=start_iso,
-            timeMax=end_iso,
-            singleEvents=True,
-            orderBy="startTime",
+    """
+    Events in the time range in start order, as Google event objects
+    trimmed to LISTED_EVENT_FIELDS.
+    """
+    events: List[Dict[str, Any]] = []
+    for page in iter_event_pages(
+        current().calendar_id,
+        LISTED_EVENT_FIELDS,
+        timeMin=start_iso,
+        timeMax=end_iso,
+        orderBy="startTime",
+    ):
+        events.extend(page.get("items", []))
+    return events
+
+def query_free_busy(
+    start_iso: str, end_iso: str, calendar_ids: List[str] | None = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Busy intervals per calendar from the freeBusy API.
+
+    Returns {calendar_id: {"busy": [{"start", "end"}], "errors": [...]}}.
+    Only busy ranges are transferred, never event details. The API accepts
+    at most 50 calendars per request, so larger lists are chunked.
+    """
+    tenant = current()
+    calendar_ids = calendar_ids or [tenant.calendar_id]
+    calendars: Dict[str, Dict[str, Any]] = {}
+    for i in range(0, len(calendar_ids), _FREEBUSY_MAX_CALENDARS):
+        chunk = calendar_ids[i:i + _FREEBUSY_MAX_CALENDARS]
+        result = execute(
+            "calendar.freebusy.query",
+            lambda service: service.freebusy().query(
+                body={
+                    "timeMin": start_iso,
+                    "timeMax": end_iso,
+                    "timeZone": tenant.timezone,
+                    "items": [{"id": cal_id} for cal_id in chunk],
+                }
+            ),
+            hedge=True,
         )
-        .execute()
-    )
-    return events_result.get("items", [])
+        calendars.update(result.get("calendars", {}))
+    return calendars
 
 def create_event(
     summary: str,
@@ -42,15 +148,60 @@ def create_event(
     attendees_emails: List[str] | None = None,
     description: str = "",
     location: str | None = None,
+    idempotency_key: str | None = None,
+    defer_followups: bool = False,
 ) -> Dict[str, Any]:
-    """Create a new event with Google Meet and real attendees; return event object."""
-    service = _get_calendar_service()
+    """
+    Create a new event with Google Meet and real attendees in the current
+    tenant's calendar; return event object.
 
+    `idempotency_key` (a bookings.booking_key or client_key; derived from
+    the slot and attendees when omitted) is used as the event id and Meet requestId, so
+    repeating the same booking returns the existing event instead of
+    creating a duplicate.
+
+    With `defer_followups` the event is returned as soon as it is inserted,
+    without attendees and usually before its Meet link exists; background
+    jobs (followups.py) then invite the attendees and fetch the link.
+    """
+    ledger = get_ledger()
+    key = idempotency_key or booking_key("", start_iso, end_iso, attendees_emails or [])
+    cached = ledger.get(key)
+    if cached is not None:
+        return cached
+
+    if defer_followups:
+        from followups import schedule
+
+        # The invite job adds the attendees, which sends the invitations
+        event_body = _event_body(summary, start_iso, end_iso, None, description, location, key)
+        event = _insert_once(event_body, key, send_updates="none")
+        schedule(event, attendees_emails or [], key)
+    else:
+        event_body = _event_body(
+            summary, start_iso, end_iso, attendees_emails, description, location, key
+        )
+        event = _insert_once(event_body, key)
+        event = _wait_for_conference(event)
+    ledger.put(key, event)
+    return event
+
+
+def _event_body(
+    summary: str,
+    start_iso: str,
+    end_iso: str,
+    attendees_emails: List[str] | None,
+    description: str,
+    location: str | None,
+    key: str,
+) -> Dict[str, Any]:
+    timezone = current().timezone
     event_body: Dict[str, Any] = {
         "summary": summary,
         "description": description or "",
-        "start": {"dateTime": start_iso, "timeZone": DEFAULT_TIMEZONE},
-        "end": {"dateTime": end_iso, "timeZone": DEFAULT_TIMEZONE},
+        "start": {"dateTime": start_iso, "timeZone": timezone},
+        "end": {"dateTime": end_iso, "timeZone": timezone},
     }
 
     # Real attendees now allowed with OAuth
@@ -60,57 +211,406 @@ def create_event(
     if location:
         event_body["location"] = location
 
-    # Ask Google to create a Meet link
+    # Ask Google to create a Meet link; the same requestId never yields a
+    # second conference
     event_body["conferenceData"] = {
         "createRequest": {
-            "requestId": f"meet-{uuid.uuid4().hex[:8]}-{start_iso[:10]}",
+            "requestId": key,
             "conferenceSolutionKey": {"type": "hangoutsMeet"},
         }
     }
+    return event_body
+
 
+def _insert_request(
+    calendar_id: str, event_body: Dict[str, Any], event_id: str, send_updates: str = "all"
+):
     # Create event with conferenceDataVersion=1 to actually get the Meet link
-    event = (
-        service.events()
-        .insert(
-            calendarId=CALENDAR_ID,
-            body=event_body,
-            conferenceDataVersion=1,
-            sendUpdates="all",  # send email invites to attendees
+    return lambda service: service.events().insert(
+        calendarId=calendar_id,
+        body=dict(event_body, id=event_id),
+        conferenceDataVersion=1,
+        sendUpdates=send_updates,  # "all": send email invites to attendees
+    )
+
+
+def _insert_once(event_body: Dict[str, Any], key: str, send_updates: str = "all") -> Dict[str, Any]:
+    """Insert under a deterministic event id; return the existing event on 409."""
+    ledger = get_ledger()
+    calendar_id = current().calendar_id
+    for attempt in range(_MAX_ID_ATTEMPTS):
+        # A cancelled event keeps its id, so re-booking after a cancellation
+        # moves on to the next deterministic id
+        event_id = key if attempt == 0 else f"{key}v{attempt}"
+        try:
+            # Retrying is safe: a repeat of an insert that did land gets 409
+            return execute(
+                "calendar.events.insert",
+                _insert_request(calendar_id, event_body, event_id, send_updates),
+            )
+        except HttpError as e:
+            if e.resp.status != 409:
+                raise
+        existing = execute(
+            "calendar.events.get",
+            lambda service: service.events().get(calendarId=calendar_id, eventId=event_id),
         )
-        .execute()
+        if existing.get("status") != "cancelled":
+            ledger.count("conflicts")
+            return existing
+    raise RuntimeError(f"Could not create event for booking {key}: all event ids are taken")
+
+
+def _conference_status(event: Dict[str, Any]) -> str:
+    conference = event.get("conferenceData") or {}
+    if conference.get("entryPoints"):
+        return "success"
+    return (
+        conference.get("createRequest", {}).get("status", {}).get("statusCode")
+        or ("pending" if conference else "missing")
     )
 
-    # Sometimes the response may still not show conferenceData fully;
-    # fetch it again using conferenceDataVersion=1
+
+def meet_link(event: Dict[str, Any]) -> str:
+    """The event's Google Meet link, or "" if it has none (yet)."""
+    conference = event.get("conferenceData") or {}
+    # Most common: the video entry point
+    for entry_point in conference.get("entryPoints") or []:
+        if entry_point.get("entryPointType") == "video" and entry_point.get("uri"):
+            return entry_point["uri"]
+    # Legacy/alternative field
+    if event.get("hangoutLink"):
+        return event["hangoutLink"]
+    # Sometimes the link is in the conference solution
+    if conference.get("conferenceId") and (conference.get("conferenceSolution") or {}).get("uri"):
+        return conference["conferenceSolution"]["uri"]
+    # A location that is a Meet link
+    location = event.get("location") or ""
+    if "meet.google.com" in location or "hangouts.google.com" in location:
+        return location
+    return ""
+
+
+def _wait_for_conference(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Poll events.get with exponential backoff while the Meet link is being
+    created (createRequest status "pending"), for at most MEET_LINK_POLL_SECONDS.
+    A response that already carries the link costs no extra call.
+    """
     event_id = event.get("id")
-    if event_id and not event.get("conferenceData"):
+    calendar_id = current().calendar_id
+    deadline = time.monotonic() + MEET_LINK_POLL_SECONDS
+    delay = _POLL_INITIAL_DELAY
+    polls = 0
+    while event_id:
+        status = _conference_status(event)
+        # No conferenceData at all: one re-fetch, as before; then give up
+        if not (status == "pending" or status == "missing" and polls == 0):
+            break
+        if time.monotonic() + delay > deadline:
+            break
+        time.sleep(delay)
+        delay *= 2
+        polls += 1
+        get_ledger().count("conference_polls")
         try:
-            event = (
-                service.events()
-                .get(
-                    calendarId=CALENDAR_ID,
-                    eventId=event_id,
-                    conferenceDataVersion=1,
+            # The poll loop is its own retry; the booking itself already succeeded
+            event = execute(
+                "calendar.events.get",
+                lambda service: service.events().get(calendarId=calendar_id, eventId=event_id),
+                retries=0,
+            )
+        except (HttpError, resilience.UpstreamUnavailable):
+            break
+    return event
+
+
+# ------------- Batch bookings -------------
+
+
+def execute_batch(
+    name: str, requests: List[Tuple[str, Callable[[Any], Any]]]
+) -> Dict[str, Tuple[Dict[str, Any] | None, Exception | None]]:
+    """
+    Execute Calendar API requests through the batch HTTP endpoint, at most
+    _BATCH_MAX_REQUESTS per round-trip. `requests` are (request id,
+    build_request) pairs as for `execute`. Each round-trip goes through the
+    resilience layer as one call (retried as a whole on transient errors);
+    per-request failures are returned, not raised:
+    {request id: (response, None) or (None, exception)}.
+    """
+    results: Dict[str, Tuple[Dict[str, Any] | None, Exception | None]] = {}
+    for i in range(0, len(requests), _BATCH_MAX_REQUESTS):
+        chunk = requests[i:i + _BATCH_MAX_REQUESTS]
+
+        def run(chunk=chunk):
+            service = _get_calendar_service()
+            responses: Dict[str, Tuple[Dict[str, Any] | None, Exception | None]] = {}
+            batch = service.new_batch_http_request(
+                callback=lambda request_id, response, error: responses.__setitem__(
+                    request_id, (response, error)
                 )
-                .execute()
             )
-        except Exception:
-            pass
+            for request_id, build_request in chunk:
+                batch.add(build_request(service), request_id=request_id)
+            batch.execute()
+            return responses
+
+        results.update(
+            resilience.call("calendar", name, run, deadline=CALENDAR_CALL_DEADLINE_SECONDS)
+        )
+    return results
 
-    return event
+
+def create_events_batch(bookings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Book many meetings in the current tenant's calendar at once.
+
+    Each booking is a dict with start_iso and end_iso (ISO 8601; naive =
+    the tenant's timezone) and optionally title, attendees (list or
+    comma-separated emails), description, location and idempotency_key.
+
+    All slots are checked against availability with one busy-time query
+    spanning the batch. A slot that is busy, overlaps an earlier booking of
+    the same batch, or is held for a chat visitor (offered to them or being
+    booked by them, see holds.py) is not booked; the others are claimed in
+    the hold store until they are inserted. The rest are inserted through the
+    batch HTTP endpoint (50 per round-trip) and their Meet links are polled
+    together. Idempotent like create_event: the same booking sent again
+    returns the existing event.
+
+    Returns one result per booking, in order: {"status": "created", "event"},
+    or {"status": "invalid" | "conflict" | "failed", "error"}.
+    """
+    from availability import busy_intervals, iso_to_epoch
+    from holds import claim_slot, settle_slot
+
+    tenant = current()
+    ledger = get_ledger()
+    now = time.time()
+    results: List[Dict[str, Any]] = [{} for _ in bookings]
+    # (position, key, event body, start, end) of bookings to check and insert
+    todo: List[Tuple[int, str, Dict[str, Any], float, float]] = []
+    for n, booking in enumerate(bookings):
+        try:
+            start_iso = str(booking.get("start_iso") or "").strip()
+            end_iso = str(booking.get("end_iso") or "").strip()
+            if not start_iso or not end_iso:
+                raise ValueError("start_iso and end_iso are required")
+            try:
+                start, end = iso_to_epoch(start_iso), iso_to_epoch(end_iso)
+            except (ValueError, OverflowError) as e:
+                raise ValueError("start_iso and end_iso must be ISO 8601 times") from e
+            if end <= start:
+                raise ValueError("end_iso must be after start_iso")
+            if start <= now + _MIN_LEAD_SECONDS:
+                raise ValueError("start_iso must be in the future")
+        except ValueError as e:
+            results[n] = {"status": "invalid", "error": str(e)}
+            continue
+        attendees = booking.get("attendees") or []
+        if isinstance(attendees, str):
+            attendees = attendees.split(",")
+        attendees = [str(a).strip() for a in attendees if str(a).strip()]
+        key = (
+            client_key(str(booking["idempotency_key"])) if booking.get("idempotency_key")
+            else booking_key("", start_iso, end_iso, attendees)
+        )
+        cached = ledger.get(key)
+        if cached is not None:
+            results[n] = {"status": "created", "event": cached}
+            continue
+        body = _event_body(
+            booking.get("title") or tenant.default_title,
+            start_iso,
+            end_iso,
+            attendees,
+            booking.get("description") or "",
+            booking.get("location") or None,
+            key,
+        )
+        todo.append((n, key, body, start, end))
+    if not todo:
+        return results
+
+    # One availability query for the whole batch, merged into disjoint ranges
+    first = min(todo, key=lambda t: t[3])
+    last = max(todo, key=lambda t: t[4])
+    busy = _merge(busy_intervals(first[2]["start"]["dateTime"], last[2]["end"]["dateTime"]))
+    busy_starts, busy_ends = [s for s, _ in busy], [e for _, e in busy]
+    # Bookings accepted so far, disjoint and sorted by start
+    taken_starts: List[float] = []
+    taken_ends: List[float] = []
+    taken_by: List[int] = []
+    inserts: List[Tuple[int, str, Dict[str, Any]]] = []
+    # Position -> (start, end) of bookings claimed in the hold store
+    claimed: Dict[int, Tuple[float, float]] = {}
+    calendar_id = tenant.calendar_id
+    booked = _existing_bookings(
+        calendar_id,
+        [(n, key) for n, key, _, start, end in todo
+         if _overlap(busy_starts, busy_ends, start, end) is not None],
+    )
+    for n, key, body, start, end in todo:
+        if n in booked:
+            # Busy with this very booking (the batch is being retried)
+            ledger.put(key, booked[n])
+            results[n] = {"status": "created", "event": booked[n]}
+            continue
+        if _overlap(busy_starts, busy_ends, start, end) is not None:
+            results[n] = {"status": "conflict", "error": "The calendar is busy at that time"}
+            continue
+        j = _overlap(taken_starts, taken_ends, start, end)
+        if j is not None:
+            results[n] = {
+                "status": "conflict",
+                "error": f"Overlaps booking #{taken_by[j]} of this batch",
+            }
+            continue
+        if not claim_slot(start, end, key):
+            results[n] = {"status": "conflict", "error": "The slot is held for another visitor"}
+            continue
+        i = bisect.bisect_left(taken_starts, start)
+        taken_starts.insert(i, start)
+        taken_ends.insert(i, end)
+        taken_by.insert(i, n)
+        inserts.append((n, key, body))
+        claimed[n] = (start, end)
+
+    created: Dict[int, Dict[str, Any]] = {}
+    try:
+        _insert_batch(calendar_id, inserts, created, results)
+    finally:
+        keys = {n: key for n, key, _ in inserts}
+        for n, (start, end) in claimed.items():
+            settle_slot(start, end, keys[n], n in created)
+
+    for n, event in _wait_for_conferences(created).items():
+        ledger.put(keys[n], event)
+        results[n] = {"status": "created", "event": event}
+    return results
+
+
+def _insert_batch(
+    calendar_id: str,
+    inserts: List[Tuple[int, str, Dict[str, Any]]],
+    created: Dict[int, Dict[str, Any]],
+    results: List[Dict[str, Any]],
+) -> None:
+    """Insert (position, key, body) events in batches; fill `created` and failed `results`."""
+    responses = execute_batch(
+        "calendar.events.batch_insert",
+        [(str(n), _insert_request(calendar_id, body, key)) for n, key, body in inserts],
+    )
+    for n, key, body in inserts:
+        event, error = responses.get(str(n), (None, RuntimeError("No response in batch")))
+        if error is not None and (
+            isinstance(error, HttpError) and error.resp.status == 409 or resilience.is_transient(error)
+        ):
+            # Already exists (e.g. a retried batch) or a transient failure:
+            # the single-booking path sorts it out, with its own retries
+            try:
+                event, error = _insert_once(body, key), None
+            except Exception as e:
+                error = e
+        if error is not None:
+            results[n] = {"status": "failed", "error": str(error)}
+            continue
+        created[n] = event
+
+
+def _existing_bookings(calendar_id: str, candidates: List[Tuple[int, str]]) -> Dict[int, Dict[str, Any]]:
+    """
+    Of (position, key) pairs whose slot is busy, those already booked under
+    their key as event id (one batch of events.get).
+    """
+    if not candidates:
+        return {}
+    responses = execute_batch(
+        "calendar.events.batch_get",
+        [
+            (str(n), lambda service, event_id=key: service.events().get(
+                calendarId=calendar_id, eventId=event_id
+            ))
+            for n, key in candidates
+        ],
+    )
+    found: Dict[int, Dict[str, Any]] = {}
+    for n, _ in candidates:
+        event, _error = responses.get(str(n), (None, None))
+        if event is not None and event.get("status") != "cancelled":
+            found[n] = event
+    return found
+
+
+def _merge(intervals: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Sorted intervals merged into disjoint ones."""
+    merged: List[List[float]] = []
+    for start, end in sorted(intervals):
+        if merged and start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(s, e) for s, e in merged]
+
+
+def _overlap(starts: List[float], ends: List[float], start: float, end: float) -> int | None:
+    """Position of the disjoint, sorted interval overlapping [start, end), if any."""
+    # Disjoint intervals sorted by start are sorted by end too
+    i = bisect.bisect_right(ends, start)
+    return i if i < len(starts) and starts[i] < end else None
+
+
+def _wait_for_conferences(events: Dict[Any, Dict[str, Any]]) -> Dict[Any, Dict[str, Any]]:
+    """
+    _wait_for_conference for many events at once: the pending ones are
+    re-fetched together in one batch request per poll.
+    """
+    calendar_id = current().calendar_id
+    deadline = time.monotonic() + MEET_LINK_POLL_SECONDS
+    delay = _POLL_INITIAL_DELAY
+    events = dict(events)
+    while True:
+        pending = [
+            n for n, event in events.items()
+            if event.get("id") and _conference_status(event) == "pending"
+        ]
+        if not pending or time.monotonic() + delay > deadline:
+            return events
+        time.sleep(delay)
+        delay *= 2
+        get_ledger().count("conference_polls")
+        try:
+            responses = execute_batch(
+                "calendar.events.batch_get",
+                [
+                    (str(n), lambda service, event_id=events[n]["id"]: service.events().get(
+                        calendarId=calendar_id, eventId=event_id
+                    ))
+                    for n in pending
+                ],
+            )
+        except (HttpError, resilience.UpstreamUnavailable):
+            return events
+        for n in pending:
+            event, error = responses.get(str(n), (None, None))
+            if event is not None:
+                events[n] = event
+
+
+def _when(value: Dict[str, Any] | None) -> str | None:
+    # Timed events have dateTime, all-day events only date
+    value = value or {}
+    return value.get("dateTime") or value.get("date")
 
 
 def simplify_events(events: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     """Return simplified list for the LLM to understand (summary, start, end)."""
-    simplified = []
-    for e in events:
-        simplified.append(
-            {
-                "summary": e.get("summary", "(no title)"),
-                "start": e.get("start", {}).get(
-                    "dateTime", e.get("start", {}).get("date")
-                ),
-                "end": e.get("end", {}).get("dateTime", e.get("end", {}).get("date")),
-            }
-        )
-    return simplified
+    return [
+        {
+            "summary": e.get("summary", "(no title)"),
+            "start": _when(e.get("start")),
+            "end": _when(e.get("end")),
+        }
+        for e in events
+    ]
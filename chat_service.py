@@ -0,0 +1,495 @@
+"""
+One chat turn, independent of the web framework.
+
+Both the Flask app (app.py, thread per request) and the ASGI app (asgi.py,
+async) run turns through here so history handling, context windowing and
+reply extraction stay identical. Each turn runs for one tenant (see
+tenants.py) with that tenant's agent; agents are built on first use.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+import metrics
+from admission import PRIORITY_NEW, PRIORITY_ONGOING, Overloaded, aadmit, admit
+from bookings import current_conversation
+from chatbot import build_agent, get_upstream_semaphore
+from conversation_context import prepare_turn
+from config import RESPONSE_CACHE_ENABLED
+from conversation_store import get_store
+from fast_path import record_agent_turn, try_fast_path
+from resilience import UpstreamUnavailable
+from response_cache import cacheable, get_cache, reads_calendar
+from tenants import Tenant, TenantLRU, current_tenant
+from tool_format import BOOKED_LEAD, parse_booking, render_booking
+
+# One agent per tenant (its prompt), all sharing the Gemini client
+_agents = TenantLRU(lambda tenant: build_agent(tenant=tenant))
+# Set to answer every tenant with one prebuilt agent (offline benchmarks)
+agent = None
+
+ERROR_REPLY = (
+    "Sorry, something went wrong while processing your request. "
+    "Please try again in a moment."
+)
+
+# Shown when Gemini or Calendar is failing (retries exhausted / circuit open)
+UNAVAILABLE_REPLIES = {
+    "calendar": (
+        "Sorry, I can't reach the calendar right now, so I can't check or book "
+        "times. Please try again in a minute."
+    ),
+    "gemini": (
+        "Sorry, the assistant is temporarily unavailable. Please try again in a minute."
+    ),
+}
+
+# Progress labels shown in the widget while a tool runs
+TOOL_LABELS = {
+    "check_availability": "Checking calendar…",
+    "find_free_slots": "Looking for free slots…",
+    "create_meeting": "Booking…",
+}
+
+# Shown when the admission queue turned the turn away (see admission.py)
+BUSY_REPLY = (
+    "Sorry, we're handling a lot of conversations right now. "
+    "Please try again in a moment."
+)
+
+Event = Tuple[str, Dict[str, Any]]
+
+
+def get_agent(tenant: Optional[Tenant] = None):
+    """Agent of `tenant` (default: the current tenant)."""
+    return agent or _agents.get(tenant)
+
+
+def _start_turn(conversation_id: str, tenant: Optional[Tenant]) -> None:
+    # Tools and calendar code read these; set on every turn so a reused
+    # worker thread never carries the previous request's values
+    current_conversation.set(conversation_id)
+    current_tenant.set(tenant)
+
+
+# ------------- History -------------
+
+
+def load_history(conversation_id: str) -> List[BaseMessage]:
+    # Convert stored dicts back to message objects
+    messages: List[BaseMessage] = []
+    for msg_dict in get_store().load(conversation_id):
+        if msg_dict["type"] == "human":
+            messages.append(HumanMessage(content=msg_dict["content"]))
+        elif msg_dict["type"] == "ai":
+            messages.append(AIMessage(content=msg_dict["content"]))
+    return messages
+
+
+def save_history(conversation_id: str, new_messages: List[BaseMessage]) -> None:
+    """Append this turn's human/AI messages; tool messages are not replayed."""
+    messages_dicts = []
+    for msg in new_messages:
+        if isinstance(msg, HumanMessage):
+            content = msg.content if isinstance(msg.content, str) else str(msg.content)
+            messages_dicts.append({"type": "human", "content": content})
+        elif isinstance(msg, AIMessage):
+            content = msg.content if isinstance(msg.content, str) else str(msg.content)
+            messages_dicts.append({"type": "ai", "content": content})
+    get_store().append(conversation_id, messages_dicts)
+
+
+# ------------- Replies -------------
+
+
+def content_text(content: Any) -> str:
+    """Plain text of a message content (string, list of blocks, or dict)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # Extract text from content blocks (handle dict items in list)
+        text_parts = []
+        for item in content:
+            if isinstance(item, str):
+                text_parts.append(item)
+            elif isinstance(item, dict):
+                # Extract text from dict if it has a 'text' key
+                text_parts.append(item.get('text', str(item)))
+            else:
+                text_parts.append(str(item))
+        return " ".join(text_parts)
+    if isinstance(content, dict):
+        return content.get('text', str(content))
+    return str(content) if content else ""
+
+
+def final_reply(output_messages: List[BaseMessage]) -> str:
+    # Find the last AI message (skip tool messages)
+    ai_messages = [msg for msg in output_messages if isinstance(msg, AIMessage)]
+    if not ai_messages:
+        print("Warning: No AI messages found in agent output.")
+        return "I'm sorry, I couldn't generate a response. Please try again."
+
+    content = ai_messages[-1].content
+    reply = content_text(content)
+    if not reply:
+        if isinstance(content, list):
+            return "I received a response but couldn't parse it."
+        return "I received an empty response."
+    return reply
+
+
+def with_bookings(reply: str, new_messages: List[BaseMessage]) -> Tuple[str, List[BaseMessage]]:
+    """
+    The reply followed by the details of the meetings booked this turn,
+    rendered from the create_meeting results rather than written by the
+    model, and the turn's messages with the last AI message showing them
+    too (the history keeps what the visitor saw).
+    """
+    details = []
+    for msg in new_messages:
+        if isinstance(msg, ToolMessage) and msg.name == "create_meeting":
+            booking = parse_booking(content_text(msg.content))
+            if booking is not None:
+                details.append(render_booking(booking, lead=False))
+    last = max((i for i, msg in enumerate(new_messages) if isinstance(msg, AIMessage)), default=None)
+    if not details or last is None:
+        return reply, new_messages
+    if not content_text(new_messages[last].content):
+        # The model confirmed nothing itself
+        reply = BOOKED_LEAD
+    reply = "\n\n".join([reply] + details)
+    # A copy, so the turn's token usage is still counted
+    shown = new_messages[last].model_copy(update={"content": reply})
+    return reply, new_messages[:last] + [shown] + new_messages[last + 1:]
+
+
+def error_reply(error: BaseException) -> str:
+    """Reply for a failed turn: specific when busy or an upstream is down, generic otherwise."""
+    if isinstance(error, Overloaded):
+        return BUSY_REPLY
+    if isinstance(error, UpstreamUnavailable):
+        return UNAVAILABLE_REPLIES.get(error.upstream, ERROR_REPLY)
+    return ERROR_REPLY
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event."""
+    with metrics.span("serialize"):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# ------------- Turns -------------
+
+
+def _fast_turn(conversation_id: str, user_message: str) -> Optional[str]:
+    """Book a fully specified request directly; None if the agent is needed."""
+    reply = try_fast_path(user_message)
+    if reply is not None:
+        save_history(conversation_id, [HumanMessage(content=user_message), AIMessage(content=reply)])
+    return reply
+
+
+async def _afast_turn(conversation_id: str, user_message: str) -> Optional[str]:
+    async with get_upstream_semaphore():
+        return await asyncio.to_thread(_fast_turn, conversation_id, user_message)
+
+
+def _cached_turn(
+    conversation_id: str, history: List[BaseMessage], user_message: str
+) -> Optional[str]:
+    """Cached reply to a conversation's opening message, if there is one."""
+    # Later messages depend on the conversation so far
+    if not RESPONSE_CACHE_ENABLED or history:
+        return None
+    reply = get_cache().lookup(user_message)
+    if reply is not None:
+        save_history(conversation_id, [HumanMessage(content=user_message), AIMessage(content=reply)])
+    return reply
+
+
+async def _acached_turn(
+    conversation_id: str, history: List[BaseMessage], user_message: str
+) -> Optional[str]:
+    if not RESPONSE_CACHE_ENABLED or history:
+        return None
+    # The lookup may sync the availability index first
+    return await asyncio.to_thread(_cached_turn, conversation_id, history, user_message)
+
+
+def _priority(history: List[BaseMessage]) -> int:
+    """Admission priority: conversations under way go before new ones."""
+    return PRIORITY_ONGOING if history else PRIORITY_NEW
+
+
+def _remember(
+    history: List[BaseMessage], user_message: str, new_messages: List[BaseMessage], reply: str
+) -> None:
+    if RESPONSE_CACHE_ENABLED and not history and cacheable(new_messages):
+        get_cache().store(user_message, reply, uses_calendar=reads_calendar(new_messages))
+
+
+def _store_turn(
+    conversation_id: str,
+    history: List[BaseMessage],
+    user_message: str,
+    new_messages: List[BaseMessage],
+    reply: str,
+) -> None:
+    """Write the turn to the conversation store and cache its reply (blocking I/O)."""
+    save_history(conversation_id, new_messages)
+    _remember(history, user_message, new_messages, reply)
+
+
+def run_turn(
+    conversation_id: str,
+    user_message: str,
+    tenant: Optional[Tenant] = None,
+    client: Optional[str] = None,
+) -> str:
+    """
+    Run one turn for `tenant` (default tenant if None) and return the reply
+    text. `client` (the visitor's IP) ranks the turn in the admission queue;
+    raises admission.Overloaded if it was not admitted.
+    """
+    # Bookings made during this turn are keyed to the conversation
+    _start_turn(conversation_id, tenant)
+    started = time.perf_counter()
+    reply = _fast_turn(conversation_id, user_message)
+    if reply is not None:
+        metrics.record_turn(conversation_id, "fast_path", "json", time.perf_counter() - started)
+        return reply
+    history = load_history(conversation_id)
+    reply = _cached_turn(conversation_id, history, user_message)
+    if reply is not None:
+        metrics.record_turn(conversation_id, "cached", "json", time.perf_counter() - started)
+        return reply
+
+    # At most ADMISSION_MAX_CONCURRENT turns call the agent at once
+    with admit(_priority(history), client):
+        # Recent turns + the new user message; older turns ride along as a
+        # summary in the agent context
+        messages, context, tokens = prepare_turn(
+            conversation_id, history, HumanMessage(content=user_message)
+        )
+
+        # Invoke agent with messages (new API format)
+        result = get_agent().invoke({"messages": messages}, context=context)
+    output_messages = result.get("messages", [])
+
+    # Only this turn's messages are written
+    new_messages = output_messages[len(messages) - 1:]
+    reply, new_messages = with_bookings(final_reply(output_messages), new_messages)
+    _store_turn(conversation_id, history, user_message, new_messages, reply)
+    elapsed = time.perf_counter() - started
+    record_agent_turn(elapsed * 1000)
+    metrics.record_turn(conversation_id, "agent", "json", elapsed, new_messages, tokens)
+    return reply
+
+
+async def arun_turn(
+    conversation_id: str,
+    user_message: str,
+    tenant: Optional[Tenant] = None,
+    client: Optional[str] = None,
+) -> str:
+    """Async variant of run_turn (agent.ainvoke)."""
+    _start_turn(conversation_id, tenant)
+    started = time.perf_counter()
+    reply = await _afast_turn(conversation_id, user_message)
+    if reply is not None:
+        metrics.record_turn(conversation_id, "fast_path", "json", time.perf_counter() - started)
+        return reply
+    # Store I/O stays off the event loop, like the rest of the turn
+    history = await asyncio.to_thread(load_history, conversation_id)
+    reply = await _acached_turn(conversation_id, history, user_message)
+    if reply is not None:
+        metrics.record_turn(conversation_id, "cached", "json", time.perf_counter() - started)
+        return reply
+
+    async with aadmit(_priority(history), client):
+        # Store reads and a possible summary refresh are blocking calls
+        messages, context, tokens = await asyncio.to_thread(
+            prepare_turn,
+            conversation_id,
+            history,
+            HumanMessage(content=user_message),
+        )
+        result = await get_agent().ainvoke({"messages": messages}, context=context)
+    output_messages = result.get("messages", [])
+
+    new_messages = output_messages[len(messages) - 1:]
+    reply, new_messages = with_bookings(final_reply(output_messages), new_messages)
+    await asyncio.to_thread(_store_turn, conversation_id, history, user_message, new_messages, reply)
+    elapsed = time.perf_counter() - started
+    record_agent_turn(elapsed * 1000)
+    metrics.record_turn(conversation_id, "agent", "json", elapsed, new_messages, tokens)
+    return reply
+
+
+class _TurnStream:
+    """Turns agent stream chunks into SSE events and collects the output."""
+
+    def __init__(self, messages: List[BaseMessage], history: List[BaseMessage], received_at: float):
+        self.messages = messages
+        self.history = history
+        self.output_messages = list(messages)
+        self.received_at = received_at
+        self.timings: Dict[str, float] = {}
+
+    def mark(self, name: str) -> None:
+        if name not in self.timings:
+            self.timings[name] = round((time.perf_counter() - self.received_at) * 1000, 1)
+
+    def queued(self, seconds: float) -> None:
+        """Record time spent in the admission queue, if any."""
+        queued_ms = round(seconds * 1000, 1)
+        if queued_ms:
+            self.timings["queued_ms"] = queued_ms
+
+    def handle(self, mode: str, payload: Any) -> List[Event]:
+        if mode == "updates":
+            # Completed node outputs: collect them for the history
+            for update in payload.values():
+                self.output_messages.extend((update or {}).get("messages", []))
+            return []
+
+        chunk, metadata = payload
+        if metadata.get("langgraph_node") != "model":
+            return []
+        events: List[Event] = []
+        tool_calls = getattr(chunk, "tool_call_chunks", None) or getattr(chunk, "tool_calls", None)
+        for call in tool_calls or []:
+            if call.get("name"):
+                self.mark("first_status_ms")
+                events.append(
+                    ("status", {"tool": call["name"], "label": TOOL_LABELS.get(call["name"], "Working…")})
+                )
+        text = content_text(chunk.content)
+        if text:
+            self.mark("first_token_ms")
+            events.append(("token", {"text": text}))
+        if events:
+            self.mark("first_byte_ms")
+        return events
+
+    def _outcome(self) -> Tuple[str, List[BaseMessage]]:
+        new_messages = self.output_messages[len(self.messages) - 1:]
+        return with_bookings(final_reply(self.output_messages), new_messages)
+
+    def finish(self, conversation_id: str, user_message: str, tokens: Dict[str, int]) -> Event:
+        reply, new_messages = self._outcome()
+        _store_turn(conversation_id, self.history, user_message, new_messages, reply)
+        return self._done(conversation_id, reply, new_messages, tokens)
+
+    async def afinish(self, conversation_id: str, user_message: str, tokens: Dict[str, int]) -> Event:
+        reply, new_messages = self._outcome()
+        await asyncio.to_thread(
+            _store_turn, conversation_id, self.history, user_message, new_messages, reply
+        )
+        return self._done(conversation_id, reply, new_messages, tokens)
+
+    def _done(
+        self, conversation_id: str, reply: str, new_messages: List[BaseMessage], tokens: Dict[str, int]
+    ) -> Event:
+        self.mark("total_ms")
+        record_agent_turn(self.timings["total_ms"])
+        metrics.record_turn(
+            conversation_id, "agent", "stream", self.timings["total_ms"] / 1000, new_messages, tokens
+        )
+        return "done", {"reply": reply, "timings": self.timings, "history_tokens": tokens}
+
+
+def _shortcut_done(conversation_id: str, reply: str, received_at: float, path: str) -> Event:
+    """Final event of a turn that skipped the agent ("fast_path" or "cached")."""
+    total_ms = round((time.perf_counter() - received_at) * 1000, 1)
+    metrics.record_turn(conversation_id, path, "stream", total_ms / 1000)
+    return "done", {"reply": reply, "timings": {"total_ms": total_ms}, path: True}
+
+
+_BOOKING_STATUS: Event = ("status", {"tool": "create_meeting", "label": TOOL_LABELS["create_meeting"]})
+
+
+def stream_turn(
+    conversation_id: str,
+    user_message: str,
+    received_at: Optional[float] = None,
+    tenant: Optional[Tenant] = None,
+    client: Optional[str] = None,
+) -> Iterator[Event]:
+    """
+    Run one turn, yielding (event, data) pairs:
+    - status: {"tool", "label"} when the agent starts a tool call
+    - token:  {"text"} incremental reply text
+    - done:   {"reply", "timings", "history_tokens"} final reply (with the
+      details of a booking, which the tokens don't include)
+
+    Raises admission.Overloaded before the agent runs if the turn was not admitted.
+    """
+    _start_turn(conversation_id, tenant)
+    received_at = received_at or time.perf_counter()
+    reply = _fast_turn(conversation_id, user_message)
+    if reply is not None:
+        yield _BOOKING_STATUS
+        yield _shortcut_done(conversation_id, reply, received_at, "fast_path")
+        return
+    history = load_history(conversation_id)
+    reply = _cached_turn(conversation_id, history, user_message)
+    if reply is not None:
+        yield _shortcut_done(conversation_id, reply, received_at, "cached")
+        return
+    # The slot is held until the stream ends (or the client goes away)
+    with admit(_priority(history), client) as queued:
+        messages, context, tokens = prepare_turn(
+            conversation_id, history, HumanMessage(content=user_message)
+        )
+        turn = _TurnStream(messages, history, received_at)
+        turn.queued(queued)
+        for mode, payload in get_agent().stream(
+            {"messages": messages}, context=context, stream_mode=["messages", "updates"]
+        ):
+            yield from turn.handle(mode, payload)
+    yield turn.finish(conversation_id, user_message, tokens)
+
+
+async def astream_turn(
+    conversation_id: str,
+    user_message: str,
+    received_at: Optional[float] = None,
+    tenant: Optional[Tenant] = None,
+    client: Optional[str] = None,
+) -> AsyncIterator[Event]:
+    """Async variant of stream_turn (agent.astream)."""
+    _start_turn(conversation_id, tenant)
+    received_at = received_at or time.perf_counter()
+    reply = await _afast_turn(conversation_id, user_message)
+    if reply is not None:
+        yield _BOOKING_STATUS
+        yield _shortcut_done(conversation_id, reply, received_at, "fast_path")
+        return
+    history = await asyncio.to_thread(load_history, conversation_id)
+    reply = await _acached_turn(conversation_id, history, user_message)
+    if reply is not None:
+        yield _shortcut_done(conversation_id, reply, received_at, "cached")
+        return
+    async with aadmit(_priority(history), client) as queued:
+        messages, context, tokens = await asyncio.to_thread(
+            prepare_turn,
+            conversation_id,
+            history,
+            HumanMessage(content=user_message),
+        )
+        turn = _TurnStream(messages, history, received_at)
+        turn.queued(queued)
+        async for mode, payload in get_agent().astream(
+            {"messages": messages}, context=context, stream_mode=["messages", "updates"]
+        ):
+            for event in turn.handle(mode, payload):
+                yield event
+    yield await turn.afinish(conversation_id, user_message, tokens)
@@ -1,16 +1,44 @@
 from __future__ import annotations
 
-from typing import List
+from typing import List, Optional
+import asyncio
 import datetime
+import threading
+import time
 from dateutil import parser as date_parser
 from dateutil import tz as dateutil_tz
 
 from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, dynamic_prompt
 from langchain.tools import tool
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-from calendar_tools import list_events, create_event, simplify_events
-from config import GEMINI_MODEL_NAME, DEFAULT_TIMEZONE, GOOGLE_API_KEY, CALENDAR_ID
+from availability import (
+    busy_intervals,
+    get_index,
+    iso_to_epoch,
+    team_busy_intervals,
+)
+from bookings import booking_key, current_conversation
+from calendar_tools import create_event, meet_link as event_meet_link
+from conversation_context import context_prompt
+from holds import OFFER_LEAD_SECONDS, SlotTaken, alternatives, held_by_others, offer, reserve
+from agent_middleware import MetricsMiddleware, ResilienceMiddleware
+from metrics import record_rejection
+from response_cache import get_cache
+from slots import find_free_slots, find_team_slots
+from tenants import Tenant, current
+from tool_format import encode_booking, encode_busy, encode_slots
+from config import (
+    BOOKING_JOBS_ENABLED,
+    GEMINI_MODEL_NAME,
+    GOOGLE_API_KEY,
+    LLM_CALL_DEADLINE_SECONDS,
+    METRICS_ENABLED,
+    RESPONSE_CACHE_ENABLED,
+    UPSTREAM_CONCURRENCY,
+)
 
 
 # ------------- LangChain Tools -------------
@@ -20,16 +48,68 @@ from config import GEMINI_MODEL_NAME, DEFAULT_TIMEZONE, GOOGLE_API_KEY, CALENDAR
 def check_availability_tool(start_iso: str, end_iso: str) -> str:
     """
     Check existing events between 'start_iso' and 'end_iso' (ISO8601 strings).
-    Returns a JSON-like string of busy events. The LLM should infer free slots.
+    Returns JSON {"tz", "busy": {day: [[start, end], ...]}} of busy ranges,
+    including slots held for other visitors. To offer times, use
+    find_free_slots, which also holds them for this visitor.
     """
-    events = list_events(start_iso, end_iso)
-    simplified = simplify_events(events)
-    return str(simplified)
+    # Slots held for other visitors can't be booked either
+    held = held_by_others(iso_to_epoch(start_iso), iso_to_epoch(end_iso))
+    return encode_busy(busy_intervals(start_iso, end_iso) + held)
+
+
+@tool("find_free_slots", return_direct=False)
+def find_free_slots_tool(
+    start_iso: str,
+    end_iso: str,
+    duration_minutes: int = 30,
+    max_slots: int = 5,
+) -> str:
+    """
+    Find free meeting slots between 'start_iso' and 'end_iso' (ISO8601 strings)
+    within working hours, starting at least 15 minutes from now. Returns JSON
+    {"tz", "duration_minutes", "slots": {day: [[start, end], ...]}}, earliest first.
+    When several team calendars are configured, each slot also lists the
+    team calendars that are free for it: [start, end, [calendar ids]].
+    Every slot is free in the calendar create_meeting books into.
+    """
+    tenant = current()
+    range_start, range_end = iso_to_epoch(start_iso), iso_to_epoch(end_iso)
+    # Past (and imminent) slots can't be booked, so they aren't offered or held
+    range_start = max(range_start, time.time() + OFFER_LEAD_SECONDS)
+    # Slots offered to other conversations are held for them
+    held = held_by_others(range_start, range_end)
+    if len(tenant.team_calendar_ids) > 1:
+        # create_meeting books into the tenant's calendar, so it must be free too
+        calendar_ids = list(dict.fromkeys([tenant.calendar_id, *tenant.team_calendar_ids]))
+        team_slots = find_team_slots(
+            {
+                cal_id: list(busy) + held
+                for cal_id, busy in team_busy_intervals(start_iso, end_iso, calendar_ids).items()
+            },
+            range_start,
+            range_end,
+            duration_minutes=duration_minutes,
+            # Spares for slots another conversation holds by the time we offer them
+            max_slots=max_slots * 2,
+            booking_calendar=tenant.calendar_id,
+        )
+        free_for = {(s, e): free for s, e, free in team_slots}
+        slots = [(s, e, free_for[(s, e)]) for s, e in offer(list(free_for), max_slots)]
+    else:
+        single_slots = find_free_slots(
+            busy_intervals(start_iso, end_iso) + held,
+            range_start,
+            range_end,
+            duration_minutes=duration_minutes,
+            max_slots=max_slots * 2,
+        )
+        slots = offer(single_slots, max_slots)
+    return encode_slots(slots, duration_minutes)
 
 
 @tool("create_meeting", return_direct=False)
 def create_meeting_tool(
-    title: str = "Initial Call with Vaidrix Team",
+    title: str = "",
     start_iso: str = "",
     end_iso: str = "",
     attendees: str = "",
@@ -39,15 +119,19 @@ def create_meeting_tool(
     """
     Create a meeting in the shared Google Calendar.
 
-    - title: title/subject for the event (default: "Initial Call with Vaidrix Team")
+    - title: title/subject for the event (default: the calendar's standard meeting title)
     - start_iso: start time (ISO 8601 with timezone) - REQUIRED
     - end_iso: end time (ISO 8601 with timezone) - REQUIRED
     - attendees: comma-separated list of attendee email addresses
     - description: optional description for the event
     - location: optional location or meeting link
+
+    If another visitor has just taken the slot, nothing is booked and the
+    reply lists the nearest free slots to offer instead.
     """
     # Validate that start_iso is provided
     if not start_iso or not start_iso.strip():
+        record_rejection("missing_start")
         return "Error: Start time (start_iso) is required to create a meeting."
     
     # Validate that the meeting is in the future
@@ -63,7 +147,7 @@ def create_meeting_tool(
             start_utc = start_datetime.astimezone(datetime.timezone.utc)
         else:
             # If no timezone, assume it's in the default timezone and convert to UTC
-            default_tz = dateutil_tz.gettz(DEFAULT_TIMEZONE)
+            default_tz = dateutil_tz.gettz(current().timezone)
             if default_tz:
                 start_datetime = start_datetime.replace(tzinfo=default_tz)
                 start_utc = start_datetime.astimezone(datetime.timezone.utc)
@@ -83,161 +167,245 @@ def create_meeting_tool(
             
             if time_diff.total_seconds() < 0:
                 # Date is in the past - provide helpful error for LLM to recalculate
+                record_rejection("past")
                 return f"Error: Cannot book a meeting in the past. The requested start time ({start_iso}) parsed to {start_utc.isoformat()} UTC, which is {abs(hours)} hours and {abs(minutes)} minutes in the past. Current time is {now_utc.isoformat()} UTC. Please recalculate the date - if the user said 'tomorrow', ensure you're using the correct future date (current date + 1 day)."
             else:
                 # Very close to now (within 1 minute) - still reject to be safe
+                record_rejection("too_soon")
                 return f"Error: The requested start time ({start_iso}) is too close to the current time. Please book at least a few minutes in advance. Current time: {now_utc.isoformat()} UTC."
     except (ValueError, TypeError, AttributeError) as e:
+        record_rejection("invalid_date")
         return f"Error: Invalid date format for start_iso: {start_iso}. Error: {str(e)}. Please provide a valid ISO 8601 datetime string."
     
     # Use default title if not provided or empty
     if not title or title.strip() == "":
-        title = "Initial Call with Vaidrix Team"
+        title = current().default_title
     
+    try:
+        start_epoch, end_epoch = iso_to_epoch(start_iso), iso_to_epoch(end_iso)
+    except (ValueError, OverflowError) as e:
+        record_rejection("invalid_date")
+        return f"Error: Invalid date format for end_iso: {end_iso}. Error: {str(e)}. Please provide a valid ISO 8601 datetime string."
+    if end_epoch <= start_epoch:
+        record_rejection("invalid_date")
+        return f"Error: The end time ({end_iso}) must be after the start time ({start_iso})."
+
     attendees_emails: List[str] = [
         e.strip() for e in attendees.split(",") if e.strip()
     ]
+    # Repeating this call in the same conversation returns the same event
+    key = booking_key(current_conversation.get(), start_iso, end_iso, attendees_emails)
 
-    event = create_event(
-        summary=title,
-        start_iso=start_iso,
-        end_iso=end_iso,
-        attendees_emails=attendees_emails,
-        description=description,
-        location=location or None,
-    )
-    link = event.get("htmlLink")
-    
-    # Extract Google Meet link from conference data
-    # Check multiple possible locations for the Meet link
-    meet_link = ""
-    
-    # Method 1: Check conferenceData.entryPoints (most common)
-    if event.get("conferenceData") and event["conferenceData"].get("entryPoints"):
-        for entry_point in event["conferenceData"]["entryPoints"]:
-            if entry_point.get("entryPointType") == "video":
-                meet_link = entry_point.get("uri", "")
-                break
-    
-    # Method 2: Check hangoutLink field (legacy/alternative)
-    if not meet_link and event.get("hangoutLink"):
-        meet_link = event.get("hangoutLink")
-    
-    # Method 3: Check conferenceData.conferenceId and construct link
-    if not meet_link and event.get("conferenceData") and event["conferenceData"].get("conferenceId"):
-        # Sometimes the link is in the conference solution
-        conf_data = event["conferenceData"]
-        if conf_data.get("conferenceSolution") and conf_data["conferenceSolution"].get("uri"):
-            meet_link = conf_data["conferenceSolution"]["uri"]
-    
-    # Method 4: Check if there's a location field with meet link
-    if not meet_link and event.get("location"):
-        location = event.get("location", "")
-        if "meet.google.com" in location or "hangouts.google.com" in location:
-            meet_link = location
-    
-    # Build response message
-    response_parts = ["OK. I have booked the meeting.\n\nHere are the details:\n"]
-    response_parts.append(f"- **Title**: {title}\n")
-    
-    # Format date and time nicely
     try:
-        start_dt = date_parser.parse(start_iso)
-        end_dt = date_parser.parse(end_iso)
-        date_str = start_dt.strftime("%B %d, %Y")
-        time_str = f"{start_dt.strftime('%I:%M %p')} - {end_dt.strftime('%I:%M %p')} ({DEFAULT_TIMEZONE})"
-        response_parts.append(f"- **Date**: {date_str}\n")
-        response_parts.append(f"- **Time**: {time_str}\n")
-    except:
-        response_parts.append(f"- **Start**: {start_iso}\n")
-        response_parts.append(f"- **End**: {end_iso}\n")
-    
-    if attendees_emails:
-        response_parts.append(f"- **Attendees**: {', '.join(attendees_emails)}\n")
-    
-    response_parts.append(f"- **Calendar Link**: [{link}]({link})\n")
-    
-    if meet_link:
-        response_parts.append(f"- **Google Meet Link**: [{meet_link}]({meet_link})\n")
-    else:
-        response_parts.append(f"- **Google Meet Link**: The meeting link will be available in your Google Calendar. Please check the calendar event for the video conferencing link.\n")
-    
-    return "".join(response_parts)
+        # Atomic against other conversations booking or holding the slot
+        with reserve(start_epoch, end_epoch, key):
+            event = create_event(
+                summary=title,
+                start_iso=start_iso,
+                end_iso=end_iso,
+                attendees_emails=attendees_emails,
+                description=description,
+                location=location or None,
+                idempotency_key=key,
+                # Confirm once the event exists; invitations and the Meet link follow
+                defer_followups=BOOKING_JOBS_ENABLED,
+            )
+    except SlotTaken as e:
+        record_rejection("slot_taken")
+        return slot_taken_reply(e)
+    # Make the new booking visible to availability checks right away
+    get_index().record_event(event)
+    if RESPONSE_CACHE_ENABLED:
+        # Cached availability answers are now out of date
+        get_cache().invalidate()
+    return encode_booking(
+        event,
+        title,
+        start_epoch,
+        end_epoch,
+        attendees_emails,
+        # Extract Google Meet link from conference data (or wherever else it is)
+        meet_link=event_meet_link(event),
+        # followups.py posts it to the chat once Google has created it
+        meet_pending=BOOKING_JOBS_ENABLED,
+    )
+
+
+SLOT_TAKEN_ERROR = "Error: That time is no longer available"
+
+
+def slot_taken_reply(taken: SlotTaken) -> str:
+    """create_meeting's answer for a taken slot: the nearest free alternatives."""
+    why = (
+        "it was just booked or is reserved for another visitor"
+        if taken.reason == "held"
+        else "it is busy in the calendar"
+    )
+    return (
+        f"{SLOT_TAKEN_ERROR} ({why}); nothing was booked. Do not retry it: tell the "
+        "visitor and offer these free slots instead (held for them for a few minutes): "
+        + encode_slots(alternatives(taken.start, taken.end), round((taken.end - taken.start) / 60))
+    )
+
+
+# ------------- Async Support -------------
+
+# Caps concurrent Gemini and Calendar calls when the agent runs async
+# (agent.ainvoke / astream from asgi.py). Created lazily so it binds to the
+# serving event loop.
+_upstream_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_upstream_semaphore() -> asyncio.Semaphore:
+    """The semaphore every async upstream (Gemini or Calendar) call holds."""
+    global _upstream_semaphore
+    if _upstream_semaphore is None:
+        _upstream_semaphore = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+    return _upstream_semaphore
+
+
+def _with_async(tool_obj):
+    """
+    Give a sync tool an async implementation. googleapiclient has no async
+    transport, so the call runs on a worker thread, but only while holding
+    the upstream semaphore - threads are bounded by upstream calls in
+    flight, not by open requests.
+    """
+    func = tool_obj.func
+
+    async def run(**kwargs):
+        async with get_upstream_semaphore():
+            return await asyncio.to_thread(func, **kwargs)
+
+    tool_obj.coroutine = run
+    return tool_obj
+
+
+class UpstreamLimitMiddleware(AgentMiddleware):
+    """Hold the upstream semaphore for the duration of each async model call."""
+
+    def wrap_model_call(self, request, handler):
+        return handler(request)
+
+    async def awrap_model_call(self, request, handler):
+        async with get_upstream_semaphore():
+            return await handler(request)
 
 
 # ------------- Agent Factory -------------
 
 
-def build_agent():
+_llm: Optional[ChatGoogleGenerativeAI] = None
+_llm_lock = threading.Lock()
+
+
+def _gemini() -> ChatGoogleGenerativeAI:
     if not GOOGLE_API_KEY:
         raise ValueError(
             "GOOGLE_API_KEY environment variable is not set. "
             "Please set it with: $env:GOOGLE_API_KEY='your-api-key'"
         )
-    
-    llm = ChatGoogleGenerativeAI(
+
+    return ChatGoogleGenerativeAI(
         model=GEMINI_MODEL_NAME,
         google_api_key=GOOGLE_API_KEY,
         temperature=0.3,
+        # Per-request deadline; retries are done by ResilienceMiddleware
+        timeout=LLM_CALL_DEADLINE_SECONDS,
+        max_retries=1,
     )
 
-    tools = [check_availability_tool, create_meeting_tool]
 
-    # Get current date/time for the system prompt
-    now = datetime.datetime.now()
-    default_tz = dateutil_tz.gettz(DEFAULT_TIMEZONE)
-    if default_tz:
-        now_local = now.astimezone(default_tz)
-    else:
-        now_local = now.replace(tzinfo=datetime.timezone.utc)
-    
-    current_date_str = now_local.strftime("%Y-%m-%d")
-    current_datetime_str = now_local.strftime("%Y-%m-%d %H:%M:%S %Z")
-    current_iso = now_local.isoformat()
+def get_llm() -> ChatGoogleGenerativeAI:
+    """Gemini client shared by every tenant's agent (one connection pool)."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = _gemini()
+    return _llm
 
-    system_prompt = f"""You are a helpful meeting booking assistant for Vaidrix.
+
+# Static per tenant: identical for every request, so Gemini can serve it from
+# its prompt cache. Anything that changes per turn (the current time, summary,
+# booking facts) is appended after it by conversation_context_prompt.
+_PROMPT_TEMPLATE = """You are a helpful meeting booking assistant for {company}.
 
 - You talk in a friendly, professional tone.
 - You help users book calls into a shared Google Calendar.
-- The business timezone is {DEFAULT_TIMEZONE}. If the user mentions a time without a timezone,
+- The business timezone is {timezone}. If the user mentions a time without a timezone,
   assume it is in this timezone.
-- CURRENT DATE AND TIME (use this as your reference for relative dates):
-  - Current date: {current_date_str}
-  - Current date and time ({DEFAULT_TIMEZONE}): {current_datetime_str}
-  - Current ISO 8601: {current_iso}
+- The current date and time are given in the CURRENT TIME section at the end of these
+  instructions. Use it as your reference for relative dates.
 - IMPORTANT DATE INTERPRETATION:
-  - "tomorrow" means the day after {current_date_str} (i.e., {current_date_str} + 1 day)
-  - "today" means {current_date_str}
-  - Always use the CURRENT DATE ({current_date_str}) as your reference point when interpreting relative dates
+  - "today" means the current date from CURRENT TIME
+  - "tomorrow" means the day after the current date (CURRENT TIME also states it)
+  - Weekday names ("on Friday") mean the next such day on or after today
   - When converting relative dates to ISO 8601 format, ensure you're using the correct future date
 - Always clarify when the date or time is ambiguous.
 - CRITICAL: The create_meeting tool will automatically reject past dates, so you should trust the tool's validation.
-  If the tool says a date is in the past, it means there was an error in date interpretation - recalculate using the current date ({current_date_str}) as reference.
-- The default meeting title is "Initial Call with Vaidrix Team" - use this title unless the user specifies a different title.
-- Do NOT ask the user for the meeting title - always use "Initial Call with Vaidrix Team" as the default.
+  If the tool says a date is in the past, it means there was an error in date interpretation - recalculate using the current date from CURRENT TIME.
+- The default meeting title is "{title}" - use this title unless the user specifies a different title.
+- Do NOT ask the user for the meeting title - always use "{title}" as the default.
 - Before calling create_meeting, make sure:
     1. You have a clear date and time (with duration).
-    2. You've correctly interpreted relative dates (e.g., "tomorrow" = {current_date_str} + 1 day = the next day).
+    2. You've correctly interpreted relative dates (e.g., "tomorrow" = the current date + 1 day).
     3. You know the attendee email(s) of the client.
-    4. Use "Initial Call with Vaidrix Team" as the title (unless user specifies otherwise).
+    4. Use "{title}" as the title (unless user specifies otherwise).
 - When the user gives you their email, use it as the attendee email.
-- When suggesting slots, check availability with check_availability first.
-- After you successfully book a meeting, clearly confirm:
-    - date
-    - time
-    - timezone
-    - who will attend
-    - Google Calendar link
-    - Google Meet video conferencing link (automatically included in all meetings)
+- When suggesting slots, call find_free_slots and offer the slots it returns; do not work out
+  free time yourself. Use check_availability only to check whether a specific time is busy.
+- Tool results give times as minutes after midnight (540 = 09:00); tell the visitor clock times.
+- After you book a meeting, confirm its date, time and timezone in a sentence; the details
+  and Calendar/Meet links are shown to the visitor below your reply.
 - All meetings automatically include a Google Meet video conferencing link for virtual meetings.
 - The calendar will be automatically shared with attendees so they can see the meeting. If they can't see it, they should check their Google Calendar for a shared calendar or accept any calendar sharing invitations.
 """
 
+
+def system_prompt(tenant: Tenant) -> str:
+    """The tenant's static system prompt: the shared instructions plus its own."""
+    prompt = _PROMPT_TEMPLATE.format(
+        company=tenant.company_name, timezone=tenant.timezone, title=tenant.default_title
+    )
+    if tenant.prompt:
+        prompt += f"\nAdditional instructions for this calendar:\n{tenant.prompt.strip()}\n"
+    return prompt
+
+
+@dynamic_prompt
+def conversation_context_prompt(request: ModelRequest) -> str:
+    """Append this turn's time, running summary and pinned booking facts to the system prompt."""
+    return f"{request.system_prompt}\n{context_prompt(request.runtime.context)}\n"
+
+
+def build_agent(llm: Optional[BaseChatModel] = None, tenant: Optional[Tenant] = None):
+    """
+    Build the booking agent for `tenant` (default: the current tenant);
+    `llm` replaces the shared Gemini client (offline benchmarks).
+    """
+    tenant = tenant or current()
+    if llm is None:
+        llm = get_llm()
+
+    tools = [
+        _with_async(t)
+        for t in (check_availability_tool, find_free_slots_tool, create_meeting_tool)
+    ]
+
     # Create the agent using the new API
     agent = create_agent(
         model=llm,
         tools=tools,
-        system_prompt=system_prompt,
+        system_prompt=system_prompt(tenant),
+        # Retries sit outside the concurrency limit so backoff sleeps don't hold a slot
+        middleware=[
+            conversation_context_prompt,
+            ResilienceMiddleware(deadline=LLM_CALL_DEADLINE_SECONDS),
+            UpstreamLimitMiddleware(),
+            # Innermost, so llm_call spans time each attempt
+            *([MetricsMiddleware()] if METRICS_ENABLED else []),
+        ],
     )
 
     return agent
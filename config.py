@@ -8,12 +8,82 @@ load_dotenv()
 # Flask secret key (change in production)
 SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "change-this-secret")
 
+# ==== ASYNC SERVING (asgi.py) ====
+# Max concurrent upstream calls (Gemini + Calendar) per process
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "32"))
+# A chat turn taking longer than this is abandoned with an error reply
+CHAT_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("CHAT_REQUEST_TIMEOUT_SECONDS", "60"))
+
+# ==== RATE LIMITING AND ADMISSION (chat endpoints) ====
+# Token buckets per browser session and per client IP (see rate_limit.py);
+# over the limit, chat requests get 429 with Retry-After
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_SESSION_PER_MINUTE = float(os.environ.get("RATE_LIMIT_SESSION_PER_MINUTE", "10"))
+RATE_LIMIT_SESSION_BURST = int(os.environ.get("RATE_LIMIT_SESSION_BURST", "5"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", "60"))
+RATE_LIMIT_IP_BURST = int(os.environ.get("RATE_LIMIT_IP_BURST", "20"))
+# Where the buckets live: memory:// (per process) or redis://host:port/db (shared)
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory://")
+# Reverse proxies in front of the app; the client IP is read from X-Forwarded-For
+# this many hops back (0 = use the socket address)
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", "0"))
+# Agent turns running at once per process (0 = no limit); later turns queue
+# (conversations under way first) and get 503 with Retry-After when the queue
+# is full or they waited too long (see admission.py)
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "0"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "15"))
+
+# ==== RESILIENCE (Calendar + Gemini calls) ====
+# Retries for transient failures (429, 5xx, timeouts), with jittered
+# exponential backoff starting at UPSTREAM_RETRY_BASE_SECONDS
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_RETRY_BASE_SECONDS = float(os.environ.get("UPSTREAM_RETRY_BASE_SECONDS", "0.25"))
+# Time budget for one Calendar call / one Gemini request, retries included
+CALENDAR_CALL_DEADLINE_SECONDS = float(os.environ.get("CALENDAR_CALL_DEADLINE_SECONDS", "20"))
+LLM_CALL_DEADLINE_SECONDS = float(os.environ.get("LLM_CALL_DEADLINE_SECONDS", "45"))
+# Fail fast after this many consecutive transient failures; probe again after the reset
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+# Send a second copy of slow Calendar reads once they pass their observed p95
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# ==== OBSERVABILITY ====
+# Timing spans and Prometheus metrics on GET /metrics (off = no overhead)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+# Also emit every span through OpenTelemetry (needs opentelemetry-api + an SDK)
+OTEL_TRACING_ENABLED = os.environ.get("OTEL_TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# ==== CONVERSATION STORAGE ====
+# Where chat history is kept: memory://, sqlite:///path/to/file.db or redis://host:port/db
+CONVERSATION_STORE = os.environ.get("CONVERSATION_STORE", "memory://")
+# Conversations idle for longer than this are dropped
+CONVERSATION_TTL_SECONDS = int(os.environ.get("CONVERSATION_TTL_SECONDS", "86400"))
+# Upper bound on conversations held by the in-memory store (least recently used evicted)
+CONVERSATION_MAX_SESSIONS = int(os.environ.get("CONVERSATION_MAX_SESSIONS", "10000"))
+
 # ==== GEMINI / LLM SETTINGS ====
 # Set environment variable GOOGLE_API_KEY with your Gemini API key.
 # Valid model names: gemini-pro, gemini-1.5-pro, gemini-1.5-flash-latest
 # Using gemini-pro as default (most stable and widely available)
 GEMINI_MODEL_NAME = os.environ.get("GEMINI_MODEL_NAME", "gemini-2.5-pro")
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY") or os.environ.get("GEMINI_API_KEY")
+# Turns sent verbatim each turn; older turns are replaced by a running summary
+HISTORY_WINDOW_TURNS = int(os.environ.get("HISTORY_WINDOW_TURNS", "6"))
+# Small model used to write that summary
+SUMMARY_MODEL_NAME = os.environ.get("SUMMARY_MODEL_NAME", "gemini-2.5-flash")
+# Book fully specified requests ("30 min tomorrow at 3pm, x@y.com") directly,
+# without the agent's tool loop
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+# Answer repeated opening questions ("what slots do you have this week?") from a
+# short-lived cache instead of the agent; cleared on bookings and calendar changes
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+# Cosine similarity at which a reworded question counts as the same question
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.85"))
+# "hashing" (local and deterministic) or a Gemini embedding model, e.g. models/text-embedding-004
+RESPONSE_CACHE_EMBEDDINGS = os.environ.get("RESPONSE_CACHE_EMBEDDINGS", "hashing")
 # ==== GOOGLE OAUTH SETTINGS (for Meet + real invites) ====
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
@@ -23,15 +93,130 @@ GOOGLE_REDIRECT_URI = os.environ.get("GOOGLE_REDIRECT_URI")
 GOOGLE_OAUTH_TOKEN_FILE = os.environ.get(
     "GOOGLE_OAUTH_TOKEN_FILE", "credentials/token.json"
 )
+# ==== TENANTS (many calendars in one process, see tenants.py) ====
+# JSON file listing the tenants; unset = one tenant built from the settings below
+TENANTS_FILE = os.environ.get("TENANTS_FILE")
+# Tenants whose agent, Calendar client and busy index are kept in memory
+# (least recently used evicted)
+TENANT_CACHE_SIZE = int(os.environ.get("TENANT_CACHE_SIZE", "100"))
+# OAuth token files of tenants that don't name their own
+TENANT_TOKEN_DIR = os.environ.get("TENANT_TOKEN_DIR", "credentials/tenants")
+
 # ==== GOOGLE CALENDAR SETTINGS ====
 # Calendar to use (owner calendar)
-# REQUIRED: Set GOOGLE_CALENDAR_ID in .env file
+# REQUIRED: Set GOOGLE_CALENDAR_ID in .env file (optional when TENANTS_FILE is set).
+# Not checked here, so workers boot and answer health checks either way;
+# see missing_settings() and GET /readyz.
 CALENDAR_ID = os.environ.get("GOOGLE_CALENDAR_ID")
-if not CALENDAR_ID:
-    raise ValueError(
-        "GOOGLE_CALENDAR_ID environment variable is required. "
-        "Set it in your .env file or as an environment variable."
-    )
 
 # Default timezone for events (your business timezone)
 DEFAULT_TIMEZONE = os.environ.get("DEFAULT_TIMEZONE", "Asia/Kolkata")
+# Title of booked meetings unless the user asks for another one
+DEFAULT_MEETING_TITLE = os.environ.get("DEFAULT_MEETING_TITLE", "Initial Call with Vaidrix Team")
+# Company the assistant books calls for (named in the system prompt)
+COMPANY_NAME = os.environ.get("COMPANY_NAME", "Vaidrix")
+
+# ==== CALENDAR CLIENT SETTINGS ====
+# Refresh OAuth access tokens this many seconds before they expire
+CREDENTIAL_REFRESH_MARGIN_SECONDS = int(
+    os.environ.get("CREDENTIAL_REFRESH_MARGIN_SECONDS", "300")
+)
+# Socket timeout (seconds) for Calendar API connections
+CALENDAR_HTTP_TIMEOUT = float(os.environ.get("CALENDAR_HTTP_TIMEOUT", "30"))
+# Repeated bookings (same conversation, slot and attendees) within this many
+# seconds are answered from a local ledger instead of the API
+BOOKING_LEDGER_TTL_SECONDS = int(os.environ.get("BOOKING_LEDGER_TTL_SECONDS", "3600"))
+# Wait at most this long (seconds) for Google to attach the Meet link
+MEET_LINK_POLL_SECONDS = float(os.environ.get("MEET_LINK_POLL_SECONDS", "8"))
+# Override the Calendar API base URL (e.g. a local stub for development)
+CALENDAR_API_ENDPOINT = os.environ.get("CALENDAR_API_ENDPOINT")
+
+# ==== BOOKING FOLLOW-UPS (background jobs, see jobs.py / followups.py) ====
+# Confirm chat bookings as soon as the event is inserted; the Meet link,
+# attendee invitations, the CRM webhook and reminders run in background
+# workers, journaled to SQLite so they survive a restart
+BOOKING_JOBS_ENABLED = os.environ.get("BOOKING_JOBS_ENABLED", "false").lower() in ("1", "true", "yes")
+BOOKING_JOBS_JOURNAL = os.environ.get("BOOKING_JOBS_JOURNAL", "data/jobs.db")
+BOOKING_JOBS_WORKERS = int(os.environ.get("BOOKING_JOBS_WORKERS", "2"))
+# Attempts per job before it is marked failed (retried with backoff)
+BOOKING_JOBS_MAX_ATTEMPTS = int(os.environ.get("BOOKING_JOBS_MAX_ATTEMPTS", "6"))
+# CRM hook: booking.created (and booking.reminder) events are POSTed here as JSON
+BOOKING_WEBHOOK_URL = os.environ.get("BOOKING_WEBHOOK_URL", "")
+# Post a booking.reminder this many minutes before each meeting (0 = off)
+BOOKING_REMINDER_MINUTES = int(os.environ.get("BOOKING_REMINDER_MINUTES", "0"))
+# Longest a widget's GET /api/chat/updates request is held open (long poll)
+BOOKING_UPDATES_WAIT_SECONDS = float(os.environ.get("BOOKING_UPDATES_WAIT_SECONDS", "20"))
+
+# ==== BATCH BOOKINGS (POST /api/bookings/batch) ====
+# Bearer token callers must send; the endpoint is disabled while it is empty
+BOOKING_API_TOKEN = os.environ.get("BOOKING_API_TOKEN", "")
+# Most bookings accepted in one request
+BOOKING_BATCH_MAX_SIZE = int(os.environ.get("BOOKING_BATCH_MAX_SIZE", "500"))
+
+# ==== AVAILABILITY SETTINGS ====
+# Where availability comes from: "index" (in-memory busy index, synced from
+# events.list) or "freebusy" (live freeBusy.query, busy ranges only)
+AVAILABILITY_BACKEND = os.environ.get("AVAILABILITY_BACKEND", "index")
+# Team calendars considered when looking for free slots (comma-separated);
+# defaults to the shared calendar only
+TEAM_CALENDAR_IDS = [
+    c.strip()
+    for c in os.environ.get("TEAM_CALENDAR_IDS", CALENDAR_ID or "").split(",")
+    if c.strip()
+]
+# Availability answers may be at most this many seconds old before the
+# in-memory busy index runs an incremental sync
+AVAILABILITY_MAX_STALENESS_SECONDS = float(
+    os.environ.get("AVAILABILITY_MAX_STALENESS_SECONDS", "60")
+)
+# How many days ahead the busy index mirrors; queries beyond it go to the API
+AVAILABILITY_SYNC_HORIZON_DAYS = int(
+    os.environ.get("AVAILABILITY_SYNC_HORIZON_DAYS", "60")
+)
+
+# ==== PUSH NOTIFICATIONS (Calendar events.watch, see calendar_push.py) ====
+# Public HTTPS URL of POST /webhooks/calendar; unset = availability is polled
+CALENDAR_WEBHOOK_URL = os.environ.get("CALENDAR_WEBHOOK_URL")
+# Signs channel tokens, so only notifications for our own channels are accepted
+CALENDAR_WEBHOOK_SECRET = os.environ.get("CALENDAR_WEBHOOK_SECRET") or SECRET_KEY
+# Requested channel lifetime; channels are renewed this many seconds before they expire
+CALENDAR_WATCH_TTL_SECONDS = int(os.environ.get("CALENDAR_WATCH_TTL_SECONDS", "604800"))
+CALENDAR_WATCH_RENEW_MARGIN_SECONDS = int(
+    os.environ.get("CALENDAR_WATCH_RENEW_MARGIN_SECONDS", "3600")
+)
+# While a channel is live the index polls only this often (safety net for lost
+# notifications) instead of every AVAILABILITY_MAX_STALENESS_SECONDS
+CALENDAR_PUSH_MAX_STALENESS_SECONDS = float(
+    os.environ.get("CALENDAR_PUSH_MAX_STALENESS_SECONDS", "900")
+)
+
+# ==== SLOT FINDER SETTINGS ====
+# Working hours (HH:MM, business timezone) and days (0=Monday) offered for meetings
+WORKING_HOURS_START = os.environ.get("WORKING_HOURS_START", "09:00")
+WORKING_HOURS_END = os.environ.get("WORKING_HOURS_END", "18:00")
+WORKING_DAYS = tuple(
+    int(d) for d in os.environ.get("WORKING_DAYS", "0,1,2,3,4").split(",") if d.strip()
+)
+# Free minutes required before and after existing events
+MEETING_BUFFER_MINUTES = int(os.environ.get("MEETING_BUFFER_MINUTES", "0"))
+# Offered slots start on this grid (minutes past the hour)
+SLOT_STEP_MINUTES = int(os.environ.get("SLOT_STEP_MINUTES", "30"))
+
+# ==== SLOT HOLDS (see holds.py) ====
+# Bookings check their slot atomically against other conversations' holds and
+# fresh busy data; offered slots are held for the conversation they were offered to
+SLOT_HOLDS_ENABLED = os.environ.get("SLOT_HOLDS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Where holds live: memory:// (this process) or sqlite:///path/to.db (all workers on a host)
+SLOT_HOLDS_STORE = os.environ.get("SLOT_HOLDS_STORE", "memory://")
+# Slots offered to a conversation are held for it this long (0 = don't hold offers)
+SLOT_HOLD_TTL_SECONDS = int(os.environ.get("SLOT_HOLD_TTL_SECONDS", "180"))
+
+
+def missing_settings() -> list:
+    """Required settings that are not set (reported by GET /readyz)."""
+    missing = []
+    if not GOOGLE_API_KEY:
+        missing.append("GOOGLE_API_KEY")
+    if not CALENDAR_ID and not TENANTS_FILE:
+        missing.append("GOOGLE_CALENDAR_ID (or TENANTS_FILE)")
+    return missing
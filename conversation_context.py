@@ -0,0 +1,209 @@
+"""
+Bounded prompt context for each chat turn.
+
+Instead of replaying the whole transcript, a turn sends:
+- the last HISTORY_WINDOW_TURNS turns verbatim,
+- a running summary of everything older (folded in incrementally with a
+  small model and cached in the conversation store's session state),
+- pinned booking facts (email, duration, requested time) extracted from
+  the conversation, so they survive summarization,
+- the current time, taken when the turn starts.
+
+These reach the model through the agent's runtime context (see the dynamic
+prompt middleware in chatbot.build_agent), as a short block after the
+static system prompt, so the static part stays byte-identical across turns
+and days and can be served from Gemini's prompt cache.
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from dateutil import tz as dateutil_tz
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+import resilience
+from config import (
+    GOOGLE_API_KEY,
+    HISTORY_WINDOW_TURNS,
+    LLM_CALL_DEADLINE_SECONDS,
+    SUMMARY_MODEL_NAME,
+)
+from conversation_store import get_store
+from tenants import current
+from tool_format import BOOKING_DETAILS
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_DURATION_RE = re.compile(r"\b(\d{1,3})\s*(min(?:ute)?s?|hours?|hrs?)\b", re.IGNORECASE)
+_TIME_RE = re.compile(
+    r"\b(?:today|tomorrow|(?:next\s+)?(?:mon|tues|wednes|thurs|fri|satur|sun)day|"
+    r"\d{4}-\d{2}-\d{2}|\d{1,2}(?:st|nd|rd|th)?\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*)"
+    r"[^.?!\n]*?\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b",
+    re.IGNORECASE,
+)
+
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a meeting-booking chat between a visitor "
+    "and an assistant. Update the summary with the new messages. Keep it under "
+    "120 words; keep names, emails, dates, times, durations, offered slots and "
+    "whether a meeting was booked. Reply with the summary only."
+)
+
+_summary_llm = None
+_summary_llm_lock = threading.Lock()
+
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    """Rough token count (~4 characters per token); avoids a count_tokens call."""
+    return sum(len(str(m.content)) for m in messages) // 4
+
+
+def _get_summary_llm():
+    global _summary_llm
+    if _summary_llm is None:
+        with _summary_llm_lock:
+            if _summary_llm is None:
+                _summary_llm = ChatGoogleGenerativeAI(
+                    model=SUMMARY_MODEL_NAME,
+                    google_api_key=GOOGLE_API_KEY,
+                    temperature=0,
+                    timeout=LLM_CALL_DEADLINE_SECONDS,
+                    max_retries=1,
+                )
+    return _summary_llm
+
+
+def _summarize(previous: str, messages: List[BaseMessage]) -> str:
+    transcript = "\n".join(
+        f"{'Visitor' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}"
+        for m in messages
+    )
+    prompt = [
+        ("system", _SUMMARY_PROMPT),
+        ("human", f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"),
+    ]
+    result = resilience.call(
+        "gemini", "gemini.summary", lambda: _get_summary_llm().invoke(prompt),
+        deadline=LLM_CALL_DEADLINE_SECONDS,
+    )
+    return str(result.content).strip()
+
+
+def extract_facts(messages: List[BaseMessage], facts: Dict[str, Any]) -> Dict[str, Any]:
+    """Update pinned booking facts from the visitor's messages (latest wins)."""
+    facts = dict(facts)
+    for msg in messages:
+        if isinstance(msg, AIMessage):
+            if BOOKING_DETAILS in str(msg.content):
+                facts["booked"] = True
+            continue
+        if not isinstance(msg, HumanMessage):
+            continue
+        text = str(msg.content)
+        emails = _EMAIL_RE.findall(text)
+        if emails:
+            facts["email"] = ", ".join(emails)
+        duration = _DURATION_RE.search(text)
+        if duration:
+            value = int(duration.group(1))
+            facts["duration_minutes"] = value * 60 if duration.group(2).lower().startswith("h") else value
+        requested = _TIME_RE.search(text)
+        if requested:
+            facts["requested_time"] = requested.group(0)
+    return facts
+
+
+def time_context(now: Optional[datetime.datetime] = None) -> str:
+    """The "CURRENT TIME" block for one turn, in the tenant's timezone (minute resolution)."""
+    timezone = current().timezone
+    zone = dateutil_tz.gettz(timezone) or datetime.timezone.utc
+    now = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(zone)
+    now = now.replace(second=0, microsecond=0)
+    tomorrow = now.date() + datetime.timedelta(days=1)
+    return (
+        "CURRENT TIME (the reference for relative dates):\n"
+        f"- Now: {now:%A} {now:%Y-%m-%d %H:%M} {timezone} ({now.isoformat()})\n"
+        f"- Today is {now:%Y-%m-%d}; tomorrow is {tomorrow:%Y-%m-%d} ({tomorrow:%A})"
+    )
+
+
+def _window_start(messages: List[BaseMessage], turns: int) -> int:
+    """Index of the first message of the last `turns` turns (0 if fewer)."""
+    seen = 0
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            seen += 1
+            if seen == turns:
+                return i
+    return 0
+
+
+def prepare_turn(
+    session_id: str,
+    history: List[BaseMessage],
+    user_message: HumanMessage,
+    window_turns: int = HISTORY_WINDOW_TURNS,
+    now: Optional[datetime.datetime] = None,
+) -> Tuple[List[BaseMessage], Dict[str, Any], Dict[str, int]]:
+    """
+    Return (messages, context, token_report) for this turn's agent.invoke.
+
+    `messages` ends with `user_message`; everything before it in `messages`
+    was already stored, so callers persist `output[len(messages) - 1:]`.
+    `token_report` estimates the history tokens of the full transcript
+    versus what is actually sent. `now` overrides the clock for the
+    current-time block.
+    """
+    store = get_store()
+    state = store.load_state(session_id)
+    summary: str = state.get("summary", "")
+    summarized = min(state.get("summarized", 0), len(history))
+    scanned = min(state.get("scanned", 0), len(history))
+
+    facts = extract_facts(history[scanned:] + [user_message], state.get("facts", {}))
+
+    # Fold older turns into the summary in batches of `window_turns` turns,
+    # so the summarizer runs once every few turns rather than every turn.
+    keep_from = _window_start(history, window_turns)
+    pending_turns = sum(isinstance(m, HumanMessage) for m in history[summarized:])
+    if pending_turns >= 2 * window_turns:
+        try:
+            summary = _summarize(summary, history[summarized:keep_from])
+            summarized = keep_from
+        except Exception as e:
+            # Keep sending the unsummarized turns verbatim rather than lose them
+            print("History summarization failed:", e)
+
+    messages = history[summarized:] + [user_message]
+    context: Dict[str, Any] = {"current_time": time_context(now)}
+    if summary:
+        context["conversation_summary"] = summary
+    if facts:
+        context["booking_facts"] = facts
+
+    new_state = {"summary": summary, "summarized": summarized, "scanned": len(history), "facts": facts}
+    if new_state != state:
+        store.save_state(session_id, new_state)
+
+    token_report = {
+        "full": estimate_tokens(history) + estimate_tokens([user_message]),
+        "sent": estimate_tokens(messages) + len(context_prompt(context)) // 4,
+    }
+    return messages, context, token_report
+
+
+def context_prompt(context: Optional[Dict[str, Any]]) -> str:
+    """System-prompt addendum: current time, summary and pinned facts."""
+    context = context or {}
+    # Agents invoked without prepare_turn still get the time
+    parts = [context.get("current_time") or time_context()]
+    if context.get("conversation_summary"):
+        parts.append(f"Summary of the earlier conversation:\n{context['conversation_summary']}")
+    if context.get("booking_facts"):
+        facts = "\n".join(f"- {k}: {v}" for k, v in context["booking_facts"].items())
+        parts.append(f"Known booking details from this conversation:\n{facts}")
+    return "\n\n".join(parts)
@@ -0,0 +1,302 @@
+"""
+Server-side conversation storage.
+
+Conversations are keyed by an opaque session id and stored as an
+append-only list of {"type": "human" | "ai", "content": str} dicts; each
+turn only appends the messages it produced. Each session also has a small
+JSON state dict (e.g. the running summary) that is overwritten as a whole.
+Sessions expire after CONVERSATION_TTL_SECONDS of inactivity.
+
+Backends, selected by CONVERSATION_STORE:
+- memory://              in-process LRU (bounded by CONVERSATION_MAX_SESSIONS)
+- sqlite:///path/to.db   local SQLite file, shared by all workers on a host
+- redis://host:port/db   Redis (needs the `redis` package), or any client
+                         with the same list/string commands
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import CONVERSATION_MAX_SESSIONS, CONVERSATION_STORE, CONVERSATION_TTL_SECONDS
+
+Message = Dict[str, str]
+
+
+class ConversationStore(ABC):
+    """Interface shared by all backends."""
+
+    @abstractmethod
+    def load(self, session_id: str) -> List[Message]:
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, messages: List[Message]) -> None:
+        ...
+
+    @abstractmethod
+    def load_state(self, session_id: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def save_state(self, session_id: str, state: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+
+class MemoryStore(ConversationStore):
+    """In-process store with LRU eviction and idle TTL."""
+
+    def __init__(
+        self,
+        max_sessions: int = CONVERSATION_MAX_SESSIONS,
+        ttl_seconds: float = CONVERSATION_TTL_SECONDS,
+    ):
+        self._max_sessions = max_sessions
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        # session id -> (expires_at, messages)
+        self._sessions: "OrderedDict[str, Tuple[float, List[Message]]]" = OrderedDict()
+        # session id -> state; evicted together with the session
+        self._states: Dict[str, Dict[str, Any]] = {}
+
+    def load(self, session_id: str) -> List[Message]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if entry[0] < time.time():
+                del self._sessions[session_id]
+                self._states.pop(session_id, None)
+                return []
+            self._sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def append(self, session_id: str, messages: List[Message]) -> None:
+        with self._lock:
+            self._touch_locked(session_id).extend(messages)
+
+    def _touch_locked(self, session_id: str) -> List[Message]:
+        """Refresh the session's TTL and LRU position; return its history."""
+        now = time.time()
+        entry = self._sessions.get(session_id)
+        if entry and entry[0] >= now:
+            history = entry[1]
+        else:
+            history = []
+            self._states.pop(session_id, None)
+        self._sessions[session_id] = (now + self._ttl, history)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self._max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._states.pop(evicted, None)
+        return history
+
+    def load_state(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] < time.time():
+                return {}
+            return dict(self._states.get(session_id, {}))
+
+    def save_state(self, session_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._touch_locked(session_id)
+            self._states[session_id] = dict(state)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._states.pop(session_id, None)
+
+
+class SQLiteStore(ConversationStore):
+    """SQLite-backed store; one connection per thread, WAL journal."""
+
+    # Expired sessions are purged at most this often (seconds)
+    _PURGE_INTERVAL = 300
+
+    def __init__(self, path: str, ttl_seconds: float = CONVERSATION_TTL_SECONDS):
+        self._path = path
+        self._ttl = ttl_seconds
+        self._local = threading.local()
+        self._last_purge = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    type TEXT NOT NULL,
+                    content TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, seq);
+                CREATE TABLE IF NOT EXISTS session_state (
+                    session_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL
+                );
+                """
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str) -> List[Message]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT expires_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or row[0] < time.time():
+            return []
+        rows = conn.execute(
+            "SELECT type, content FROM messages WHERE session_id = ? ORDER BY seq",
+            (session_id,),
+        ).fetchall()
+        return [{"type": t, "content": c} for t, c in rows]
+
+    def _touch(self, conn: sqlite3.Connection, session_id: str, now: float) -> None:
+        """Create the session or refresh its TTL (in the caller's transaction)."""
+        row = conn.execute(
+            "SELECT expires_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is not None and row[0] < now:
+            # Expired: start the conversation over
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, expires_at) VALUES (?, ?)",
+            (session_id, now + self._ttl),
+        )
+
+    def append(self, session_id: str, messages: List[Message]) -> None:
+        now = time.time()
+        with self._conn() as conn:
+            self._touch(conn, session_id, now)
+            conn.executemany(
+                "INSERT INTO messages (session_id, type, content) VALUES (?, ?, ?)",
+                [(session_id, m["type"], m["content"]) for m in messages],
+            )
+        if now - self._last_purge > self._PURGE_INTERVAL:
+            self._last_purge = now
+            self.purge_expired()
+
+    def load_state(self, session_id: str) -> Dict[str, Any]:
+        row = self._conn().execute(
+            "SELECT st.state FROM session_state st JOIN sessions s USING (session_id) "
+            "WHERE st.session_id = ? AND s.expires_at >= ?",
+            (session_id, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def save_state(self, session_id: str, state: Dict[str, Any]) -> None:
+        with self._conn() as conn:
+            self._touch(conn, session_id, time.time())
+            conn.execute(
+                "INSERT OR REPLACE INTO session_state (session_id, state) VALUES (?, ?)",
+                (session_id, json.dumps(state)),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self) -> None:
+        with self._conn() as conn:
+            for table in ("messages", "session_state"):
+                conn.execute(
+                    f"DELETE FROM {table} WHERE session_id IN "
+                    "(SELECT session_id FROM sessions WHERE expires_at < ?)",
+                    (time.time(),),
+                )
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+
+
+class RedisStore(ConversationStore):
+    """
+    Redis-backed store: one list per session, refreshed TTL on every write.
+
+    `client` only needs rpush/lrange/get/set/expire/delete with redis-py
+    semantics, so a local stand-in can replace a real server.
+    """
+
+    def __init__(self, client: Any, ttl_seconds: float = CONVERSATION_TTL_SECONDS,
+                 prefix: str = "conversation:"):
+        self._client = client
+        self._ttl = int(ttl_seconds)
+        self._prefix = prefix
+
+    def load(self, session_id: str) -> List[Message]:
+        return [json.loads(raw) for raw in self._client.lrange(self._prefix + session_id, 0, -1)]
+
+    def append(self, session_id: str, messages: List[Message]) -> None:
+        if not messages:
+            return
+        key = self._prefix + session_id
+        self._client.rpush(key, *[json.dumps(m) for m in messages])
+        self._client.expire(key, self._ttl)
+
+    def load_state(self, session_id: str) -> Dict[str, Any]:
+        raw = self._client.get(self._prefix + "state:" + session_id)
+        return json.loads(raw) if raw else {}
+
+    def save_state(self, session_id: str, state: Dict[str, Any]) -> None:
+        self._client.set(self._prefix + "state:" + session_id, json.dumps(state), ex=self._ttl)
+
+    def delete(self, session_id: str) -> None:
+        self._client.delete(self._prefix + session_id, self._prefix + "state:" + session_id)
+
+
+def create_store(url: str) -> ConversationStore:
+    """Build a store from a CONVERSATION_STORE-style URL."""
+    if url.startswith("memory://"):
+        return MemoryStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError(
+                "CONVERSATION_STORE uses Redis but the 'redis' package is not installed. "
+                "Install it with: pip install redis"
+            ) from e
+        return RedisStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported CONVERSATION_STORE URL: {url!r}")
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ConversationStore:
+    """Process-wide store selected by CONVERSATION_STORE."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store(CONVERSATION_STORE)
+    return _store
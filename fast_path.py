@@ -0,0 +1,314 @@
+"""
+Deterministic booking fast-path.
+
+Messages like "book 30 min tomorrow at 3pm, my email is x@y.com" carry
+everything needed for a booking. When the date, time, duration and email
+are all unambiguous, the slot is inside working hours and free, the
+meeting is booked directly through create_meeting (same validation) and
+confirmed with its rendered booking details, without any Gemini round-trips. Anything else - missing
+or conflicting details, hedges ("or", "around", "?"), a timezone other than
+the business one ("3pm EST", "London time", "UTC+1"), busy slots, booking
+errors - falls through to the agent unchanged. When another visitor wins
+the slot while it is being booked (see holds.py), the visitor is offered
+the nearest free slots right away.
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from dateutil import parser as date_parser
+from dateutil import tz as dateutil_tz
+
+import metrics
+from availability import busy_intervals, epoch_to_iso
+from chatbot import SLOT_TAKEN_ERROR, create_meeting_tool
+from config import FAST_PATH_ENABLED, MEETING_BUFFER_MINUTES
+from holds import alternatives
+from slots import working_windows
+from tenants import current
+from tool_format import parse_booking, render_booking
+
+_INTENT_RE = re.compile(r"\b(?:book|schedule|set\s+up|arrange)\b", re.IGNORECASE)
+# Anything that makes the request open-ended is left to the agent
+_HEDGE_RE = re.compile(
+    r"\?|\b(?:or|maybe|possibly|perhaps|around|ish|sometime|either|between|before|after|"
+    r"earliest|latest|cancel|reschedule|move|instead|not|don't|can't|every|weekly|daily)\b",
+    re.IGNORECASE,
+)
+# A time given in another timezone than the business one: UTC/GMT and
+# offsets, abbreviations ("EST", "CET"; in lower case only right after a
+# time), "<region or city> time", "time zone" and IANA names
+_TZ_ABBREVIATIONS = (
+    "est", "edt", "cst", "cdt", "mst", "mdt", "pst", "pdt", "et", "ct", "mt", "pt", "akst",
+    "akdt", "hst", "ast", "adt", "bst", "ist", "wet", "west", "cet", "cest", "eet", "eest",
+    "msk", "gst", "pkt", "ict", "sgt", "hkt", "jst", "kst", "aest", "aedt", "acst", "acdt",
+    "awst", "nzst", "nzdt", "wib",
+)
+_TIMEZONE_RE = re.compile(
+    r"\b(?:utc|gmt)\b"
+    r"|\d(?:\s*[ap]\.?m\b\.?)?\s*(?:[+-]\d{2}:?\d{2}|" + "|".join(_TZ_ABBREVIATIONS) + r")\b"
+    r"|(?-i:\b(?:" + "|".join(_TZ_ABBREVIATIONS).upper() + r")\b)"
+    r"|\btime\s*zones?\b"
+    r"|\b(?:my|your|local|eastern|central|mountain|pacific|atlantic|alaska|hawaii|greenwich"
+    r"|uk|us|india|europe|london|paris|berlin|new\s+york|dubai|singapore|tokyo|sydney"
+    r"|(?-i:(?!(?:What|Any|Same|The|That|This|Next|Free|Meeting|Call|Start|End|Lunch)\b)"
+    r"[A-Z][a-z]+(?:\s+[A-Z][a-z]+)?))\s+time\b"
+    r"|\b[A-Z][a-z]+/[A-Z][A-Za-z_]+\b",
+    re.IGNORECASE,
+)
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_DURATION_RE = re.compile(
+    r"\b(?:(\d{1,3}(?:\.\d+)?)\s*-?\s*(min(?:ute)?s?|hours?|hrs?)|(half\s+an?\s+hour)|(an?\s+hour))\b",
+    re.IGNORECASE,
+)
+_WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*"
+_DATE_RE = re.compile(
+    r"\b(?:(day\s+after\s+tomorrow)|(today)|(tomorrow)"
+    r"|(?:(this|next)\s+)?(" + "|".join(_WEEKDAYS) + r")"
+    r"|(\d{4}-\d{2}-\d{2})"
+    r"|(" + _MONTH + r"\s+\d{1,2}(?:st|nd|rd|th)?(?:,?\s+\d{4})?"
+    r"|\d{1,2}(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH + r"(?:,?\s+\d{4})?))\b",
+    re.IGNORECASE,
+)
+_TIME_RE = re.compile(
+    r"\b(?:(\d{1,2})(?::([0-5]\d))?\s*([ap])\.?m\b\.?|([01]?\d|2[0-3]):([0-5]\d)|(noon))",
+    re.IGNORECASE,
+)
+_RANGE_RE = re.compile(r"\d\s*(?:-|–|to|until|till)\s*\d", re.IGNORECASE)
+
+_MIN_DURATION, _MAX_DURATION = 10, 240
+# Miss reasons of a booking that was attempted and handed to the agent
+_FALLBACK_REASONS = {"error", "rejected"}
+
+
+# ------------- Parsing -------------
+
+
+def _only(matches: List[Any]) -> Optional[Any]:
+    """The single distinct match, or None when there are zero or several."""
+    distinct = {m.group(0).lower(): m for m in matches}
+    return next(iter(distinct.values())) if len(distinct) == 1 else None
+
+
+def _parse_date(match: "re.Match[str]", today: datetime.date) -> Optional[datetime.date]:
+    after_tomorrow, is_today, tomorrow, qualifier, weekday, iso, written = match.groups()
+    if after_tomorrow:
+        return today + datetime.timedelta(days=2)
+    if is_today:
+        return today
+    if tomorrow:
+        return today + datetime.timedelta(days=1)
+    if weekday:
+        # "next friday" and "friday" said on a friday are ambiguous
+        ahead = (_WEEKDAYS.index(weekday.lower()) - today.weekday()) % 7
+        if qualifier and qualifier.lower() == "next" or ahead == 0:
+            return None
+        return today + datetime.timedelta(days=ahead)
+    try:
+        default = datetime.datetime.combine(today, datetime.time())
+        parsed = date_parser.parse(iso or written, default=default).date()
+    except (ValueError, OverflowError):
+        return None
+    # Don't guess whether a past date without a year means next year
+    return parsed if parsed >= today else None
+
+
+def _parse_time(match: "re.Match[str]") -> Optional[datetime.time]:
+    hour, minute, meridiem, hour24, minute24, noon = match.groups()
+    if noon:
+        return datetime.time(12, 0)
+    if hour24:
+        return datetime.time(int(hour24), int(minute24))
+    hour_value = int(hour)
+    if not 1 <= hour_value <= 12:
+        return None
+    hour_value = hour_value % 12 + (12 if meridiem.lower() == "p" else 0)
+    return datetime.time(hour_value, int(minute or 0))
+
+
+def _parse_duration(match: "re.Match[str]") -> Optional[int]:
+    amount, unit, half_hour, hour = match.groups()
+    if half_hour:
+        return 30
+    if hour:
+        return 60
+    minutes = float(amount) * (60 if unit.lower().startswith("h") else 1)
+    return int(minutes) if minutes == int(minutes) else None
+
+
+def parse_booking_request(
+    message: str, now: Optional[datetime.datetime] = None
+) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Extract a complete, unambiguous booking from one message.
+
+    Returns ({"start": datetime, "end": datetime, "attendees": [emails]}, "ok")
+    or (None, reason) where reason names what was missing or ambiguous.
+    """
+    zone = dateutil_tz.gettz(current().timezone) or datetime.timezone.utc
+    now = now or datetime.datetime.now(zone)
+    if not _INTENT_RE.search(message):
+        return None, "no_intent"
+
+    emails = _EMAIL_RE.findall(message)
+    if not emails:
+        return None, "no_email"
+    # Strip emails before looking for hedges and numbers ("or" in a domain etc.)
+    text = _EMAIL_RE.sub(" ", message)
+    if _TIMEZONE_RE.search(text):
+        return None, "timezone"
+
+    date_match = _only(list(_DATE_RE.finditer(text)))
+    if date_match is None:
+        return None, "no_date"
+    day = _parse_date(date_match, now.date())
+    if day is None:
+        return None, "ambiguous_date"
+    text = text[:date_match.start()] + " " + text[date_match.end():]
+    if _HEDGE_RE.search(text):
+        return None, "ambiguous"
+
+    duration_match = _only(list(_DURATION_RE.finditer(text)))
+    if duration_match is None:
+        return None, "no_duration"
+    duration = _parse_duration(duration_match)
+    if duration is None or not _MIN_DURATION <= duration <= _MAX_DURATION:
+        return None, "ambiguous_duration"
+    text = text[:duration_match.start()] + " " + text[duration_match.end():]
+
+    if _RANGE_RE.search(text):
+        return None, "ambiguous_time"
+    time_match = _only(list(_TIME_RE.finditer(text)))
+    if time_match is None:
+        return None, "no_time"
+    at = _parse_time(time_match)
+    if at is None:
+        return None, "ambiguous_time"
+
+    start = datetime.datetime.combine(day, at, zone)
+    return {
+        "start": start,
+        "end": start + datetime.timedelta(minutes=duration),
+        "attendees": list(dict.fromkeys(emails)),
+    }, "ok"
+
+
+# ------------- Stats -------------
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {
+    "attempts": 0,
+    "hits": 0,
+    "fast_ms_total": 0.0,
+    "agent_turns": 0,
+    "agent_ms_total": 0.0,
+    "misses": {},
+}
+
+
+def record_agent_turn(elapsed_ms: float) -> None:
+    """Called for every turn the agent handles, to estimate latency saved."""
+    with _stats_lock:
+        _stats["agent_turns"] += 1
+        _stats["agent_ms_total"] += elapsed_ms
+
+
+def _record(hit: bool, reason: str, elapsed_ms: float) -> None:
+    with _stats_lock:
+        _stats["attempts"] += 1
+        if hit:
+            _stats["hits"] += 1
+            _stats["fast_ms_total"] += elapsed_ms
+        else:
+            _stats["misses"][reason] = _stats["misses"].get(reason, 0) + 1
+
+
+def stats() -> Dict[str, Any]:
+    """Hit rate and estimated latency saved (vs. the average agent turn)."""
+    with _stats_lock:
+        s = dict(_stats, misses=dict(_stats["misses"]))
+    avg_fast = s["fast_ms_total"] / s["hits"] if s["hits"] else 0.0
+    avg_agent = s["agent_ms_total"] / s["agent_turns"] if s["agent_turns"] else 0.0
+    return {
+        "attempts": s["attempts"],
+        "hits": s["hits"],
+        "hit_rate": round(s["hits"] / s["attempts"], 3) if s["attempts"] else 0.0,
+        "misses": s["misses"],
+        "avg_fast_ms": round(avg_fast, 1),
+        "avg_agent_ms": round(avg_agent, 1),
+        "saved_ms_total": round(max(avg_agent - avg_fast, 0) * s["hits"], 1) if avg_agent else 0.0,
+    }
+
+
+# ------------- Booking -------------
+
+
+def try_fast_path(message: str) -> Optional[str]:
+    """Book directly and return the confirmation text, or None to use the agent."""
+    if not FAST_PATH_ENABLED:
+        return None
+    started = time.perf_counter()
+    reply, reason = _book(message)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _record(reply is not None, reason, elapsed_ms)
+    outcome = "hit" if reply is not None else "fallback" if reason in _FALLBACK_REASONS else "miss"
+    metrics.record_fast_path(outcome, reason)
+    return reply
+
+
+def _book(message: str) -> Tuple[Optional[str], str]:
+    booking, reason = parse_booking_request(message)
+    if booking is None:
+        return None, reason
+    start, end = booking["start"].timestamp(), booking["end"].timestamp()
+    if start <= time.time() + 60:
+        return None, "past"
+    if working_windows(start, end) != [(start, end)]:
+        return None, "outside_hours"
+
+    try:
+        buffer = MEETING_BUFFER_MINUTES * 60
+        if busy_intervals(epoch_to_iso(start - buffer), epoch_to_iso(end + buffer)):
+            return None, "busy"
+        reply = create_meeting_tool.func(
+            start_iso=booking["start"].isoformat(),
+            end_iso=booking["end"].isoformat(),
+            attendees=", ".join(booking["attendees"]),
+        )
+    except Exception as e:
+        print("Fast-path booking failed, falling back to the agent:", e)
+        return None, "error"
+    if reply.startswith(SLOT_TAKEN_ERROR):
+        return _taken_reply(start, end), "taken"
+    booked = parse_booking(reply)
+    if booked is None:
+        return None, "rejected"
+    return render_booking(booked), "ok"
+
+
+def _taken_reply(start: float, end: float) -> str:
+    """Reply when the slot went to another visitor: the nearest free slots."""
+    zone = dateutil_tz.gettz(current().timezone)
+    slots = alternatives(start, end)
+    if not slots:
+        return (
+            "Sorry, that time has just been booked or is held for another visitor, and I couldn't find "
+            "another free time in the next week. Would another week work for you?"
+        )
+    lines = []
+    for slot_start, slot_end in slots:
+        s = datetime.datetime.fromtimestamp(slot_start, zone)
+        e = datetime.datetime.fromtimestamp(slot_end, zone)
+        lines.append(f"- {s.strftime('%A, %B %d')}, {s.strftime('%I:%M %p')} - {e.strftime('%I:%M %p')}\n")
+    return (
+        "Sorry, that time has just been booked or is held for another visitor. These times are free "
+        f"and I'm holding them for you for a few minutes ({current().timezone}):\n\n"
+        + "".join(lines)
+        + "\nWhich one would you like?"
+    )
@@ -0,0 +1,239 @@
+"""
+Follow-ups of a chat booking, run as background jobs (see jobs.py).
+
+With BOOKING_JOBS_ENABLED, create_meeting inserts the event without its
+attendees and without waiting for Google Meet, so the chat confirms the
+booking right after the insert. The rest is journaled and run in the
+background:
+
+- meet_link: waits until Google has attached the Meet link, refreshes the
+  booking ledger and adds the link to the conversation, where the widget
+  picks it up (GET /api/chat/updates, a long poll);
+- invite: adds the attendees with sendUpdates="all", which sends the
+  invitations (sending them with the insert held up the reply);
+- webhook: POSTs a booking.created event to BOOKING_WEBHOOK_URL (CRM);
+- reminder: POSTs booking.reminder there BOOKING_REMINDER_MINUTES before
+  the meeting, unless it was cancelled in the meantime.
+
+Job ids are derived from the event id, so a booking repeated after a retry
+schedules nothing new.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Tuple
+
+from availability import iso_to_epoch
+from bookings import current_conversation, get_ledger
+from calendar_tools import _conference_status, _wait_for_conference, execute, meet_link
+from config import BOOKING_REMINDER_MINUTES, BOOKING_UPDATES_WAIT_SECONDS, BOOKING_WEBHOOK_URL
+from conversation_store import get_store
+from jobs import JobFailed, get_queue, handler
+from tenants import current
+
+# Seconds to wait for the CRM webhook to answer
+_WEBHOOK_TIMEOUT = 10
+# Long polls re-read the journal at least this often (jobs finished by other processes)
+_POLL_SECONDS = 1.0
+
+MEET_LINK_READY = "Your Google Meet link is ready: {link}"
+MEET_LINK_MISSING = (
+    "I couldn't get the Google Meet link just now; you'll find it in the "
+    "calendar invitation and on the calendar event."
+)
+
+
+def _booking(event: Dict[str, Any], attendees: List[str]) -> Dict[str, Any]:
+    """What the CRM webhook receives about a booking."""
+    return {
+        "tenant": current().key,
+        "event_id": event.get("id"),
+        "summary": event.get("summary"),
+        "start": (event.get("start") or {}).get("dateTime"),
+        "end": (event.get("end") or {}).get("dateTime"),
+        "attendees": attendees,
+        "html_link": event.get("htmlLink"),
+    }
+
+
+def schedule(event: Dict[str, Any], attendees: List[str], key: str) -> None:
+    """Journal the follow-up jobs of a booking just inserted under idempotency `key`."""
+    queue = get_queue()
+    event_id = event["id"]
+    queue.submit("meet_link", {"event_id": event_id, "key": key}, job_id=f"meet_link:{event_id}")
+    if attendees:
+        queue.submit(
+            "invite", {"event_id": event_id, "attendees": attendees}, job_id=f"invite:{event_id}"
+        )
+    if not BOOKING_WEBHOOK_URL:
+        return
+    booking = _booking(event, attendees)
+    queue.submit(
+        "webhook", {"type": "booking.created", "booking": booking}, job_id=f"webhook:{event_id}"
+    )
+    if BOOKING_REMINDER_MINUTES > 0 and booking["start"]:
+        remind_at = iso_to_epoch(booking["start"]) - BOOKING_REMINDER_MINUTES * 60
+        if remind_at > time.time():
+            queue.submit(
+                "reminder",
+                {"event_id": event_id, "booking": booking},
+                job_id=f"reminder:{event_id}",
+                run_at=remind_at,
+            )
+
+
+def start() -> None:
+    """Start the workers, so jobs left in the journal by a previous run resume."""
+    get_queue().start()
+
+
+# ------------- Handlers -------------
+
+
+def _get_event(event_id: str) -> Dict[str, Any]:
+    calendar_id = current().calendar_id
+    return execute(
+        "calendar.events.get",
+        lambda service: service.events().get(calendarId=calendar_id, eventId=event_id),
+    )
+
+
+@handler("meet_link")
+def _meet_link_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    event = _get_event(payload["event_id"])
+    if event.get("status") == "cancelled":
+        return {"event_id": event["id"], "meet_link": "", "cancelled": True}
+    event = _wait_for_conference(event)
+    link = meet_link(event)
+    if not link and _conference_status(event) == "pending":
+        # Retried with backoff by the queue
+        raise RuntimeError("the Meet link is still being created")
+    # Repeats of this booking now answer with the link
+    get_ledger().put(payload["key"], event)
+    conversation_id = current_conversation.get()
+    if conversation_id and link:
+        # So the assistant knows the link if the visitor asks for it later
+        get_store().append(
+            conversation_id, [{"type": "ai", "content": MEET_LINK_READY.format(link=link)}]
+        )
+    return {"event_id": event["id"], "meet_link": link, "html_link": event.get("htmlLink")}
+
+
+@handler("invite")
+def _invite_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    calendar_id = current().calendar_id
+    event_id = payload["event_id"]
+    # Setting the same attendees again is harmless, so retries are safe
+    event = execute(
+        "calendar.events.patch",
+        lambda service: service.events().patch(
+            calendarId=calendar_id,
+            eventId=event_id,
+            body={"attendees": [{"email": email} for email in payload["attendees"]]},
+            conferenceDataVersion=1,
+            sendUpdates="all",
+        ),
+    )
+    return {"event_id": event.get("id"), "invited": len(payload["attendees"])}
+
+
+def _post_webhook(body: Dict[str, Any]) -> None:
+    request = urllib.request.Request(
+        BOOKING_WEBHOOK_URL,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=_WEBHOOK_TIMEOUT) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        # The hook refused the payload; sending it again won't help
+        if 400 <= e.code < 500 and e.code not in (408, 429):
+            raise JobFailed(f"webhook answered {e.code}") from e
+        raise
+
+
+@handler("webhook")
+def _webhook_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    _post_webhook(payload)
+    return {"posted": payload["type"]}
+
+
+@handler("reminder")
+def _reminder_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    event = _get_event(payload["event_id"])
+    if event.get("status") == "cancelled":
+        return {"skipped": "cancelled"}
+    booking = dict(
+        payload["booking"],
+        start=(event.get("start") or {}).get("dateTime"),
+        end=(event.get("end") or {}).get("dateTime"),
+    )
+    _post_webhook({"type": "booking.reminder", "booking": booking})
+    return {"posted": "booking.reminder"}
+
+
+# ------------- Widget updates -------------
+
+
+def updates(conversation_id: str) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    (updates, pending) for a conversation: one update per booking whose Meet
+    link job finished, oldest first ({"id", "event_id", "meet_link",
+    "message"}), and how many are still running.
+    """
+    finished: List[Dict[str, Any]] = []
+    pending = 0
+    for job in get_queue().results(conversation_id, "meet_link"):
+        if job["status"] in ("pending", "running"):
+            pending += 1
+            continue
+        result = job["result"] or {}
+        if result.get("cancelled"):
+            continue
+        link = result.get("meet_link") or ""
+        finished.append(
+            {
+                "id": job["id"],
+                "event_id": result.get("event_id") or job["id"].partition(":")[2],
+                "meet_link": link,
+                "message": MEET_LINK_READY.format(link=link) if link else MEET_LINK_MISSING,
+            }
+        )
+    return finished, pending
+
+
+def wait_for_updates(
+    conversation_id: str, seen: int = 0, wait: float = BOOKING_UPDATES_WAIT_SECONDS
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    updates() once there are more than `seen` of them, nothing is pending,
+    or `wait` seconds have passed (blocking this thread).
+    """
+    deadline = time.monotonic() + min(wait, BOOKING_UPDATES_WAIT_SECONDS)
+    queue = get_queue()
+    while True:
+        finished, pending = updates(conversation_id)
+        remaining = deadline - time.monotonic()
+        if len(finished) > seen or not pending or remaining <= 0:
+            return finished, pending
+        queue.wait_for_change(min(remaining, _POLL_SECONDS))
+
+
+async def await_updates(
+    conversation_id: str, seen: int = 0, wait: float = BOOKING_UPDATES_WAIT_SECONDS
+) -> Tuple[List[Dict[str, Any]], int]:
+    """Async variant of wait_for_updates: polls without holding a thread."""
+    deadline = time.monotonic() + min(wait, BOOKING_UPDATES_WAIT_SECONDS)
+    while True:
+        finished, pending = await asyncio.to_thread(updates, conversation_id)
+        remaining = deadline - time.monotonic()
+        if len(finished) > seen or not pending or remaining <= 0:
+            return finished, pending
+        await asyncio.sleep(min(remaining, _POLL_SECONDS / 2))
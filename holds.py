@@ -0,0 +1,451 @@
+"""
+Tentative slot holds.
+
+Two conversations can be offered the same free slot and both try to book
+it. Holds keep them apart:
+
+- offer: the slots offered to a conversation (find_free_slots, or the
+  alternatives below) are held for it for SLOT_HOLD_TTL_SECONDS, so other
+  conversations are offered other slots meanwhile. Holding is atomic too:
+  of the candidate slots, only those nobody else holds are offered, so two
+  conversations searching at once are never promised the same slot. A new
+  offer replaces the conversation's previous one.
+- booking: create_meeting claims its slot before inserting. The claim is
+  one atomic check-and-insert against every other conversation's holds.
+  The slot is then checked against freshly synced busy data while the
+  claim keeps concurrent bookings of it out. After the insert the claim
+  stays for _BOOKED_SECONDS as a "booked" hold, until the event is in every
+  worker's busy data.
+
+A booking that loses raises SlotTaken. create_meeting answers it with the
+nearest free alternatives (held for the conversation) rather than an
+error, and the fast path shows them to the visitor directly.
+
+Holds live in SLOT_HOLDS_STORE:
+- memory://              this process only
+- sqlite:///path/to.db   local SQLite file, shared by all workers on a host
+"""
+
+from __future__ import annotations
+
+import contextlib
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dateutil import tz as dateutil_tz
+
+import metrics
+from availability import busy_intervals, epoch_to_iso, get_index
+from bookings import current_conversation, get_ledger
+from calendar_tools import _existing_bookings
+from config import (
+    AVAILABILITY_BACKEND,
+    SLOT_HOLD_TTL_SECONDS,
+    SLOT_HOLDS_ENABLED,
+    SLOT_HOLDS_STORE,
+)
+from slots import find_free_slots
+from tenants import current
+
+Interval = Tuple[float, float]
+
+# A claim neither booked nor released within this long is dropped (its process died)
+_CLAIM_SECONDS = 120
+# A booked slot stays held this long, until other workers' busy data shows it
+_BOOKED_SECONDS = 60
+# At booking time, busy data older than this is synced first
+_FRESH_SECONDS = 2.0
+# Alternatives offered for a taken slot: how many and how far ahead
+_ALTERNATIVES = 3
+_ALTERNATIVE_DAYS = 7
+# No slot is offered (and held) that starts sooner than this from now
+OFFER_LEAD_SECONDS = 15 * 60
+
+
+class SlotTaken(Exception):
+    """The slot is held by another conversation ("held") or busy in the calendar ("busy")."""
+
+    def __init__(self, start: float, end: float, reason: str):
+        super().__init__(f"Slot {epoch_to_iso(start)} - {epoch_to_iso(end)} is {reason}")
+        self.start = start
+        self.end = end
+        self.reason = reason
+
+
+class HoldStore(ABC):
+    """
+    Interface shared by all backends. Holds are (start, end) ranges of a
+    tenant, owned by a conversation, of kind "offer", "booking" or "booked",
+    and expire on their own.
+    """
+
+    @abstractmethod
+    def offer(
+        self, tenant: str, owner: str, slots: List[Interval], ttl: float, limit: int
+    ) -> List[Interval]:
+        """
+        Atomically replace the owner's offer holds with the first `limit` of
+        `slots` no other owner holds; returns those.
+        """
+
+    @abstractmethod
+    def claim(self, tenant: str, owner: str, start: float, end: float, ttl: float) -> bool:
+        """
+        Atomically add a booking hold on [start, end), unless another owner
+        holds an overlapping range; False if so.
+        """
+
+    @abstractmethod
+    def settle(
+        self, tenant: str, owner: str, start: float, end: float, booked: bool, ttl: float
+    ) -> None:
+        """
+        End the owner's claim on [start, end): if booked, keep it as a
+        booked hold for `ttl` and drop the owner's offers; else drop it.
+        """
+
+    @abstractmethod
+    def held(self, tenant: str, start: float, end: float, exclude_owner: str) -> List[Interval]:
+        """Holds of other owners overlapping [start, end)."""
+
+
+class MemoryHolds(HoldStore):
+    """In-process holds; a lock makes claims atomic."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # tenant -> [(start, end, owner, kind, expires_at)]
+        self._holds: Dict[str, List[Tuple[float, float, str, str, float]]] = {}
+
+    def _live_locked(self, tenant: str) -> List[Tuple[float, float, str, str, float]]:
+        now = time.time()
+        holds = [h for h in self._holds.get(tenant, []) if h[4] > now]
+        if holds:
+            self._holds[tenant] = holds
+        else:
+            self._holds.pop(tenant, None)
+        return holds
+
+    def offer(
+        self, tenant: str, owner: str, slots: List[Interval], ttl: float, limit: int
+    ) -> List[Interval]:
+        expires_at = time.time() + ttl
+        with self._lock:
+            holds = [h for h in self._live_locked(tenant) if h[2] != owner or h[3] != "offer"]
+            others = [h for h in holds if h[2] != owner]
+            free = [
+                (start, end) for start, end in slots
+                if not any(h[0] < end and start < h[1] for h in others)
+            ][:limit]
+            holds.extend((start, end, owner, "offer", expires_at) for start, end in free)
+            self._holds[tenant] = holds
+            return free
+
+    def claim(self, tenant: str, owner: str, start: float, end: float, ttl: float) -> bool:
+        with self._lock:
+            holds = self._live_locked(tenant)
+            if any(h[2] != owner and h[0] < end and start < h[1] for h in holds):
+                return False
+            holds.append((start, end, owner, "booking", time.time() + ttl))
+            self._holds[tenant] = holds
+            return True
+
+    def settle(
+        self, tenant: str, owner: str, start: float, end: float, booked: bool, ttl: float
+    ) -> None:
+        with self._lock:
+            holds = [
+                h for h in self._live_locked(tenant)
+                if h[2] != owner
+                or not ((h[0], h[1]) == (start, end) and h[3] != "offer" or booked and h[3] == "offer")
+            ]
+            if booked:
+                holds.append((start, end, owner, "booked", time.time() + ttl))
+            self._holds[tenant] = holds
+
+    def held(self, tenant: str, start: float, end: float, exclude_owner: str) -> List[Interval]:
+        with self._lock:
+            return sorted(
+                (h[0], h[1]) for h in self._live_locked(tenant)
+                if h[2] != exclude_owner and h[0] < end and start < h[1]
+            )
+
+
+class SQLiteHolds(HoldStore):
+    """
+    SQLite-backed holds; one connection per thread, WAL journal. Claims run
+    in a BEGIN IMMEDIATE transaction, so claims from different processes
+    are serialized by the database's write lock.
+    """
+
+    # Expired holds are purged at most this often (seconds)
+    _PURGE_INTERVAL = 60
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS holds (
+                tenant TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                start_at REAL NOT NULL,
+                end_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS holds_tenant ON holds (tenant, start_at);
+            CREATE INDEX IF NOT EXISTS holds_owner ON holds (owner, kind);
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; writes open their own transactions (see _write)
+            conn = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction holding the database lock from its first statement."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def offer(
+        self, tenant: str, owner: str, slots: List[Interval], ttl: float, limit: int
+    ) -> List[Interval]:
+        now = time.time()
+        free: List[Interval] = []
+        with self._write() as conn:
+            if now - self._last_purge > self._PURGE_INTERVAL:
+                self._last_purge = now
+                conn.execute("DELETE FROM holds WHERE expires_at < ?", (now,))
+            conn.execute(
+                "DELETE FROM holds WHERE owner = ? AND kind = 'offer' AND tenant = ?",
+                (owner, tenant),
+            )
+            for start, end in slots:
+                if len(free) >= limit:
+                    break
+                taken = conn.execute(
+                    "SELECT 1 FROM holds WHERE tenant = ? AND owner != ? AND expires_at > ? "
+                    "AND start_at < ? AND end_at > ? LIMIT 1",
+                    (tenant, owner, now, end, start),
+                ).fetchone()
+                if taken is None:
+                    free.append((start, end))
+            conn.executemany(
+                "INSERT INTO holds (tenant, owner, kind, start_at, end_at, expires_at) "
+                "VALUES (?, ?, 'offer', ?, ?, ?)",
+                [(tenant, owner, start, end, now + ttl) for start, end in free],
+            )
+        return free
+
+    def claim(self, tenant: str, owner: str, start: float, end: float, ttl: float) -> bool:
+        now = time.time()
+        with self._write() as conn:
+            taken = conn.execute(
+                "SELECT 1 FROM holds WHERE tenant = ? AND owner != ? AND expires_at > ? "
+                "AND start_at < ? AND end_at > ? LIMIT 1",
+                (tenant, owner, now, end, start),
+            ).fetchone()
+            if taken is None:
+                conn.execute(
+                    "INSERT INTO holds (tenant, owner, kind, start_at, end_at, expires_at) "
+                    "VALUES (?, ?, 'booking', ?, ?, ?)",
+                    (tenant, owner, start, end, now + ttl),
+                )
+        return taken is None
+
+    def settle(
+        self, tenant: str, owner: str, start: float, end: float, booked: bool, ttl: float
+    ) -> None:
+        with self._write() as conn:
+            # The claim, and any booked hold left by an earlier try of the same booking
+            conn.execute(
+                "DELETE FROM holds WHERE owner = ? AND tenant = ? AND kind != 'offer' "
+                "AND start_at = ? AND end_at = ?",
+                (owner, tenant, start, end),
+            )
+            if booked:
+                conn.execute(
+                    "DELETE FROM holds WHERE owner = ? AND tenant = ? AND kind = 'offer'",
+                    (owner, tenant),
+                )
+                conn.execute(
+                    "INSERT INTO holds (tenant, owner, kind, start_at, end_at, expires_at) "
+                    "VALUES (?, ?, 'booked', ?, ?, ?)",
+                    (tenant, owner, start, end, time.time() + ttl),
+                )
+
+    def held(self, tenant: str, start: float, end: float, exclude_owner: str) -> List[Interval]:
+        rows = self._conn().execute(
+            "SELECT start_at, end_at FROM holds WHERE tenant = ? AND owner != ? "
+            "AND expires_at > ? AND start_at < ? AND end_at > ? ORDER BY start_at",
+            (tenant, exclude_owner, time.time(), end, start),
+        ).fetchall()
+        return [(s, e) for s, e in rows]
+
+
+def create_holds(url: str) -> HoldStore:
+    """Build a hold store from a SLOT_HOLDS_STORE-style URL."""
+    if url.startswith("memory://"):
+        return MemoryHolds()
+    if url.startswith("sqlite:///"):
+        return SQLiteHolds(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported SLOT_HOLDS_STORE URL: {url!r}")
+
+
+_holds: Optional[HoldStore] = None
+_holds_lock = threading.Lock()
+
+
+def get_holds() -> HoldStore:
+    """Process-wide hold store selected by SLOT_HOLDS_STORE."""
+    global _holds
+    if _holds is None:
+        with _holds_lock:
+            if _holds is None:
+                _holds = create_holds(SLOT_HOLDS_STORE)
+    return _holds
+
+
+# ------------- Offering -------------
+
+
+def offer(slots: List[Interval], limit: int) -> List[Interval]:
+    """
+    The first `limit` of the candidate `slots` that are not held for
+    another conversation, now held for the current one.
+    """
+    conversation = current_conversation.get()
+    if not SLOT_HOLDS_ENABLED or SLOT_HOLD_TTL_SECONDS <= 0 or not conversation:
+        return slots[:limit]
+    held = get_holds().offer(current().key, conversation, slots, SLOT_HOLD_TTL_SECONDS, limit)
+    metrics.record_hold("offered", len(held))
+    return held
+
+
+def held_by_others(start: float, end: float) -> List[Interval]:
+    """Ranges between start and end held for other conversations; count them as busy."""
+    if not SLOT_HOLDS_ENABLED:
+        return []
+    return get_holds().held(current().key, start, end, current_conversation.get())
+
+
+def alternatives(start: float, end: float, count: int = _ALTERNATIVES) -> List[Interval]:
+    """
+    The `count` free slots as long as [start, end) nearest to it, from the
+    start of its day on, skipping other conversations' holds. They are held
+    for the current conversation.
+    """
+    zone = dateutil_tz.gettz(current().timezone) or datetime.timezone.utc
+    midnight = datetime.datetime.fromtimestamp(start, zone).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    range_start = max(midnight.timestamp(), time.time() + OFFER_LEAD_SECONDS)
+    range_end = range_start + _ALTERNATIVE_DAYS * 86400
+    busy = busy_intervals(epoch_to_iso(range_start), epoch_to_iso(range_end))
+    candidates = find_free_slots(
+        busy + held_by_others(range_start, range_end),
+        range_start,
+        range_end,
+        duration_minutes=max(1, round((end - start) / 60)),
+        max_slots=count * 4,
+        max_per_day=count * 2,
+    )
+    # Nearest first, so the nearest ones still free are held
+    candidates.sort(key=lambda slot: abs(slot[0] - start))
+    return sorted(offer(candidates, count))
+
+
+# ------------- Booking -------------
+
+
+def _busy_now(start: float, end: float) -> List[Interval]:
+    """Busy intervals overlapping [start, end), from data at most _FRESH_SECONDS old."""
+    if AVAILABILITY_BACKEND == "index":
+        index = get_index()
+        if index.covers(start, end):
+            index.sync(max_age=_FRESH_SECONDS)
+    return busy_intervals(epoch_to_iso(start), epoch_to_iso(end))
+
+
+def _booked_before(key: str) -> bool:
+    """Whether booking `key` is in the calendar already (a repeated create_meeting)."""
+    return bool(_existing_bookings(current().calendar_id, [(0, key)]))
+
+
+def claim_slot(start: float, end: float, key: str) -> bool:
+    """
+    Claim [start, end) for booking `key` made outside a chat turn (the batch
+    API); False if another conversation holds an overlapping range. The
+    caller checks the calendar itself and must `settle_slot` afterwards.
+    """
+    if not SLOT_HOLDS_ENABLED:
+        return True
+    owner = current_conversation.get() or f"booking:{key}"
+    if not get_holds().claim(current().key, owner, start, end, _CLAIM_SECONDS):
+        metrics.record_hold("held")
+        return False
+    return True
+
+
+def settle_slot(start: float, end: float, key: str, booked: bool) -> None:
+    """End a claim_slot claim: keep it as a booked hold, or release it."""
+    if not SLOT_HOLDS_ENABLED:
+        return
+    owner = current_conversation.get() or f"booking:{key}"
+    get_holds().settle(current().key, owner, start, end, booked, _BOOKED_SECONDS)
+    if booked:
+        metrics.record_hold("claimed")
+
+
+@contextlib.contextmanager
+def reserve(start: float, end: float, key: str) -> Iterator[None]:
+    """
+    Hold [start, end) for the booking `key` made in the with-block.
+
+    Raises SlotTaken, before the block runs, if another conversation holds
+    an overlapping range or the calendar is busy then. Repeating booking
+    `key` is let through (create_event returns the existing event).
+    """
+    if not SLOT_HOLDS_ENABLED:
+        yield
+        return
+    tenant = current()
+    owner = current_conversation.get() or f"booking:{key}"
+    store = get_holds()
+    if not store.claim(tenant.key, owner, start, end, _CLAIM_SECONDS):
+        metrics.record_hold("held")
+        raise SlotTaken(start, end, "held")
+    booked = False
+    try:
+        # A booking still in the ledger is a repeat; skip the sync
+        if not get_ledger().contains(key) and _busy_now(start, end) and not _booked_before(key):
+            metrics.record_hold("busy")
+            raise SlotTaken(start, end, "busy")
+        yield
+        booked = True
+    finally:
+        store.settle(tenant.key, owner, start, end, booked, _BOOKED_SECONDS)
+    metrics.record_hold("claimed")
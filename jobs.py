@@ -0,0 +1,343 @@
+"""
+Background jobs with a SQLite journal.
+
+Work that doesn't have to hold up a chat reply (see followups.py) is
+submitted here and run by a few worker threads. Every job is written to the
+journal (BOOKING_JOBS_JOURNAL) before it is queued, and its outcome once it
+ran, so:
+
+- a job still queued when the process stopped runs when the queue next
+  starts (in this or another process sharing the journal), and one cut
+  off mid-run runs again once its lease (_LEASE_SECONDS) has run out;
+- a job that raises is retried with exponential backoff, up to
+  BOOKING_JOBS_MAX_ATTEMPTS attempts, then marked failed (JobFailed fails
+  it at once);
+- submitting a job id that already exists does nothing, so repeating a
+  booking doesn't repeat its follow-ups.
+
+Handlers are registered by kind with @handler("kind") and run with the
+tenant and conversation of the turn that submitted the job. A job can be
+scheduled for later (run_at), e.g. a reminder. Each process runs the jobs
+it submitted and sweeps the journal every _SWEEP_SECONDS for jobs that are
+due or were left behind; claiming a job is one atomic UPDATE, so processes
+sharing a journal never run the same job at once.
+
+`results(conversation_id, kind)` lists a conversation's jobs with their
+results and `wait_for_change` blocks until a job finishes in this process,
+which is what the widget's long poll (GET /api/chat/updates) is built on.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import metrics
+from bookings import current_conversation
+from config import BOOKING_JOBS_JOURNAL, BOOKING_JOBS_MAX_ATTEMPTS, BOOKING_JOBS_WORKERS
+from tenants import current, current_tenant, get_tenant
+
+Handler = Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+# Job kind -> handler (payload -> JSON-serializable result)
+_handlers: Dict[str, Handler] = {}
+
+# A running job not finished within this many seconds is assumed lost (its process died)
+_LEASE_SECONDS = 120
+# How often each process looks in the journal for jobs it doesn't have queued
+_SWEEP_SECONDS = 30
+_MAX_BACKOFF_SECONDS = 600
+
+
+def handler(kind: str) -> Callable[[Handler], Handler]:
+    """Register the function that runs jobs of `kind`."""
+
+    def register(func: Handler) -> Handler:
+        _handlers[kind] = func
+        return func
+
+    return register
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail its job without further attempts."""
+
+
+class JobQueue:
+    """
+    Journaled job queue run by `workers` threads, started on first submit.
+
+    Counters: submitted, done, retries, failed, recovered (jobs queued by a
+    journal sweep: left behind by a restart, or submitted elsewhere).
+    """
+
+    def __init__(
+        self,
+        path: str = BOOKING_JOBS_JOURNAL,
+        workers: int = BOOKING_JOBS_WORKERS,
+        max_attempts: int = BOOKING_JOBS_MAX_ATTEMPTS,
+    ):
+        self._path = path
+        self._workers = max(1, workers)
+        self._max_attempts = max(1, max_attempts)
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        # (run_at, job id) of the jobs this process will run, and their ids
+        self._heap: List[Tuple[float, str]] = []
+        self._queued: Set[str] = set()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._next_sweep = 0.0
+        # Bumped whenever a job finishes (see wait_for_change)
+        self._version = 0
+        self._counters = {"submitted": 0, "done": 0, "retries": 0, "failed": 0, "recovered": 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    tenant TEXT NOT NULL,
+                    conversation TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    run_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_at);
+                CREATE INDEX IF NOT EXISTS jobs_conversation ON jobs (conversation, kind);
+                """
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    # ------------- Submitting -------------
+
+    def submit(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        job_id: Optional[str] = None,
+        run_at: Optional[float] = None,
+    ) -> str:
+        """
+        Journal a job and queue it; returns its id. Runs for the current
+        tenant and conversation, at `run_at` (epoch seconds; default now).
+        Nothing happens if `job_id` was submitted before.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        run_at = run_at or now
+        with self._conn() as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, payload, tenant, conversation, status, "
+                "run_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'pending', ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), current().key, current_conversation.get(),
+                 run_at, now, now),
+            ).rowcount
+        if inserted:
+            with self._cond:
+                self._counters["submitted"] += 1
+                self._push_locked(run_at, job_id)
+            self.start()
+        return job_id
+
+    def _push_locked(self, run_at: float, job_id: str) -> None:
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            heapq.heappush(self._heap, (run_at, job_id))
+            self._cond.notify()
+
+    # ------------- Workers -------------
+
+    def start(self) -> None:
+        """Start the workers (their first sweep picks up jobs left in the journal)."""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            self._next_sweep = 0.0
+            self._threads = [
+                threading.Thread(target=self._work, name=f"jobs-{n}", daemon=True)
+                for n in range(self._workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the workers after their current job; queued jobs stay in the journal."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+        with self._cond:
+            self._heap.clear()
+            self._queued.clear()
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._next()
+            if job_id is None:
+                return
+            try:
+                self._run(job_id)
+            except Exception as e:
+                # Journal trouble; the job stays pending or running and is swept up later
+                print(f"Job {job_id} could not be run: {e}")
+
+    def _next(self) -> Optional[str]:
+        """Block until a job is due; None once stopping."""
+        with self._cond:
+            while not self._stopping:
+                now = time.time()
+                if now >= self._next_sweep:
+                    self._next_sweep = now + _SWEEP_SECONDS
+                    self._sweep_locked(now)
+                if self._heap and self._heap[0][0] <= now:
+                    _, job_id = heapq.heappop(self._heap)
+                    self._queued.discard(job_id)
+                    return job_id
+                wake = min(self._next_sweep, self._heap[0][0]) if self._heap else self._next_sweep
+                self._cond.wait(max(wake - now, 0.01))
+            return None
+
+    def _sweep_locked(self, now: float) -> None:
+        rows = self._conn().execute(
+            "SELECT id, run_at FROM jobs WHERE status = 'pending' "
+            "OR (status = 'running' AND updated_at < ?)",
+            (now - _LEASE_SECONDS,),
+        ).fetchall()
+        for job_id, run_at in rows:
+            if job_id not in self._queued:
+                self._counters["recovered"] += 1
+                self._push_locked(run_at, job_id)
+
+    def _run(self, job_id: str) -> None:
+        now = time.time()
+        with self._conn() as conn:
+            # Claim: only one worker (of any process) gets past this
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ? AND run_at <= ? "
+                "AND (status = 'pending' OR (status = 'running' AND updated_at < ?))",
+                (now, job_id, now, now - _LEASE_SECONDS),
+            ).rowcount
+        if not claimed:
+            return
+        kind, payload, tenant_key, conversation, attempts = self._conn().execute(
+            "SELECT kind, payload, tenant, conversation, attempts FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        try:
+            func = _handlers.get(kind)
+            if func is None:
+                raise JobFailed(f"no handler for job kind {kind!r}")
+            tenant_token = current_tenant.set(get_tenant(tenant_key))
+            conversation_token = current_conversation.set(conversation)
+            try:
+                result = func(json.loads(payload))
+            finally:
+                current_conversation.reset(conversation_token)
+                current_tenant.reset(tenant_token)
+        except Exception as e:
+            self._failed(job_id, kind, attempts, e)
+        else:
+            with self._conn() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated_at = ? "
+                    "WHERE id = ?",
+                    (json.dumps(result), time.time(), job_id),
+                )
+            metrics.record_job(kind, "done")
+            self._finished("done")
+
+    def _failed(self, job_id: str, kind: str, attempts: int, error: Exception) -> None:
+        message = f"{type(error).__name__}: {error}"
+        if isinstance(error, JobFailed) or attempts >= self._max_attempts:
+            print(f"Job {job_id} ({kind}) failed after {attempts} attempt(s): {message}")
+            with self._conn() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                    (message, time.time(), job_id),
+                )
+            metrics.record_job(kind, "failed")
+            self._finished("failed")
+            return
+        # Jitter keeps the retries of jobs that failed together apart
+        run_at = time.time() + random.uniform(0.5, 1.0) * min(2 ** attempts, _MAX_BACKOFF_SECONDS)
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', run_at = ?, error = ?, updated_at = ? "
+                "WHERE id = ?",
+                (run_at, message, time.time(), job_id),
+            )
+        metrics.record_job(kind, "retry")
+        with self._cond:
+            self._counters["retries"] += 1
+            self._push_locked(run_at, job_id)
+
+    def _finished(self, outcome: str) -> None:
+        with self._cond:
+            self._counters[outcome] += 1
+            self._version += 1
+            self._cond.notify_all()
+
+    # ------------- Reading -------------
+
+    def results(self, conversation_id: str, kind: str) -> List[Dict[str, Any]]:
+        """A conversation's jobs of `kind`, oldest first: {"id", "status", "result", "error"}."""
+        rows = self._conn().execute(
+            "SELECT id, status, result, error FROM jobs WHERE conversation = ? AND kind = ? "
+            "ORDER BY created_at",
+            (conversation_id, kind),
+        ).fetchall()
+        return [
+            {"id": i, "status": s, "result": json.loads(r) if r else None, "error": e}
+            for i, s, r, e in rows
+        ]
+
+    def wait_for_change(self, timeout: float) -> None:
+        """Block until a job finishes in this process, or for `timeout` seconds."""
+        with self._cond:
+            version = self._version
+            self._cond.wait_for(lambda: self._version != version, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self._counters, queued=len(self._heap), workers=len(self._threads))
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    """Process-wide job queue."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
@@ -0,0 +1,328 @@
+"""
+Request tracing and Prometheus metrics.
+
+Enabled with METRICS_ENABLED. Timing spans cover session decode, each LLM
+call, each tool call, each Calendar API call, credential refresh and
+response serialization; per-turn latency, token counts and tool-call counts
+are exported as histograms on GET /metrics (Prometheus text format, no
+client library needed). With OTEL_TRACING_ENABLED every span is also
+opened as an OpenTelemetry span (requires `opentelemetry-api`; configure
+an SDK/exporter as usual).
+
+When METRICS_ENABLED is off, `span()` returns one shared no-op context
+manager and the recorders return immediately, and MetricsMiddleware is
+not added to the agent, so there is nothing on the hot path. The agent
+middleware lives in agent_middleware.py, so importing this module stays
+cheap.
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, ContextManager, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import METRICS_ENABLED, OTEL_TRACING_ENABLED
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+# A conversation with no turn for this long is counted as finished
+_CONVERSATION_IDLE_SECONDS = 1800
+
+LabelValues = Tuple[str, ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed label set."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> (bucket counts, sum, count)
+        self._series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            if i < len(self.buckets):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for label_values, counts, total, count in sorted(snapshot):
+            base = list(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(base + [('le', _num(bound))])} {cumulative}"
+            yield f"{self.name}_bucket{_labels(base + [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_labels(base)} {_num(total)}"
+            yield f"{self.name}_count{_labels(base)} {count}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for label_values, value in snapshot:
+            yield f"{self.name}{_labels(list(zip(self.labels, label_values)))} {_num(value)}"
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    escaped = (
+        k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _num(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+SPAN_SECONDS = Histogram(
+    "chat_span_seconds", "Duration of traced operations", ["span"], _LATENCY_BUCKETS
+)
+TURN_SECONDS = Histogram(
+    "chat_turn_seconds", "End-to-end chat turn latency", ["path", "transport"], _LATENCY_BUCKETS
+)
+TURN_TOKENS = Histogram(
+    "chat_turn_tokens",
+    "Model tokens used by one chat turn (cached = input tokens served from Gemini's prompt cache)",
+    ["kind"],
+    _TOKEN_BUCKETS,
+)
+PROMPT_HISTORY_TOKENS = Histogram(
+    "chat_prompt_history_tokens",
+    "Estimated tokens of an agent turn's conversation history: full = the whole "
+    "history plus the new message, sent = what the prompt carried after trimming and summary",
+    ["kind"],
+    _TOKEN_BUCKETS,
+)
+TURN_TOOL_CALLS = Histogram(
+    "chat_turn_tool_calls", "Tool calls made in one chat turn", [], _COUNT_BUCKETS
+)
+CONVERSATION_TOOL_CALLS = Histogram(
+    "chat_conversation_tool_calls",
+    f"Tool calls made in one conversation (observed after {_CONVERSATION_IDLE_SECONDS}s idle)",
+    [],
+    _COUNT_BUCKETS,
+)
+TOOL_CALLS = Counter("chat_tool_calls_total", "Tool calls by tool and outcome", ["tool", "outcome"])
+SPAN_ERRORS = Counter("chat_span_errors_total", "Traced operations that raised", ["span"])
+BOOKING_REJECTIONS = Counter(
+    "chat_booking_rejections_total",
+    "create_meeting calls rejected before reaching Calendar (each costs another model round)",
+    ["reason"],
+)
+CACHE_LOOKUPS = Counter(
+    "chat_response_cache_lookups_total",
+    "Response cache lookups by result (exact_hits, similar_hits, misses, errors)",
+    ["result"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "chat_admission_wait_seconds",
+    "Time agent turns waited for a slot in the admission queue, by priority and outcome "
+    "(admitted, queue_full, shed, timeout)",
+    ["priority", "outcome"],
+    _LATENCY_BUCKETS,
+)
+RATE_LIMITED = Counter(
+    "chat_rate_limited_total", "Chat requests refused by the rate limiter, by bucket", ["bucket"]
+)
+BOOKING_JOBS = Counter(
+    "booking_jobs_total",
+    "Background booking jobs run, by kind and outcome (done, retry, failed)",
+    ["kind", "outcome"],
+)
+FAST_PATH = Counter(
+    "chat_fast_path_total",
+    "Booking fast-path attempts by outcome (hit; miss: left to the agent before booking; "
+    "fallback: an attempted booking handed to the agent) and reason",
+    ["outcome", "reason"],
+)
+
+SLOT_HOLDS = Counter(
+    "slot_holds_total",
+    "Slot reservations by outcome (offered, claimed, held: taken by another "
+    "conversation's hold, busy: taken in the calendar)",
+    ["outcome"],
+)
+_REGISTRY = (
+    TURN_SECONDS, SPAN_SECONDS, TURN_TOKENS, PROMPT_HISTORY_TOKENS, TURN_TOOL_CALLS, CONVERSATION_TOOL_CALLS,
+    TOOL_CALLS, SPAN_ERRORS, BOOKING_REJECTIONS, CACHE_LOOKUPS, ADMISSION_WAIT_SECONDS,
+    RATE_LIMITED, BOOKING_JOBS, FAST_PATH, SLOT_HOLDS,
+)
+
+
+# ------------- Spans -------------
+
+_NOOP: ContextManager[None] = contextlib.nullcontext()
+_tracer = None
+
+if OTEL_TRACING_ENABLED:
+    try:
+        from opentelemetry import trace
+    except ImportError as e:
+        raise ValueError(
+            "OTEL_TRACING_ENABLED is set but the 'opentelemetry-api' package is not installed. "
+            "Install it with: pip install opentelemetry-api opentelemetry-sdk"
+        ) from e
+    _tracer = trace.get_tracer("meeting-booker")
+
+
+class _Span:
+    __slots__ = ("name", "attributes", "started", "otel")
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]]):
+        self.name = name
+        self.attributes = attributes
+        self.otel = None
+
+    def __enter__(self) -> "_Span":
+        if _tracer is not None:
+            self.otel = _tracer.start_as_current_span(self.name, attributes=self.attributes)
+            self.otel.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        SPAN_SECONDS.observe(time.perf_counter() - self.started, self.name)
+        if exc_type is not None:
+            SPAN_ERRORS.inc(self.name)
+        if self.otel is not None:
+            self.otel.__exit__(exc_type, exc, tb)
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None) -> ContextManager[Any]:
+    """Time a block as `name` (e.g. "llm_call", "tool.create_meeting")."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(name, attributes)
+
+
+# ------------- Turns -------------
+
+_conversations: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+_conversations_lock = threading.Lock()
+
+
+def _tally_conversation(conversation_id: str, tool_calls: int) -> None:
+    """Running tool-call count per conversation; observed once it goes idle."""
+    now = time.time()
+    with _conversations_lock:
+        _, count = _conversations.pop(conversation_id, (now, 0))
+        _conversations[conversation_id] = (now, count + tool_calls)
+        while _conversations:
+            oldest, (seen, total) = next(iter(_conversations.items()))
+            if now - seen < _CONVERSATION_IDLE_SECONDS:
+                break
+            del _conversations[oldest]
+            CONVERSATION_TOOL_CALLS.observe(total)
+
+
+def record_turn(
+    conversation_id: str,
+    path: str,
+    transport: str,
+    seconds: float,
+    new_messages: Sequence[Any] = (),
+    history_tokens: Optional[Dict[str, int]] = None,
+) -> None:
+    """
+    Record one finished turn: latency, tokens and tool calls of its new
+    messages, and the {"full", "sent"} history token estimate of prepare_turn.
+    """
+    if not METRICS_ENABLED:
+        return
+    TURN_SECONDS.observe(seconds, path, transport)
+    for kind, tokens in (history_tokens or {}).items():
+        PROMPT_HISTORY_TOKENS.observe(tokens, kind)
+    input_tokens = output_tokens = cached_tokens = tool_calls = 0
+    for msg in new_messages:
+        # Duck-typed (msg.type == "ai"), so this module doesn't import LangChain
+        if getattr(msg, "type", None) == "ai":
+            usage = msg.usage_metadata or {}
+            input_tokens += usage.get("input_tokens", 0)
+            output_tokens += usage.get("output_tokens", 0)
+            cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0)
+            tool_calls += len(msg.tool_calls)
+    if input_tokens or output_tokens:
+        TURN_TOKENS.observe(input_tokens, "input")
+        TURN_TOKENS.observe(output_tokens, "output")
+        TURN_TOKENS.observe(cached_tokens, "cached")
+    TURN_TOOL_CALLS.observe(tool_calls)
+    _tally_conversation(conversation_id, tool_calls)
+
+
+def record_rejection(reason: str) -> None:
+    if METRICS_ENABLED:
+        BOOKING_REJECTIONS.inc(reason)
+
+
+def record_cache(result: str) -> None:
+    if METRICS_ENABLED:
+        CACHE_LOOKUPS.inc(result)
+
+
+def record_admission(seconds: float, priority: str, outcome: str) -> None:
+    if METRICS_ENABLED:
+        ADMISSION_WAIT_SECONDS.observe(seconds, priority, outcome)
+
+
+def record_rate_limited(bucket: str) -> None:
+    if METRICS_ENABLED:
+        RATE_LIMITED.inc(bucket)
+
+
+def record_job(kind: str, outcome: str) -> None:
+    if METRICS_ENABLED:
+        BOOKING_JOBS.inc(kind, outcome)
+
+
+def record_fast_path(outcome: str, reason: str) -> None:
+    if METRICS_ENABLED:
+        FAST_PATH.inc(outcome, reason)
+
+
+def record_hold(outcome: str, n: int = 1) -> None:
+    if METRICS_ENABLED:
+        SLOT_HOLDS.inc(outcome, amount=n)
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
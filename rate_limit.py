@@ -0,0 +1,198 @@
+"""
+Per-visitor rate limits for the chat endpoints (token buckets).
+
+Each chat request takes one token from the bucket of its client IP and one
+from the bucket of its browser session. Buckets refill continuously
+(RATE_LIMIT_IP_PER_MINUTE / RATE_LIMIT_SESSION_PER_MINUTE) up to their
+burst size; a request finding a bucket empty is refused with 429 and a
+Retry-After of the time until the next token. The IP bucket is what stops
+a bot that drops its session cookie (a fresh session every request); the
+session bucket keeps one visitor behind a shared office IP from using up
+everyone's allowance.
+
+Where the buckets live is chosen by RATE_LIMIT_STORE, like the
+conversation store:
+
+- memory://              per process, bounded (least recently used dropped);
+                         each worker enforces the limits on its own
+- redis://host:port/db   shared by all workers (needs the `redis` package);
+                         one atomic script call per bucket
+
+If the shared store fails, requests are let through: the limiter protects
+the Gemini quota, it must not take the chat down with it.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import metrics
+from config import (
+    RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_IP_PER_MINUTE,
+    RATE_LIMIT_SESSION_BURST,
+    RATE_LIMIT_SESSION_PER_MINUTE,
+    RATE_LIMIT_STORE,
+    TRUSTED_PROXY_COUNT,
+)
+
+# Buckets held by the in-memory backend
+_MAX_BUCKETS = 100_000
+
+
+class MemoryBuckets:
+    """Token buckets in a dict; least recently used dropped beyond `max_buckets`."""
+
+    shared = False
+
+    def __init__(self, max_buckets: int = _MAX_BUCKETS):
+        self._max_buckets = max_buckets
+        self._lock = threading.Lock()
+        # key -> (tokens, monotonic time of the last update)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take one token from bucket `key` (refilling at `rate` tokens per
+        second, holding at most `burst`). Returns 0.0 if there was one, else
+        the seconds until there will be.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self._max_buckets:
+                # A dropped bucket comes back full, which only errs on the lenient side
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# Same arithmetic as MemoryBuckets.take, run atomically on the server. Returns
+# the wait as a string (Lua numbers come back truncated to integers).
+_TAKE_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens, updated = tonumber(state[1]), tonumber(state[2])
+if tokens == nil then
+  tokens, updated = burst, now
+end
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """
+    Token buckets shared through Redis. `client` needs redis-py's
+    register_script; each bucket is a hash that expires once it would be
+    full again.
+    """
+
+    shared = True
+
+    def __init__(self, client: Any, prefix: str = "ratelimit:"):
+        self._take = client.register_script(_TAKE_SCRIPT)
+        self._prefix = prefix
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        result = self._take(keys=[self._prefix + key], args=[rate, burst, time.time()])
+        return float(result.decode() if isinstance(result, bytes) else result)
+
+
+def create_buckets(url: str):
+    """Bucket backend for a RATE_LIMIT_STORE URL."""
+    if url.startswith("memory://"):
+        return MemoryBuckets()
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError(
+                "RATE_LIMIT_STORE uses Redis but the 'redis' package is not installed. "
+                "Install it with: pip install redis"
+            ) from e
+        return RedisBuckets(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported RATE_LIMIT_STORE URL: {url!r}")
+
+
+class RateLimiter:
+    """The IP and session limits of the chat endpoints over one bucket backend."""
+
+    def __init__(
+        self,
+        buckets,
+        session_per_minute: float = RATE_LIMIT_SESSION_PER_MINUTE,
+        session_burst: int = RATE_LIMIT_SESSION_BURST,
+        ip_per_minute: float = RATE_LIMIT_IP_PER_MINUTE,
+        ip_burst: int = RATE_LIMIT_IP_BURST,
+    ):
+        self.buckets = buckets
+        self._limits = (
+            ("ip", ip_per_minute / 60, max(1, ip_burst)),
+            ("session", session_per_minute / 60, max(1, session_burst)),
+        )
+
+    def check(self, session_id: Optional[str], client_ip: Optional[str]) -> float:
+        """
+        Take a token for this request. Returns 0.0 if it may go ahead, else
+        the seconds the visitor should wait (the Retry-After).
+        """
+        keys = {"ip": client_ip, "session": session_id}
+        for name, rate, burst in self._limits:
+            key = keys[name]
+            if not key or rate <= 0:
+                continue
+            try:
+                wait = self.buckets.take(f"{name}:{key}", rate, burst)
+            except Exception as e:
+                print(f"Rate limiter unavailable, letting the request through: {e}")
+                return 0.0
+            if wait > 0:
+                metrics.record_rate_limited(name)
+                return wait
+        return 0.0
+
+
+def client_ip(remote_addr: Optional[str], forwarded_for: Optional[str]) -> Optional[str]:
+    """
+    Client IP of a request: the socket address, or with TRUSTED_PROXY_COUNT
+    proxies in front, the X-Forwarded-For entry added by the outermost one.
+    Entries further left are set by the client and can't be trusted.
+    """
+    if TRUSTED_PROXY_COUNT <= 0 or not forwarded_for:
+        return remote_addr
+    hops = [h.strip() for h in forwarded_for.split(",") if h.strip()]
+    if not hops:
+        return remote_addr
+    return hops[-min(TRUSTED_PROXY_COUNT, len(hops))]
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """Process-wide limiter over the RATE_LIMIT_STORE backend."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(create_buckets(RATE_LIMIT_STORE))
+    return _limiter
@@ -0,0 +1,303 @@
+"""
+Shared resilience layer for upstream calls (Google Calendar and Gemini).
+
+`call(upstream, name, fn, deadline)` runs `fn` with:
+- jittered exponential retry on transient failures (429, 5xx, timeouts,
+  connection errors),
+- a deadline for the whole call, retries included,
+- a per-upstream circuit breaker that fails fast with UpstreamUnavailable
+  after repeated transient failures, and lets one probe through after
+  CIRCUIT_RESET_SECONDS,
+- optionally (idempotent reads only) a hedged second attempt once the first
+  has been running longer than that call's observed p95 latency.
+
+Calendar attempts run on a small worker pool so a hung socket can't hold a
+request past its deadline; each pool thread uses its own Calendar service,
+so `fn` should fetch the service itself (calendar_service.get_service()).
+Attempts run in a copy of the caller's context, so the current tenant and
+conversation (context variables) carry over to the pool thread.
+Gemini calls go through agent_middleware.ResilienceMiddleware.
+"""
+
+from __future__ import annotations
+
+import collections
+import contextvars
+import random
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+import metrics
+from config import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    HEDGE_ENABLED,
+    UPSTREAM_CONCURRENCY,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_RETRY_BASE_SECONDS,
+)
+
+T = TypeVar("T")
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "backendError"}
+# Upper bound on a single backoff sleep (seconds)
+_MAX_BACKOFF = 8.0
+# Observed latencies needed before hedging kicks in
+_HEDGE_MIN_SAMPLES = 20
+_LATENCY_WINDOW = 200
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream is failing (circuit open, retries exhausted or deadline hit)."""
+
+    def __init__(self, upstream: str, message: str):
+        super().__init__(f"{upstream}: {message}")
+        self.upstream = upstream
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    pass
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+# ------------- Classification -------------
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    """HTTP-ish status of an exception or anything in its cause chain."""
+    seen = 0
+    while exc is not None and seen < 5:
+        resp = getattr(exc, "resp", None)  # googleapiclient HttpError
+        if resp is not None and getattr(resp, "status", None):
+            return int(resp.status)
+        for attr in ("code", "status_code"):  # google-genai APIError, others
+            value = getattr(exc, attr, None)
+            if isinstance(value, int):
+                return value
+        exc = exc.__cause__ or exc.__context__
+        seen += 1
+    return None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Worth retrying: rate limits, server errors, timeouts, dropped connections."""
+    if isinstance(exc, (TimeoutError, socket.timeout, ConnectionError, DeadlineExceeded)):
+        return True
+    status = _status_of(exc)
+    if status in _RETRYABLE_STATUS:
+        return True
+    if status == 403:
+        # Calendar reports quota errors as 403 with a reason
+        return any(reason in str(exc) for reason in _RETRYABLE_REASONS)
+    return False
+
+
+def backoff_delay(attempt: int, base: float = UPSTREAM_RETRY_BASE_SECONDS) -> float:
+    """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+    return random.uniform(0, min(_MAX_BACKOFF, base * (2 ** attempt)))
+
+
+# ------------- Circuit breaker -------------
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: closed -> open after `failure_threshold`
+    transient failures in a row; after `reset_seconds` one probe call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.name = name
+        self._threshold = failure_threshold
+        self._reset = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.fast_failures = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self._reset else "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at >= self._reset and not self._probing:
+                self._probing = True
+                return
+            self.fast_failures += 1
+        raise CircuitOpen(self.name, "circuit open, failing fast")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self._threshold:
+                if self._opened_at is None or self._probing:
+                    print(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if upstream not in _breakers:
+            _breakers[upstream] = CircuitBreaker(upstream)
+        return _breakers[upstream]
+
+
+# ------------- Latency tracking -------------
+
+_latencies: Dict[str, Deque[float]] = collections.defaultdict(
+    lambda: collections.deque(maxlen=_LATENCY_WINDOW)
+)
+_latencies_lock = threading.Lock()
+_counters: Dict[str, int] = collections.Counter()
+
+
+def count(key: str) -> None:
+    """Add one to the `stats()` counter `key` (e.g. "gemini.retries")."""
+    with _latencies_lock:
+        _counters[key] += 1
+
+
+def _observe(name: str, seconds: float) -> None:
+    with _latencies_lock:
+        _latencies[name].append(seconds)
+
+
+def p95(name: str) -> Optional[float]:
+    """p95 latency of recent successful attempts, once enough are recorded."""
+    with _latencies_lock:
+        samples = sorted(_latencies[name])
+    if len(samples) < _HEDGE_MIN_SAMPLES:
+        return None
+    return samples[int(0.95 * (len(samples) - 1))]
+
+
+def stats() -> Dict[str, Any]:
+    """Retry/hedge counters and breaker states."""
+    with _breakers_lock:
+        breakers = {
+            name: {"state": b.state, "fast_failures": b.fast_failures}
+            for name, b in _breakers.items()
+        }
+    with _latencies_lock:
+        counters = dict(_counters)
+    return {"counters": counters, "breakers": breakers}
+
+
+# ------------- Calls -------------
+
+# Room for hedges and for attempts abandoned at their deadline (those run
+# on until the socket timeout)
+_pool = ThreadPoolExecutor(max_workers=UPSTREAM_CONCURRENCY * 2, thread_name_prefix="upstream")
+
+
+def _submit(fn: Callable[[], T]):
+    # A fresh copy per submit: a context can't be entered by two threads at once
+    return _pool.submit(contextvars.copy_context().run, fn)
+
+
+def _attempt(name: str, fn: Callable[[], T], timeout: float, hedge: bool) -> T:
+    """One attempt on the pool, plus a hedged duplicate if it runs past p95."""
+    started = time.monotonic()
+    futures = [_submit(fn)]
+    hedge_after = p95(name) if hedge else None
+    pending = set(futures)
+    while pending:
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        wait_for = remaining
+        if hedge_after is not None and len(futures) == 1:
+            wait_for = min(remaining, max(hedge_after - (time.monotonic() - started), 0))
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                _observe(name, time.monotonic() - started)
+                if future is not futures[0]:
+                    count(f"{name}.hedge_wins")
+                return future.result()
+        if done and not pending:
+            raise next(iter(done)).exception()
+        if not done and hedge_after is not None and len(futures) == 1:
+            count(f"{name}.hedges")
+            futures.append(_submit(fn))
+            pending.add(futures[-1])
+    raise DeadlineExceeded(name, f"no response within {timeout:.1f}s")
+
+
+def call(
+    upstream: str,
+    name: str,
+    fn: Callable[[], T],
+    deadline: float,
+    retries: int = UPSTREAM_MAX_RETRIES,
+    hedge: bool = False,
+) -> T:
+    """
+    Run `fn()` against `upstream` (breaker key, e.g. "calendar") with retries
+    and a `deadline` in seconds for the whole call. `name` labels latency
+    and counters (e.g. "calendar.events.list"). Only pass hedge=True for
+    idempotent reads.
+    """
+    with metrics.span(name):
+        return _call(upstream, name, fn, deadline, retries, hedge and HEDGE_ENABLED)
+
+
+def _call(
+    upstream: str, name: str, fn: Callable[[], T], deadline: float, retries: int, hedge: bool
+) -> T:
+    breaker = get_breaker(upstream)
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            result = _attempt(name, fn, give_up_at - time.monotonic(), hedge)
+        except Exception as e:
+            if not is_transient(e):
+                # The upstream answered (e.g. 404/409); it's healthy
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            delay = backoff_delay(attempt)
+            if attempt >= retries or time.monotonic() + delay >= give_up_at:
+                count(f"{name}.failures")
+                if isinstance(e, UpstreamUnavailable):
+                    raise
+                raise UpstreamUnavailable(upstream, f"{name} failed: {e}") from e
+            count(f"{name}.retries")
+            attempt += 1
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
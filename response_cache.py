@@ -0,0 +1,395 @@
+"""
+Response cache for repeated opening questions.
+
+Widget visitors often open with the same few questions ("what slots do you
+have this week?", "how long is the intro call?"). The reply to a
+conversation's first message is cached and reused for the same question,
+or a close rewording of it, instead of running the agent again.
+
+- Lookup: exact match on the normalized message, then the most similar
+  cached question by embedding cosine similarity (>= RESPONSE_CACHE_SIMILARITY).
+  Dates, times, weekdays, numbers and action words (book, cancel, ...)
+  must match exactly, so "this week" never answers "next week".
+- Scope: entries belong to one business day, and replies that read the
+  calendar also to one availability-index version. A change to the busy
+  data (a booking, or a calendar change picked up by a sync) drops the
+  calendar replies; a new day empties the cache. Bookings also drop them
+  explicitly, which covers AVAILABILITY_BACKEND=freebusy. Replies that used
+  no tool (FAQ answers) survive bookings.
+- Eviction: RESPONSE_CACHE_TTL_SECONDS, then least recently used beyond
+  RESPONSE_CACHE_MAX_ENTRIES.
+- Only replies from turns that made no booking and offered no slots are
+  stored (see `cacheable`): offered slots are held for the conversation
+  they were offered to, so they must not be shown to another visitor.
+- Each tenant has its own cache (see tenants.TenantLRU); the embedding
+  model is shared.
+
+Embeddings are the local, deterministic HashingEmbedding by default, or a
+Gemini embedding model (RESPONSE_CACHE_EMBEDDINGS=models/text-embedding-004).
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import math
+import operator
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from dateutil import tz as dateutil_tz
+from langchain_core.messages import AIMessage, BaseMessage
+
+import metrics
+import resilience
+from config import (
+    AVAILABILITY_BACKEND,
+    GOOGLE_API_KEY,
+    LLM_CALL_DEADLINE_SECONDS,
+    RESPONSE_CACHE_EMBEDDINGS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_TTL_SECONDS,
+)
+from tenants import Tenant, TenantLRU, current
+
+Vector = Sequence[float]
+Embedding = Callable[[str], Vector]
+
+# Tools that only read the calendar; a turn that used any other tool isn't
+# cached (find_free_slots holds the slots it offers for the conversation)
+_READ_ONLY_TOOLS = {"check_availability"}
+
+_WORD_RE = re.compile(r"[a-z0-9@._+-]+")
+# Dropped before matching: greetings and politeness don't change the answer
+_FILLER = {
+    "hi", "hello", "hey", "please", "pls", "kindly", "thanks", "thank", "ok", "okay",
+    "so", "um", "uh", "there",
+}
+# Same meaning for this widget's questions
+_SYNONYMS = {
+    "slot": "slots", "times": "slots", "openings": "slots", "opening": "slots",
+    "available": "free", "availability": "free", "open": "free",
+    "meeting": "call", "meetings": "call", "calls": "call", "chat": "call",
+    "length": "long", "duration": "long", "introductory": "intro", "first": "intro",
+}
+# Left out of the embedding; question phrasing rather than content
+_STOPWORDS = {
+    "a", "an", "the", "what", "which", "when", "how", "do", "does", "is", "are", "can",
+    "could", "would", "will", "i", "we", "you", "your", "me", "my", "of", "to", "for",
+    "in", "on", "at", "any", "have", "has", "be", "there", "like", "want", "some", "it",
+}
+# Words (besides anything containing a digit) that must match exactly
+_EXACT = {
+    "book", "cancel", "reschedule", "move", "change", "delete", "not", "no",
+    "today", "tonight", "tomorrow", "yesterday", "this", "next", "last", "week", "weekend",
+    "month", "morning", "afternoon", "evening", "am", "pm", "monday", "tuesday",
+    "wednesday", "thursday", "friday", "saturday", "sunday", "mon", "tue", "tues", "wed",
+    "thu", "thur", "thurs", "fri", "sat", "sun", "january", "february", "march", "april",
+    "may", "june", "july", "august", "september", "october", "november", "december", "jan",
+    "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec", "hour",
+    "hours", "minute", "minutes", "min", "mins",
+}
+# Normalized-text -> vector memo, so a miss followed by a store embeds once
+_VECTOR_MEMO_SIZE = 256
+
+
+def normalize(message: str) -> str:
+    """Lowercased words, no punctuation or filler, synonyms folded ("Hi! Available today?" -> "free today")."""
+    words = (w.strip(".-") for w in _WORD_RE.findall(message.lower()))
+    return " ".join(_SYNONYMS.get(w, w) for w in words if w and w not in _FILLER)
+
+
+def _guard(normalized: str) -> FrozenSet[str]:
+    """Words a similar question must share exactly: dates, times, numbers, actions, emails."""
+    return frozenset(
+        w for w in normalized.split()
+        if w in _EXACT or "@" in w or any(c.isdigit() for c in w)
+    )
+
+
+def _tool_names(new_messages: Sequence[BaseMessage]) -> List[str]:
+    return [
+        call["name"] for msg in new_messages if isinstance(msg, AIMessage) for call in msg.tool_calls
+    ]
+
+
+def cacheable(new_messages: Sequence[BaseMessage]) -> bool:
+    """True if the turn only read the calendar (no booking, held slots or other side effect)."""
+    return all(name in _READ_ONLY_TOOLS for name in _tool_names(new_messages))
+
+
+def reads_calendar(new_messages: Sequence[BaseMessage]) -> bool:
+    """True if the reply depends on calendar data (the turn called a tool)."""
+    return bool(_tool_names(new_messages))
+
+
+# ------------- Embeddings -------------
+
+
+class HashingEmbedding:
+    """
+    Deterministic bag-of-features embedding of the content words (stopwords
+    dropped): unigrams and bigrams plus character trigrams, feature-hashed
+    into `dim` signed buckets and L2-normalized. No model or network needed;
+    good at rewordings that share most content words ("which slots are free
+    this week" / "what free slots do you have this week").
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, (1.0 if value >> 63 else -1.0)
+
+    def __call__(self, text: str) -> Vector:
+        words = [w for w in text.split() if w not in _STOPWORDS] or text.split()
+        features: List[Tuple[str, float]] = [(f"w:{w}", 1.0) for w in words]
+        features += [(f"b:{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+        for w in words:
+            padded = f"<{w}>"
+            features += [(f"c:{padded[i:i + 3]}", 0.5) for i in range(len(padded) - 2)]
+        vector = [0.0] * self.dim
+        for feature, weight in features:
+            i, sign = self._bucket(feature)
+            vector[i] += sign * weight
+        return _unit(vector)
+
+
+class GeminiEmbedding:
+    """Gemini embedding model behind the "gemini" circuit breaker."""
+
+    def __init__(self, model: str):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        self._client = GoogleGenerativeAIEmbeddings(model=model, google_api_key=GOOGLE_API_KEY)
+
+    def __call__(self, text: str) -> Vector:
+        vector = resilience.call(
+            "gemini",
+            "gemini.embed",
+            lambda: self._client.embed_query(text),
+            deadline=LLM_CALL_DEADLINE_SECONDS,
+        )
+        return _unit(vector)
+
+
+def _unit(vector: List[float]) -> Vector:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return tuple(x / norm for x in vector) if norm else tuple(vector)
+
+
+def _cosine(a: Vector, b: Vector) -> float:
+    # Both are unit vectors
+    return sum(map(operator.mul, a, b))
+
+
+# ------------- Cache -------------
+
+
+class _Entry:
+    __slots__ = ("reply", "vector", "guard", "expires_at", "uses_calendar")
+
+    def __init__(
+        self, reply: str, vector: Vector, guard: FrozenSet[str], expires_at: float, uses_calendar: bool
+    ):
+        self.reply = reply
+        self.vector = vector
+        self.guard = guard
+        self.expires_at = expires_at
+        self.uses_calendar = uses_calendar
+
+
+def _tenant_scope(tenant: Tenant) -> Tuple[int, str]:
+    """(availability-index version, business date) the tenant's cached replies belong to."""
+    version = 0
+    if AVAILABILITY_BACKEND == "index":
+        from availability import get_index
+
+        index = get_index(tenant)
+        # Picks up calendar changes made elsewhere (bumps the version)
+        index.ensure_fresh()
+        version = index.version
+    today = datetime.datetime.now(dateutil_tz.gettz(tenant.timezone)).date().isoformat()
+    return version, today
+
+
+class ResponseCache:
+    """
+    Reply cache keyed on the normalized question; see the module docstring.
+
+    `scope` returns the current (index version, day), by default the current
+    tenant's; pass one returning a fixed pair to use the cache without a
+    calendar.
+    """
+
+    def __init__(
+        self,
+        embedding: Embedding,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        scope: Optional[Callable[[], Tuple[Any, str]]] = None,
+    ):
+        self._embed = embedding
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._similarity = similarity
+        self._scope_fn = scope or (lambda: _tenant_scope(current()))
+        self._scope: Optional[Tuple[Any, str]] = None
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._vectors: "OrderedDict[str, Vector]" = OrderedDict()
+        self._counters = {
+            "lookups": 0, "exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0,
+            "invalidations": 0, "evictions": 0, "errors": 0,
+        }
+
+    def _vector(self, key: str) -> Vector:
+        with self._lock:
+            vector = self._vectors.get(key)
+        if vector is None:
+            vector = self._embed(key)
+            with self._lock:
+                self._vectors[key] = vector
+                while len(self._vectors) > _VECTOR_MEMO_SIZE:
+                    self._vectors.popitem(last=False)
+        return vector
+
+    def _enter_scope_locked(self, scope: Tuple[Any, str]) -> None:
+        if scope == self._scope:
+            return
+        # Same day: only calendar-derived replies are out of date
+        same_day = self._scope is not None and self._scope[1] == scope[1]
+        self._drop_locked(calendar_only=same_day)
+        self._scope = scope
+
+    def _drop_locked(self, calendar_only: bool) -> None:
+        stale = [k for k, e in self._entries.items() if e.uses_calendar or not calendar_only]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self._counters["invalidations"] += 1
+
+    def _count(self, result: str) -> None:
+        with self._lock:
+            self._counters[result] += 1
+        metrics.record_cache(result)
+
+    def lookup(self, message: str) -> Optional[str]:
+        """Cached reply for `message` (or a close rewording), else None."""
+        key = normalize(message)
+        if not key:
+            return None
+        try:
+            scope = self._scope_fn()
+            now = time.time()
+            with self._lock:
+                self._counters["lookups"] += 1
+                self._enter_scope_locked(scope)
+                entry = self._entries.get(key)
+                if entry is not None and entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    reply = entry.reply
+                else:
+                    reply = None
+                    has_candidates = bool(self._entries)
+            if reply is not None:
+                self._count("exact_hits")
+                return reply
+            if has_candidates:
+                reply = self._similar(key, now)
+        except Exception as e:
+            print(f"Response cache lookup failed: {e}")
+            self._count("errors")
+            return None
+        self._count("similar_hits" if reply is not None else "misses")
+        return reply
+
+    def _similar(self, key: str, now: float) -> Optional[str]:
+        vector, guard = self._vector(key), _guard(key)
+        best_key, best = None, self._similarity
+        with self._lock:
+            for other, entry in self._entries.items():
+                if entry.guard != guard or entry.expires_at <= now:
+                    continue
+                score = _cosine(vector, entry.vector)
+                if score >= best:
+                    best_key, best = other, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key].reply
+
+    def store(self, message: str, reply: str, uses_calendar: bool = True) -> None:
+        """Cache `reply`; `uses_calendar` replies are dropped when the calendar changes."""
+        key = normalize(message)
+        if not key or not reply:
+            return
+        try:
+            scope = self._scope_fn()
+            vector = self._vector(key)
+        except Exception as e:
+            print(f"Response cache store failed: {e}")
+            return
+        with self._lock:
+            self._enter_scope_locked(scope)
+            self._entries[key] = _Entry(
+                reply, vector, _guard(key), time.time() + self._ttl, uses_calendar
+            )
+            self._entries.move_to_end(key)
+            self._counters["stores"] += 1
+            now = time.time()
+            # Expired entries first, then the least recently used
+            for stale in [k for k, e in self._entries.items() if e.expires_at <= now]:
+                del self._entries[stale]
+                self._counters["evictions"] += 1
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self) -> None:
+        """Drop replies derived from the calendar (a booking was made or the calendar changed)."""
+        with self._lock:
+            self._drop_locked(calendar_only=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters, entries=len(self._entries))
+        hits = stats["exact_hits"] + stats["similar_hits"]
+        stats["hit_rate"] = round(hits / stats["lookups"], 3) if stats["lookups"] else 0.0
+        return stats
+
+
+def _build_embedding() -> Embedding:
+    if RESPONSE_CACHE_EMBEDDINGS == "hashing":
+        return HashingEmbedding()
+    return GeminiEmbedding(RESPONSE_CACHE_EMBEDDINGS)
+
+
+_embedding: Optional[Embedding] = None
+_embedding_lock = threading.Lock()
+
+
+def _shared_embedding() -> Embedding:
+    global _embedding
+    if _embedding is None:
+        with _embedding_lock:
+            if _embedding is None:
+                _embedding = _build_embedding()
+    return _embedding
+
+
+_caches: TenantLRU[ResponseCache] = TenantLRU(
+    lambda tenant: ResponseCache(_shared_embedding(), scope=lambda: _tenant_scope(tenant))
+)
+
+
+def get_cache(tenant: Optional[Tenant] = None) -> ResponseCache:
+    """Response cache of `tenant` (default: the current tenant), created on first use."""
+    return _caches.get(tenant)
@@ -0,0 +1,177 @@
+"""
+Deterministic free-slot computation.
+
+Given busy intervals (epoch seconds) and a date range, `find_free_slots`
+walks the working-hours window of each day and the sorted busy list in a
+single merge-sweep, so the cost is linear in days + busy intervals.
+"""
+
+from __future__ import annotations
+
+import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dateutil import tz as dateutil_tz
+
+from config import (
+    MEETING_BUFFER_MINUTES,
+    SLOT_STEP_MINUTES,
+    WORKING_DAYS,
+    WORKING_HOURS_END,
+    WORKING_HOURS_START,
+)
+from tenants import current
+
+Interval = Tuple[float, float]
+
+
+def _parse_hhmm(value: str) -> datetime.time:
+    hours, minutes = value.split(":")
+    return datetime.time(int(hours), int(minutes))
+
+
+def merge_intervals(busy: Iterable[Interval], buffer_seconds: float = 0) -> List[Interval]:
+    """Sort, pad by `buffer_seconds` on both sides and merge overlapping intervals."""
+    merged: List[Interval] = []
+    for start, end in sorted(busy):
+        start -= buffer_seconds
+        end += buffer_seconds
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def working_windows(
+    range_start: float,
+    range_end: float,
+    timezone: Optional[str] = None,
+    work_start: str = WORKING_HOURS_START,
+    work_end: str = WORKING_HOURS_END,
+    workdays: Sequence[int] = WORKING_DAYS,
+) -> List[Interval]:
+    """
+    Working-hours windows (epoch seconds) that fall inside the range, in
+    `timezone` (default: the current tenant's).
+    """
+    zone = dateutil_tz.gettz(timezone or current().timezone) or datetime.timezone.utc
+    open_at, close_at = _parse_hhmm(work_start), _parse_hhmm(work_end)
+
+    windows: List[Interval] = []
+    day = datetime.datetime.fromtimestamp(range_start, zone).date()
+    last_day = datetime.datetime.fromtimestamp(range_end, zone).date()
+    while day <= last_day:
+        if day.weekday() in workdays:
+            lo = datetime.datetime.combine(day, open_at, zone).timestamp()
+            hi = datetime.datetime.combine(day, close_at, zone).timestamp()
+            lo, hi = max(lo, range_start), min(hi, range_end)
+            if hi > lo:
+                windows.append((lo, hi))
+        day += datetime.timedelta(days=1)
+    return windows
+
+
+def find_free_slots(
+    busy: Iterable[Interval],
+    range_start: float,
+    range_end: float,
+    duration_minutes: int = 30,
+    max_slots: int = 5,
+    max_per_day: int = 3,
+    buffer_minutes: int = MEETING_BUFFER_MINUTES,
+    step_minutes: int = SLOT_STEP_MINUTES,
+    timezone: Optional[str] = None,
+    work_start: str = WORKING_HOURS_START,
+    work_end: str = WORKING_HOURS_END,
+    workdays: Sequence[int] = WORKING_DAYS,
+) -> List[Interval]:
+    """
+    Return up to `max_slots` free (start, end) slots, earliest first.
+
+    - busy: busy intervals in epoch seconds, in any order
+    - duration_minutes: length of the meeting
+    - max_per_day: cap per day so the offer spans several days
+    - buffer_minutes: free time required before and after every busy block
+    - step_minutes: slot starts are aligned to this grid (e.g. :00 and :30)
+    - timezone: of the working hours (default: the current tenant's)
+    """
+    timezone = timezone or current().timezone
+    duration = duration_minutes * 60
+    step = step_minutes * 60
+    merged = merge_intervals(busy, buffer_minutes * 60)
+    windows = working_windows(range_start, range_end, timezone, work_start, work_end, workdays)
+
+    zone = dateutil_tz.gettz(timezone) or datetime.timezone.utc
+
+    slots: List[Interval] = []
+    i = 0  # sweep pointer into merged busy intervals
+    for lo, hi in windows:
+        per_day = 0
+        # Skip busy blocks that end before this window opens
+        while i < len(merged) and merged[i][1] <= lo:
+            i += 1
+        # Slot grid is anchored at local midnight (e.g. :00 and :30)
+        offset = datetime.datetime.fromtimestamp(lo, zone).utcoffset().total_seconds()
+        cursor = lo
+        j = i
+        while cursor + duration <= hi and per_day < max_per_day:
+            misalignment = (cursor + offset) % step
+            if misalignment:
+                cursor += step - misalignment
+            if cursor + duration > hi:
+                break
+            if j < len(merged) and merged[j][0] < cursor + duration:
+                # Overlaps the next busy block: jump past it
+                cursor = max(cursor, merged[j][1])
+                j += 1
+                continue
+            slots.append((cursor, cursor + duration))
+            per_day += 1
+            if len(slots) >= max_slots:
+                return slots
+            cursor += duration
+    return slots
+
+
+def find_team_slots(
+    busy_by_calendar: Dict[str, Iterable[Interval]],
+    range_start: float,
+    range_end: float,
+    duration_minutes: int = 30,
+    max_slots: int = 5,
+    max_per_day: int = 3,
+    booking_calendar: Optional[str] = None,
+    **kwargs,
+) -> List[Tuple[float, float, List[str]]]:
+    """
+    Slots where at least one team calendar is free, earliest first, each
+    with the calendars that are free for it. With `booking_calendar` (one
+    of `busy_by_calendar`), only slots free in that calendar, where the
+    meeting would be booked. Keyword arguments are passed through to
+    `find_free_slots`.
+    """
+    free_for: Dict[Interval, List[str]] = {}
+    for cal_id, busy in busy_by_calendar.items():
+        # Each calendar's own earliest slots (under the same caps) contain
+        # every slot the combined, capped list can pick from it.
+        for slot in find_free_slots(
+            busy, range_start, range_end, duration_minutes, max_slots, max_per_day, **kwargs
+        ):
+            free_for.setdefault(slot, []).append(cal_id)
+
+    zone = dateutil_tz.gettz(kwargs.get("timezone") or current().timezone) or datetime.timezone.utc
+    slots: List[Tuple[float, float, List[str]]] = []
+    per_day: Dict[datetime.date, int] = {}
+    for start, end in sorted(free_for):
+        if booking_calendar is not None and booking_calendar not in free_for[(start, end)]:
+            continue
+        day = datetime.datetime.fromtimestamp(start, zone).date()
+        if per_day.get(day, 0) >= max_per_day:
+            continue
+        per_day[day] = per_day.get(day, 0) + 1
+        slots.append((start, end, free_for[(start, end)]))
+        if len(slots) >= max_slots:
+            break
+    return slots
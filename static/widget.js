@@ -5,10 +5,89 @@
  * <script src="https://YOUR-SERVER-DOMAIN/widget.js" async></script>
  *
  * Make sure CORS is enabled on the Flask app.
+ *
+ * Replies are streamed from `${API_URL}/stream` (Server-Sent Events) and fall
+ * back to the plain JSON endpoint if streaming is unavailable. When a booking
+ * is confirmed before its Meet link exists, the link is picked up from
+ * `${API_URL}/updates` (a long poll) and shown as it arrives.
+ *
+ * When one server hosts several calendars, pick yours with its tenant key:
+ * window.VAIDRIX_MEETING_BOT_TENANT = "acme";
  */
 
 (function () {
   const API_URL = (window.VAIDRIX_MEETING_BOT_API || "https://your-domain.com/api/chat");
+  const STREAM_URL = (window.VAIDRIX_MEETING_BOT_STREAM_API || API_URL + "/stream");
+  const UPDATES_URL = (window.VAIDRIX_MEETING_BOT_UPDATES_API || API_URL + "/updates");
+  // Long polls per booking before giving up (each waits up to 20s)
+  const MAX_UPDATE_POLLS = 10;
+  const TENANT = window.VAIDRIX_MEETING_BOT_TENANT || undefined;
+
+  /**
+   * POST a message to the streaming endpoint and dispatch SSE events
+   * (status, token, done, error) to handlers[event](data).
+   */
+  async function streamChat(text, handlers) {
+    const res = await fetch(STREAM_URL, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ message: text, tenant: TENANT }),
+    });
+    if (res.status === 429) {
+      // Rate limited: show the server's message rather than retrying without streaming
+      handlers.error(await res.json());
+      return;
+    }
+    if (!res.ok || !res.body) {
+      throw new Error("Streaming not available");
+    }
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const block = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = "message";
+        let data = "";
+        block.split("\n").forEach(function (line) {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        });
+        if (handlers[event]) handlers[event](data ? JSON.parse(data) : {});
+      }
+    }
+  }
+
+  /**
+   * Long-poll for booking follow-ups and call onUpdate(update) for each one
+   * not in `shown` (update ids), until none are pending.
+   */
+  async function watchUpdates(shown, onUpdate) {
+    for (let poll = 0; poll < MAX_UPDATE_POLLS; poll++) {
+      const params = new URLSearchParams({ seen: String(shown.size), wait: "20" });
+      if (TENANT) params.set("tenant", TENANT);
+      let data;
+      try {
+        const res = await fetch(UPDATES_URL + "?" + params.toString());
+        if (!res.ok) return;
+        data = await res.json();
+      } catch (err) {
+        console.error(err);
+        return;
+      }
+      (data.updates || []).forEach(function (update) {
+        if (shown.has(update.id)) return;
+        shown.add(update.id);
+        onUpdate(update);
+      });
+      if (!data.pending) return;
+    }
+  }
 
   function createWidget() {
     const container = document.createElement("div");
@@ -156,6 +235,12 @@
       div.innerText = text;
       bodyEl.appendChild(div);
       bodyEl.scrollTop = bodyEl.scrollHeight;
+      return div;
+    }
+
+    function setMessage(bodyEl, div, text) {
+      div.innerText = text;
+      bodyEl.scrollTop = bodyEl.scrollHeight;
     }
 
     function createChatWindow() {
@@ -183,6 +268,20 @@
       const inputEl = chatWindow.querySelector(".vdx-chat-input");
       const sendEl = chatWindow.querySelector(".vdx-chat-send");
 
+      // Booking updates already shown, and whether a long poll is running
+      const shownUpdates = new Set();
+      let watching = false;
+
+      function followUp(data) {
+        if (!data || !data.pending_updates || watching) return;
+        watching = true;
+        watchUpdates(shownUpdates, function (update) {
+          appendMessage(bodyEl, update.message, "bot");
+        }).finally(function () {
+          watching = false;
+        });
+      }
+
       appendMessage(bodyEl,
         "Hi! I can help you schedule a meeting with the Vaidrix team. " +
         "Tell me your preferred date/time and your email.",
@@ -198,17 +297,50 @@
         inputEl.focus();
         sendEl.disabled = true;
 
+        const botEl = appendMessage(bodyEl, "…", "bot");
+        let streamed = "";
+        let gotEvent = false;
         try {
-          const res = await fetch(API_URL, {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ message: text }),
+          await streamChat(text, {
+            status: function (data) {
+              gotEvent = true;
+              if (!streamed) setMessage(bodyEl, botEl, data.label || "Working…");
+            },
+            token: function (data) {
+              gotEvent = true;
+              streamed += data.text;
+              setMessage(bodyEl, botEl, streamed);
+            },
+            done: function (data) {
+              gotEvent = true;
+              setMessage(bodyEl, botEl, data.reply || streamed || "No reply.");
+              followUp(data);
+            },
+            error: function (data) {
+              gotEvent = true;
+              setMessage(bodyEl, botEl, data.reply || "Error talking to server. Please try again.");
+            },
           });
-          const data = await res.json();
-          appendMessage(bodyEl, data.reply || "No reply.", "bot");
-        } catch (err) {
-          console.error(err);
-          appendMessage(bodyEl, "Error talking to server. Please try again.", "bot");
+        } catch (streamErr) {
+          if (gotEvent) {
+            console.error(streamErr);
+            setMessage(bodyEl, botEl, "Error talking to server. Please try again.");
+          } else {
+            // Streaming unavailable: use the plain JSON endpoint
+            try {
+              const res = await fetch(API_URL, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ message: text, tenant: TENANT }),
+              });
+              const data = await res.json();
+              setMessage(bodyEl, botEl, data.reply || "No reply.");
+              followUp(data);
+            } catch (err) {
+              console.error(err);
+              setMessage(bodyEl, botEl, "Error talking to server. Please try again.");
+            }
+          }
         } finally {
           sendEl.disabled = false;
         }
@@ -0,0 +1,236 @@
+"""
+Tenants: many booking calendars served from one process.
+
+Each tenant has its own calendar, OAuth token file, timezone, default
+meeting title and extra prompt instructions. Tenants are listed in
+TENANTS_FILE:
+
+    {"tenants": [
+        {"key": "acme", "calendar_id": "bookings@acme.example",
+         "timezone": "Europe/Berlin", "company_name": "Acme",
+         "default_title": "Intro call with Acme", "prompt": "Calls are 30 minutes.",
+         "token_file": "credentials/tenants/acme.json",
+         "team_calendar_ids": ["alice@acme.example", "bob@acme.example"]}
+    ]}
+
+Only "key" and "calendar_id" are required; the rest default to the global
+settings (token_file to TENANT_TOKEN_DIR/<key>.json). Without TENANTS_FILE
+there is a single tenant, "default", built from GOOGLE_CALENDAR_ID,
+GOOGLE_OAUTH_TOKEN_FILE, DEFAULT_TIMEZONE and friends, so single-calendar
+setups work unchanged.
+
+The tenant of the current turn reaches calendar code and tools through a
+context variable set by chat_service (like bookings.current_conversation);
+outside a turn it is the default tenant. Per-tenant state (credentials and
+Calendar services, the busy index, the response cache, the agent) lives in
+TenantLRU maps: built on first use and dropped least recently used beyond
+TENANT_CACHE_SIZE, so memory stays bounded however many tenants are listed.
+The Gemini client and the parsed discovery document are shared by all
+tenants.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from config import (
+    CALENDAR_ID,
+    COMPANY_NAME,
+    DEFAULT_MEETING_TITLE,
+    DEFAULT_TIMEZONE,
+    GOOGLE_OAUTH_TOKEN_FILE,
+    TEAM_CALENDAR_IDS,
+    TENANT_CACHE_SIZE,
+    TENANT_TOKEN_DIR,
+    TENANTS_FILE,
+)
+
+T = TypeVar("T")
+
+# Key of the tenant built from the environment (and used when a request names none)
+DEFAULT_TENANT = "default"
+
+
+class UnknownTenant(KeyError):
+    """No tenant is registered under the requested key."""
+
+
+class Tenant:
+    """One booking calendar and how the assistant behaves for it."""
+
+    def __init__(
+        self,
+        key: str,
+        calendar_id: str,
+        token_file: Optional[str] = None,
+        timezone: str = DEFAULT_TIMEZONE,
+        company_name: str = COMPANY_NAME,
+        default_title: str = DEFAULT_MEETING_TITLE,
+        prompt: str = "",
+        team_calendar_ids: Optional[List[str]] = None,
+    ):
+        self.key = key
+        self.calendar_id = calendar_id
+        self.token_file = token_file or os.path.join(TENANT_TOKEN_DIR, f"{key}.json")
+        self.timezone = timezone
+        self.company_name = company_name
+        self.default_title = default_title
+        self.prompt = prompt
+        self.team_calendar_ids = list(team_calendar_ids or [calendar_id])
+
+    def conversation_id(self, session_id: str) -> str:
+        """
+        Conversation id of a browser session with this tenant. Namespaced, so
+        one session talking to two tenants keeps two separate histories.
+        """
+        return session_id if self.key == DEFAULT_TENANT else f"{self.key}:{session_id}"
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.key!r}, {self.calendar_id!r})"
+
+
+# ------------- Registry -------------
+
+
+def _from_environment() -> Tenant:
+    return Tenant(
+        DEFAULT_TENANT,
+        CALENDAR_ID,
+        token_file=GOOGLE_OAUTH_TOKEN_FILE,
+        team_calendar_ids=TEAM_CALENDAR_IDS,
+    )
+
+
+def _from_dict(entry: Dict[str, Any]) -> Tenant:
+    try:
+        key, calendar_id = str(entry["key"]), str(entry["calendar_id"])
+    except KeyError as e:
+        raise ValueError(f"Tenant entry in {TENANTS_FILE} is missing {e}") from e
+    return Tenant(
+        key,
+        calendar_id,
+        token_file=entry.get("token_file"),
+        timezone=entry.get("timezone", DEFAULT_TIMEZONE),
+        company_name=entry.get("company_name", COMPANY_NAME),
+        default_title=entry.get("default_title", DEFAULT_MEETING_TITLE),
+        prompt=entry.get("prompt", ""),
+        team_calendar_ids=entry.get("team_calendar_ids"),
+    )
+
+
+def load_tenants(path: Optional[str] = TENANTS_FILE) -> Dict[str, Tenant]:
+    """Tenants by key: the environment's tenant (if configured) plus those in `path`."""
+    tenants: Dict[str, Tenant] = {}
+    if CALENDAR_ID:
+        tenants[DEFAULT_TENANT] = _from_environment()
+    if path:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for entry in data.get("tenants", []):
+            tenant = _from_dict(entry)
+            tenants[tenant.key] = tenant
+    return tenants
+
+
+_tenants: Optional[Dict[str, Tenant]] = None
+_tenants_lock = threading.Lock()
+
+
+def get_tenants() -> Dict[str, Tenant]:
+    """All registered tenants, loaded on first use."""
+    global _tenants
+    if _tenants is None:
+        with _tenants_lock:
+            if _tenants is None:
+                _tenants = load_tenants()
+    return _tenants
+
+
+def get_tenant(key: Optional[str] = None) -> Tenant:
+    """Tenant registered under `key` (the default tenant when empty)."""
+    tenant = get_tenants().get(key or DEFAULT_TENANT)
+    if tenant is None:
+        raise UnknownTenant(key or DEFAULT_TENANT)
+    return tenant
+
+
+# ------------- Current tenant -------------
+
+# Tenant the current turn belongs to (None outside a chat turn)
+current_tenant: contextvars.ContextVar[Optional[Tenant]] = contextvars.ContextVar(
+    "current_tenant", default=None
+)
+
+
+def current() -> Tenant:
+    """Tenant of the current turn, or the default tenant outside one."""
+    return current_tenant.get() or get_tenant()
+
+
+# ------------- Per-tenant state -------------
+
+
+class TenantLRU(Generic[T]):
+    """
+    Per-tenant objects built by `factory` on first use. Beyond `max_size`
+    the least recently used one is dropped (after `close(key, value)`, if
+    given) and rebuilt the next time its tenant is active.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[Tenant], T],
+        close: Optional[Callable[[str, T], None]] = None,
+        max_size: int = TENANT_CACHE_SIZE,
+    ):
+        self._factory = factory
+        self._close = close
+        self._max_size = max(1, max_size)
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, T]" = OrderedDict()
+        # Per-key build locks: one build per tenant, other tenants don't wait
+        self._building: Dict[str, threading.Lock] = {}
+        self._counters = {"builds": 0, "evictions": 0}
+
+    def get(self, tenant: Optional[Tenant] = None) -> T:
+        tenant = tenant or current()
+        with self._lock:
+            value = self._items.get(tenant.key)
+            if value is not None:
+                self._items.move_to_end(tenant.key)
+                return value
+            build_lock = self._building.setdefault(tenant.key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                value = self._items.get(tenant.key)
+                if value is not None:
+                    # Built by the thread we waited for
+                    return value
+            value = self._factory(tenant)
+            evicted: List[Tuple[str, T]] = []
+            with self._lock:
+                self._items[tenant.key] = value
+                self._building.pop(tenant.key, None)
+                self._counters["builds"] += 1
+                while len(self._items) > self._max_size:
+                    evicted.append(self._items.popitem(last=False))
+                    self._counters["evictions"] += 1
+        if self._close is not None:
+            for key, item in evicted:
+                self._close(key, item)
+        return value
+
+    def peek(self, key: str) -> Optional[T]:
+        """The object held for tenant `key`, without building or touching it."""
+        with self._lock:
+            return self._items.get(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, size=len(self._items))
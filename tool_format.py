@@ -0,0 +1,179 @@
+"""
+Compact encodings of tool results, and the booking details shown to visitors.
+
+Tool results are read by Gemini on every later step of a turn, so they are
+encoded as compact JSON with the same keys whether or not anything was
+found. Times are grouped by day in the business timezone ("tz") and given
+as minutes after that day's midnight (540 = 09:00, 1440 = the end of the
+day), so a busy afternoon reads {"2026-10-19": [[780, 840], [900, 960]]}
+rather than a list of full ISO strings:
+
+- check_availability: {"tz", "busy": {day: [[start, end], ...]}}, merged
+  ranges only (no event titles);
+- find_free_slots: {"tz", "duration_minutes", "slots": {day: [[start, end], ...]}},
+  with [start, end, [calendar ids]] when several team calendars are set;
+- create_meeting: {"booked", "title", "date", "start", "end", "tz",
+  "attendees", "calendar_link", "meet_link", "meet"}, where "start"/"end"
+  are HH:MM on "date" and "meet" is "ready", "pending" (a background job
+  posts it to the chat) or "calendar" (see the event).
+
+Bookings are confirmed to the visitor with `render_booking`, a template
+filled from the create_meeting fields, instead of the model restating them.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from dateutil import tz as dateutil_tz
+
+from slots import Interval, merge_intervals
+from tenants import current
+
+BOOKED_LEAD = "OK. I have booked the meeting."
+# First line of the rendered details; conversation_context looks for it
+BOOKING_DETAILS = "Here are the details:"
+
+_MEET_LINES = {
+    "pending": (
+        "Being created; it will appear in this chat in a moment and is included "
+        "in the calendar invitation."
+    ),
+    "calendar": (
+        "The meeting link will be available in your Google Calendar. Please check "
+        "the calendar event for the video conferencing link."
+    ),
+}
+
+
+def _zone(timezone: Optional[str] = None) -> datetime.tzinfo:
+    return dateutil_tz.gettz(timezone or current().timezone) or datetime.timezone.utc
+
+
+def _dumps(value: Dict[str, Any]) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+# ------------- Day / minute encoding -------------
+
+
+def by_day(items: Iterable[Sequence[Any]], timezone: Optional[str] = None) -> Dict[str, List[List[Any]]]:
+    """
+    (start, end, *extra) epoch ranges as {day: [[start_minute, end_minute, *extra]]}
+    in local wall-clock minutes; ranges crossing midnight are split per day.
+    """
+    zone = _zone(timezone)
+    days: Dict[str, List[List[Any]]] = {}
+    for start, end, *extra in items:
+        local = datetime.datetime.fromtimestamp(start, zone)
+        while start < end:
+            day = local.date()
+            midnight = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(0), zone)
+            until = min(end, midnight.timestamp())
+            end_minute = (
+                1440 if until == midnight.timestamp()
+                else _minute(datetime.datetime.fromtimestamp(until, zone))
+            )
+            days.setdefault(day.isoformat(), []).append([_minute(local), end_minute, *extra])
+            start, local = until, midnight
+    return days
+
+
+def _minute(dt: datetime.datetime) -> int:
+    return dt.hour * 60 + dt.minute
+
+
+def from_day(day: str, minute: int, timezone: Optional[str] = None) -> datetime.datetime:
+    """Inverse of by_day for one time: local datetime `minute` minutes into `day`."""
+    date = datetime.date.fromisoformat(day) + datetime.timedelta(days=minute // 1440)
+    return datetime.datetime.combine(date, datetime.time(minute % 1440 // 60, minute % 60), _zone(timezone))
+
+
+def encode_busy(busy: Iterable[Interval]) -> str:
+    """check_availability's result for busy (and held) epoch intervals."""
+    return _dumps({"tz": current().timezone, "busy": by_day(merge_intervals(busy))})
+
+
+def encode_slots(slots: Iterable[Sequence[Any]], duration_minutes: int) -> str:
+    """find_free_slots' result for (start, end[, calendar ids]) epoch slots."""
+    return _dumps(
+        {"tz": current().timezone, "duration_minutes": duration_minutes, "slots": by_day(slots)}
+    )
+
+
+def slot_times(result: Dict[str, Any]) -> List[List[str]]:
+    """[start, end] ISO 8601 pairs of a decoded find_free_slots result, earliest first."""
+    timezone = result["tz"]
+    return [
+        [from_day(day, slot[0], timezone).isoformat(), from_day(day, slot[1], timezone).isoformat()]
+        for day, day_slots in sorted(result["slots"].items())
+        for slot in day_slots
+    ]
+
+
+# ------------- Bookings -------------
+
+
+def encode_booking(
+    event: Dict[str, Any],
+    title: str,
+    start: float,
+    end: float,
+    attendees: List[str],
+    meet_link: str,
+    meet_pending: bool,
+) -> str:
+    """create_meeting's result for a booked `event` (epoch start/end)."""
+    zone = _zone()
+    start_dt = datetime.datetime.fromtimestamp(start, zone)
+    end_dt = datetime.datetime.fromtimestamp(end, zone)
+    return _dumps(
+        {
+            "booked": True,
+            "title": title,
+            "date": start_dt.date().isoformat(),
+            "start": start_dt.strftime("%H:%M"),
+            "end": end_dt.strftime("%H:%M"),
+            "tz": current().timezone,
+            "attendees": attendees,
+            "calendar_link": event.get("htmlLink") or "",
+            "meet_link": meet_link,
+            "meet": "ready" if meet_link else "pending" if meet_pending else "calendar",
+        }
+    )
+
+
+def parse_booking(result: str) -> Optional[Dict[str, Any]]:
+    """The fields of a create_meeting result, or None if it did not book."""
+    if not result.startswith("{"):
+        return None
+    try:
+        booking = json.loads(result)
+    except ValueError:
+        return None
+    return booking if isinstance(booking, dict) and booking.get("booked") else None
+
+
+def render_booking(booking: Dict[str, Any], lead: bool = True) -> str:
+    """
+    Markdown confirmation of a booking (parse_booking fields); without
+    `lead`, only the details, to follow a reply written by the model.
+    """
+    parts = [f"{BOOKED_LEAD}\n\n"] if lead else []
+    parts.append(f"{BOOKING_DETAILS}\n")
+    parts.append(f"- **Title**: {booking['title']}\n")
+    start = datetime.datetime.strptime(f"{booking['date']} {booking['start']}", "%Y-%m-%d %H:%M")
+    end = datetime.datetime.strptime(booking["end"], "%H:%M")
+    parts.append(f"- **Date**: {start.strftime('%B %d, %Y')}\n")
+    parts.append(
+        f"- **Time**: {start.strftime('%I:%M %p')} - {end.strftime('%I:%M %p')} ({booking['tz']})\n"
+    )
+    if booking["attendees"]:
+        parts.append(f"- **Attendees**: {', '.join(booking['attendees'])}\n")
+    link = booking["calendar_link"]
+    parts.append(f"- **Calendar Link**: [{link}]({link})\n")
+    meet = booking["meet_link"]
+    parts.append(f"- **Google Meet Link**: {f'[{meet}]({meet})' if meet else _MEET_LINES[booking['meet']]}\n")
+    return "".join(parts)